@@ -1,4 +1,53 @@
 #include <OneWire.h>
+#include <SPI.h>
+#include <SD.h>
+
+// Binary log on the SD card (see UI/binary_log.py for the host side).
+// One 16-byte record per pressure reading instead of ~200 bytes of text.
+#define LOG_BINARY 1
+#define SD_CS_PIN 8
+#define LOG_FILE "LOG.BIN"
+#define LOG_FLUSH_EVERY 10   // records between flushes (a flush costs a block write)
+
+#define FLAG_PRESSURE_OK 0x01
+#define FLAG_TEMP_VALID 0x02
+#define FLAG_SESSION 0x80    // a SessionMarker, not a reading
+
+// 16-byte file header, then back-to-back records, all little-endian.
+// The file is appended to across power cycles; every boot first writes a
+// SessionMarker, since millis() starts again at 0.
+struct LogHeader {
+  char magic[4];        // "LWQ1"
+  uint16_t version;     // 2 (1: no session markers)
+  uint16_t recordSize;  // sizeof(LogRecord) = 16
+  uint32_t startUnix;   // 0 = unknown (no RTC), set the start time on the host
+  uint32_t reserved;
+} __attribute__((packed));
+
+struct LogRecord {
+  uint32_t millis;      // millis() at the pressure reading
+  uint16_t pressureADC; // median pressure ADC (12 bit)
+  uint16_t tdsADC;      // median TDS ADC
+  uint16_t doADC;       // DO ADC
+  uint16_t phADCSum;    // sum of the 6 middle pH readings
+  int16_t tempRaw;      // DS18B20 scratchpad, 1/16 degC
+  uint8_t flags;        // FLAG_*
+  uint8_t reserved;
+} __attribute__((packed));
+
+// same size as a LogRecord, flags at the same offset
+struct SessionMarker {
+  uint32_t millis;      // millis() at boot
+  uint32_t startUnix;   // 0 = unknown (no RTC), set the session's start time on the host
+  uint8_t reserved[6];
+  uint8_t flags;        // FLAG_SESSION
+  uint8_t reserved2;
+} __attribute__((packed));
+
+File logFile;
+LogRecord rec;
+bool newRecord = false;
+uint16_t recordsSinceFlush = 0;
 // Pressure sensor
 const float OffSet = 0.491 ; // from calibration
 float P;
@@ -81,6 +130,23 @@ void setup() {
   pinMode(PH_PIN, INPUT);     // Set sensor pins as input
   pinMode(TdsSensorPin, INPUT);
   pinMode(DO_PIN, INPUT);
+
+#if LOG_BINARY
+  if (SD.begin(SD_CS_PIN)) {
+    logFile = SD.open(LOG_FILE, FILE_WRITE);
+    if (logFile && logFile.size() == 0) {
+      LogHeader header = {{'L', 'W', 'Q', '1'}, 2, sizeof(LogRecord), 0, 0};
+      logFile.write((const uint8_t *)&header, sizeof(header));
+    }
+    if (logFile) {
+      // a new session: the readings after this count millis() from this boot
+      SessionMarker marker = {millis(), 0, {0}, FLAG_SESSION, 0};
+      logFile.write((const uint8_t *)&marker, sizeof(marker));
+      logFile.flush();
+    }
+  }
+  if (!logFile) Serial.println("SD log not available, serial output only");
+#endif
 }
 
 void loop() {
@@ -92,6 +158,8 @@ void loop() {
     
     pressureVoltage = readPressureVoltage();
     P = (pressureVoltage - OffSet) * 400;
+    rec.millis = nowMillis;
+    newRecord = true;
 
     Serial.print("Pressure voltage: ");
     Serial.print(pressureVoltage, 3);
@@ -123,7 +191,10 @@ void loop() {
   if (pressureOK && nowMillis - lastTemp >= TEMP_INTERVAL) {
     lastTemp = nowMillis;
     float t = readTemperature();
-    if (t > -100) tempC = t;  // ignore invalid readings
+    if (t > -100) {
+      tempC = t;  // ignore invalid readings
+      rec.flags |= FLAG_TEMP_VALID;
+    }
 
     Serial.print("Temperature (C): ");
     Serial.println(tempC);
@@ -144,7 +215,8 @@ void loop() {
     }
 
     // Median filter to reduce noise
-    averageVoltage = getMedianNum(tdsBufferTemp, TDS_SCOUNT) * VREF / 4096.0;
+    rec.tdsADC = getMedianNum(tdsBufferTemp, TDS_SCOUNT);
+    averageVoltage = rec.tdsADC * VREF / 4096.0;
 
     // Temperature compensation
     float compensationCoefficient = 1.0 + 0.02 * (tempC - 25.0);
@@ -171,6 +243,20 @@ void loop() {
     lastDO = nowMillis;
     readDOsensor(tempC);
   }
+
+#if LOG_BINARY
+  // one record per pressure reading, written after the other sensors
+  if (newRecord && logFile) {
+    if (pressureOK) rec.flags |= FLAG_PRESSURE_OK;
+    logFile.write((const uint8_t *)&rec, sizeof(rec));
+    if (++recordsSinceFlush >= LOG_FLUSH_EVERY) {
+      logFile.flush();
+      recordsSinceFlush = 0;
+    }
+  }
+#endif
+  newRecord = false;
+  rec.flags = 0;
 }
 
 // Pressure function
@@ -184,6 +270,7 @@ float readPressureVoltage() {
   }
 
   int medianADC = getMedianNum(pressureBufferTemp, Pressure_samples);
+  rec.pressureADC = medianADC;
   return medianADC * VREF / 4096.0;
 }
 
@@ -219,6 +306,7 @@ float readTemperature() {
 
   byte MSB = data[1];
   byte LSB = data[0];
+  rec.tempRaw = (int16_t)((MSB << 8) | LSB);
   float tempRead = ((MSB << 8) | LSB);
   float TemperatureSum = tempRead / 16.0;
 
@@ -265,6 +353,7 @@ void readPH(float tempC) {
 
   long avg = 0;
   for (int i = 2; i <= 7; i++) avg += phBuffer[i];
+  rec.phADCSum = avg;
 
   float voltage = avg * VREF / 4096.0 / 6.0;
   float pH_raw = 3.5 * voltage + phOffset;
@@ -280,6 +369,7 @@ void readPH(float tempC) {
 // Reads ADC, converts to millivolts, calculates DO using look-up table 
 void readDOsensor(float tempC) {
     uint16_t raw = analogRead(DO_PIN);
+    rec.doADC = raw;
     uint32_t mv = (uint32_t)VREF * raw / ADC_RES;
 
     float DO_corrected = computeDO(mv, (uint8_t)tempC);
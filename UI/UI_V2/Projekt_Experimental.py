@@ -3,15 +3,26 @@ import numpy as np
 import streamlit as st
 import plotly.express as px
 from streamlit_option_menu import option_menu
-import sklearn.preprocessing as skp
 from sklearn.gaussian_process import GaussianProcessRegressor
 from sklearn.gaussian_process.kernels import WhiteKernel,RBF,Matern, RationalQuadratic
-import gpytorch 
 import torch 
 from sklearn.model_selection import KFold
 from sklearn.metrics import mean_squared_error
 import numpy as np
 from sklearn.model_selection import train_test_split
+import os
+import time
+import sys
+
+# shared helpers live one folder up, next to Projekt.py
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import app_cache
+import exports
+import gp_model
+import model_registry
+import profiling
+import session_store
+import table_view
 
 
 # --------------------------
@@ -132,6 +143,8 @@ with st.sidebar:
             "nav-link-selected": {"background-color": "#4dabf7", "color": "white"},
         }
     )
+# optional per-stage timings of this session (off unless switched on)
+app_cache.profiling_panel(selected)
 # app title
 st.title("💧 Lake Water 3D Quality Dashboard")
 
@@ -146,65 +159,102 @@ if selected == "Home":
 
 # upload page (bring your csv here)
 elif selected == "Upload":
-    st.subheader("Upload your lake CSV dataset")
-    uploaded = st.file_uploader("", type="csv")
-
+    st.subheader("Upload your lake CSV or Parquet dataset")
+    # saved surveys live in a local catalog, so you dont have to re-upload them
+    source = st.radio("Data source:", ["Upload file", "Survey catalog"], horizontal=True)
+    uploaded = picked = None
+    append = False
+    if source == "Upload file":
+        # out in the field: re-upload the growing log (or just the new casts)
+        # and only the new rows get parsed, binned and indexed
+        append = st.checkbox(
+            "Append new rows to the current dataset",
+            disabled="data" not in st.session_state,
+            help="Reads only what was added since the last upload of the same file, "
+                 "rows newer than the last timestamp, or the whole file if it only holds new casts.",
+        )
+        # gzip/zstd compressed logger dumps are read without unpacking them first
+        uploaded = st.file_uploader("", type=["csv", "gz", "zst", "parquet"])
+    else:
+        picked = app_cache.catalog_picker("upload")
+
+    if uploaded is not None and append:
+        # already filtered, so nothing more to report as removed
+        ingest_info = dict(st.session_state["ingest_info"], removed=0)
+        # every upload is appended once, reruns just keep the result
+        if st.session_state.get("appended_upload") != uploaded.file_id:
+            try:
+                data, new_info, digest = app_cache.append_upload(
+                    uploaded, st.session_state["data"], st.session_state["data_digest"], parse_time=True)
+            except ValueError as e:
+                st.error(str(e))
+                st.stop()
+            st.session_state["data"] = data
+            st.session_state["data_digest"] = digest
+            st.session_state["appended_upload"] = uploaded.file_id
+            st.success(f"Appended {new_info['appended']:,} new rows ({len(data):,} in total).")
+            ingest_info["removed"] = new_info["removed"]
+        data = st.session_state["data"]
     # if a new file is added, use it
-    if uploaded is not None:
-        data = pd.read_csv(uploaded)
+    # (parsing, timestamp parsing, gps filtering and x/y projection are cached
+    # by file content, so reruns of this page don't re-read the csv)
+    elif uploaded is not None:
+        try:
+            data, ingest_info, digest = app_cache.load_upload(uploaded, parse_time=True)
+        except ValueError as e:
+            # quick check for the must-have columns
+            st.error(str(e))
+            st.stop()
+        # a new file isnt tied to any catalog lake until it's saved
+        if st.session_state.get("data_digest") != digest:
+            st.session_state["lake"] = None
+        st.session_state["data"] = data
+        st.session_state["data_digest"] = digest
+        st.session_state["ingest_info"] = ingest_info
+
+        with st.expander("💾 Save to survey catalog"):
+            lake_name = st.text_input("Lake name:", value=st.session_state.get("lake") or "")
+            if st.button("Save survey") and lake_name.strip():
+                if app_cache.save_survey(data, lake_name.strip(), digest, name=uploaded.name):
+                    st.success(f"Saved {len(data):,} points under '{lake_name.strip()}'.")
+                else:
+                    st.info("This file is already in the catalog.")
+                st.session_state["lake"] = lake_name.strip()
+    # or the chosen lake / months from the catalog
+    elif picked is not None:
+        lake, start, end = picked
+        data, ingest_info, digest = app_cache.load_slice(lake, start, end, parse_time=True)
         st.session_state["data"] = data
+        st.session_state["data_digest"] = digest
+        st.session_state["ingest_info"] = ingest_info
+        st.session_state["lake"] = lake
     # otherwise keep the last one so you dont lose work
     elif "data" in st.session_state:
         data = st.session_state["data"]
+        # already filtered, so nothing more to report as removed
+        ingest_info = dict(st.session_state["ingest_info"], removed=0)
     else:
         st.info("Upload a CSV file to begin...")
         st.stop()
 
-    # quick check for the must-have columns
-    required = {"latitude", "longitude", "depth"}
-    if not required.issubset(data.columns):
-        st.error(f"Your file must include: {required}")
-        st.stop()
-    
-    # check if timestamp column exists and parse it
-    if "timestamp" not in data.columns:
-        st.warning("⚠️ No 'timestamp' column found. For temporal predictions, add a 'timestamp' column to your CSV.")
+    # report on the timestamp column
+    if ingest_info["has_time"]:
+        unique_periods = data['month_year'].nunique()
+        has_month = True
+        st.success(f"✅ Temporal data detected: {unique_periods} unique month-year periods in dataset")
+        st.info(f"Date range: {data['timestamp'].min()} to {data['timestamp'].max()}")
+    elif ingest_info["time_error"] is not None:
+        st.error(f"Error parsing timestamp column: {ingest_info['time_error']}")
         st.info("Proceeding without temporal features...")
         has_month = False
     else:
-        try:
-            # parse timestamp and extract month and year
-            data['timestamp'] = pd.to_datetime(data['timestamp'])
-            data['month'] = data['timestamp'].dt.month
-            data['year'] = data['timestamp'].dt.year
-            
-            # create combined month_year identifier for grouping
-            data['month_year'] = data['year'].astype(str) + '-' + data['month'].astype(str).str.zfill(2)
-            
-            unique_periods = data['month_year'].nunique()
-            has_month = True
-            st.success(f"✅ Temporal data detected: {unique_periods} unique month-year periods in dataset")
-            st.info(f"Date range: {data['timestamp'].min()} to {data['timestamp'].max()}")
-        except Exception as e:
-            st.error(f"Error parsing timestamp column: {e}")
-            st.info("Proceeding without temporal features...")
-            has_month = False
-
-    # drop gps points with too few sats (less reliable)
-    if "num_sats" in data.columns:
-        before = len(data)
-        data = data[data["num_sats"] >= 4].reset_index(drop=True)
-        removed = before - len(data)
-        if removed > 0:
-            st.info(f"Removed {removed} unreliable points (num_sats < 4).")
-
-    # convert lat/lon to simple cartesian x/y for plotting
-    lat = np.deg2rad(data["latitude"])
-    lon = np.deg2rad(data["longitude"])
-    R = 6371000
-    data["x"] = R * np.cos(lat) * np.cos(lon)
-    data["y"] = R * np.cos(lat) * np.sin(lon)
-    st.session_state["data"]=data
+        st.warning("⚠️ No 'timestamp' column found. For temporal predictions, add a 'timestamp' column to your CSV.")
+        st.info("Proceeding without temporal features...")
+        has_month = False
+
+    if ingest_info["removed"] > 0:
+        st.info(f"Removed {ingest_info['removed']} unreliable points (num_sats < 4).")
+
     st.session_state["has_month"] = has_month
     # sidebar filters & display opts
     st.sidebar.header("Controls")
@@ -222,25 +272,49 @@ elif selected == "Upload":
     color_option = st.sidebar.selectbox(
         "Color 3D plot by:", options=numeric_cols + [None], index=len(numeric_cols)-1
     )
+
+    # parquet keeps the dtypes and is much smaller than csv
+    export_fmt = st.sidebar.radio(
+        "Download format:", options=list(exports.EXPORT_FORMATS), horizontal=True
+    )
     
-    # Month-year filter for 3D plot (if temporal data exists)
-    if has_month and data['month_year'].nunique() > 1:
+    # Month-year filter for 3D plot (if temporal data exists). The rows are
+    # kept in time order with per-period offsets (partitions.py), so each
+    # filter is a slice of the survey rather than a scan and a copy of it
+    plot_data = data
+    selected_period = None  # what is filtered, also keys the plot's LOD cache
+    partition = app_cache.period_partition_for(data, st.session_state["data_digest"]) if has_month else None
+    if partition is not None and len(partition.periods) > 1:
         st.sidebar.markdown("---")
         st.sidebar.markdown("**🗓️ Temporal Filter**")
-        available_periods = sorted(data['month_year'].unique())
+        available_periods = partition.periods
+        month_names = dict(zip(available_periods, pd.to_datetime(pd.Index(available_periods) + '-01').strftime('%B %Y')))
         
         show_all_periods = st.sidebar.checkbox("Show all periods", value=True)
         
         if not show_all_periods:
-            selected_period = st.sidebar.selectbox(
-                "Select period to display:",
-                options=available_periods,
-                format_func=lambda x: pd.to_datetime(x + '-01').strftime('%B %Y')
-            )
-        else:
-            selected_period = None
-    else:
-        selected_period = None
+            filter_by = st.sidebar.radio("Filter by:", ["Periods", "Date range"], horizontal=True)
+            if filter_by == "Periods" or partition.times is None:
+                picked = st.sidebar.multiselect(
+                    "Select periods to display:",
+                    options=available_periods,
+                    default=available_periods[:1],
+                    format_func=month_names.get
+                )
+                with profiling.stage("period filter", periods=len(picked)):
+                    plot_data = partition.select(picked)
+                selected_period = ("periods",) + tuple(picked)
+                filter_label = ", ".join(month_names[p] for p in picked) or "no period"
+            else:
+                times = partition.frame["timestamp"]
+                first, last = times.iloc[partition.offsets[0]].date(), times.iloc[-1].date()
+                dates = st.sidebar.date_input("Dates:", value=(first, last), min_value=first, max_value=last)
+                # a single date while the second one is being picked
+                start, end = (dates[0], dates[-1]) if len(dates) else (first, last)
+                with profiling.stage("period filter"):
+                    plot_data = partition.between(start, pd.Timestamp(end) + pd.Timedelta(days=1))
+                selected_period = ("dates", start, end)
+                filter_label = f"{start:%d %b %Y} - {end:%d %b %Y}"
 
     # main tabs
     tab1, tab2, tab3 = st.tabs(["3D Plot", "Statistics", "Raw Data"])
@@ -249,16 +323,17 @@ elif selected == "Upload":
     with tab1:
         st.markdown("### 3D Measurement Positions")
         
-        # Filter data by period if selected
         if selected_period is not None:
-            plot_data = data[data['month_year'] == selected_period].copy()
-            period_label = pd.to_datetime(selected_period + '-01').strftime('%B %Y')
-            st.info(f"🗓️ Showing data for **{period_label}** - {len(plot_data)} measurements")
-        else:
-            plot_data = data.copy()
-            if has_month and data['month_year'].nunique() > 1:
-                st.info(f"📊 Showing all periods ({data['month_year'].nunique()} periods, {len(plot_data)} total measurements)")
-
+            st.info(f"🗓️ Showing data for **{filter_label}** - {len(plot_data)} measurements")
+        elif partition is not None and len(partition.periods) > 1:
+            st.info(f"📊 Showing all periods ({len(partition.periods)} periods, {len(plot_data)} total measurements)")
+
+        # large surveys are thinned out on a voxel grid before they go to the browser
+        plot_data = app_cache.lod_view(
+            plot_data, "upload_lod", digest=f"{st.session_state['data_digest']}:{selected_period}",
+            value=color_option
+        )
+        timed = profiling.begin("3D figure", points=len(plot_data))
         fig = px.scatter_3d(
             plot_data,
             x="x",
@@ -280,6 +355,7 @@ elif selected == "Upload":
             )
         )
         st.plotly_chart(fig, use_container_width=True)
+        profiling.end(timed)
 
     # stats per depth
     with tab2:
@@ -296,26 +372,25 @@ elif selected == "Upload":
             
             # === DEPTH STATISTICS ===
             with stats_tab1:
-                depth_min = data["depth"].min()
-                depth_max = data["depth"].max()
-                bins = np.arange(depth_min, depth_max + bin_width, bin_width)
-                labels = [
-                    f"{round(b, 1)}-{round(b+bin_width, 1)} m" for b in bins[:-1]]
-                data["depth_bin"] = pd.cut(
-                    data["depth"], bins=bins, labels=labels, include_lowest=True)
-
-                stats = data.groupby("depth_bin")[selected_features].agg(
-                    ["mean", "std", "min", "median", "max", "count"])
-                
+                # binned once per dataset on a 0.1 m grid (appends update it),
+                # so changing the bin width doesn't re-cut the whole survey; the table
+                # per bin width and the overall summary are cached, and the cards,
+                # quick stats and summary download below all read from them
+                stats = app_cache.depth_table_for(
+                    data, st.session_state["data_digest"], numeric_cols, bin_width, selected_features
+                )
+                overall = app_cache.overall_stats_for(
+                    data, st.session_state["data_digest"], numeric_cols, selected_features
+                )
                 # little summary cards up top, just for at-a-glance
                 st.markdown("### 📊 Overall Dataset Summary")
                 metric_cols = st.columns(len(selected_features))
                 for idx, feature in enumerate(selected_features):
                     with metric_cols[idx]:
-                        mean_val = data[feature].mean()
-                        std_val = data[feature].std()
-                        min_val = data[feature].min()
-                        max_val = data[feature].max()
+                        mean_val = overall.at[feature, "mean"]
+                        std_val = overall.at[feature, "std"]
+                        min_val = overall.at[feature, "min"]
+                        max_val = overall.at[feature, "max"]
                         
                         st.markdown(f"""
                         <div style='background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); 
@@ -352,30 +427,7 @@ elif selected == "Upload":
                     with col1:
                         # styled table (blue tones only so its readable)
                         st.dataframe(
-                            feature_stats.style
-                            .background_gradient(cmap="Blues", subset=["Mean"], low=0.1, high=0.8)
-                            .background_gradient(cmap="Blues", subset=["Std Dev"], low=0.1, high=0.6)
-                            .format(precision=2, na_rep="-")
-                            .set_properties(**{
-                                'text-align': 'center',
-                                'font-size': '10pt',
-                                'border': '1px solid #ddd',
-                                'color': '#000000'
-                            })
-                            .set_table_styles([
-                                {'selector': 'th', 
-                                 'props': [('background-color', '#4dabf7'), 
-                                          ('color', 'white'), 
-                                          ('font-weight', 'bold'),
-                                          ('text-align', 'center'),
-                                          ('padding', '10px'),
-                                          ('font-size', '11pt')]},
-                                {'selector': 'td', 
-                                 'props': [('padding', '8px 12px'),
-                                          ('color', '#000000')]},
-                                {'selector': 'tr:hover', 
-                                 'props': [('background-color', '#e3f2fd')]},
-                            ]),
+                            table_view.style_stats(feature_stats),
                             use_container_width=True,
                             height=350
                         )
@@ -385,10 +437,10 @@ elif selected == "Upload":
                         st.markdown("**Quick Statistics:**")
                         st.markdown(f"""
                         - **Total Measurements:** {int(stats[(feature, 'count')].sum())}
-                        - **Overall Mean:** {data[feature].mean():.2f}
-                        - **Overall Std:** {data[feature].std():.2f}
-                        - **Overall Range:** {data[feature].min():.2f} - {data[feature].max():.2f}
-                        - **Coefficient of Variation:** {(data[feature].std() / data[feature].mean() * 100):.1f}%
+                        - **Overall Mean:** {overall.at[feature, "mean"]:.2f}
+                        - **Overall Std:** {overall.at[feature, "std"]:.2f}
+                        - **Overall Range:** {overall.at[feature, "min"]:.2f} - {overall.at[feature, "max"]:.2f}
+                        - **Coefficient of Variation:** {(overall.at[feature, "std"] / overall.at[feature, "mean"] * 100):.1f}%
                         """)
                         
                         # mini depth profile (just a quick look)
@@ -412,9 +464,12 @@ elif selected == "Upload":
                 with stats_tab2:
                     st.markdown("### 🗓️ Temporal Statistics (by Month-Year)")
                     
-                    # Group by month_year
-                    temporal_stats = data.groupby("month_year")[selected_features].agg(
-                        ["mean", "std", "min", "median", "max", "count"])
+                    # depth x period cube, summarised once per dataset; the
+                    # tables and the heatmap below are merges of it
+                    periods = app_cache.depth_period_stats_for(
+                        data, st.session_state["data_digest"], numeric_cols
+                    )
+                    temporal_stats = periods.period_table(selected_features)
                     
                     # expandable blocks per measurement
                     for feature in selected_features:
@@ -422,7 +477,7 @@ elif selected == "Upload":
                             
                             # prep data with month-year formatting
                             feature_temporal_stats = pd.DataFrame({
-                                "Period": [pd.to_datetime(my + '-01').strftime('%b %Y') for my in temporal_stats.index],
+                                "Period": temporal_stats.index,
                                 "Mean": temporal_stats[(feature, "mean")].round(2),
                                 "Std Dev": temporal_stats[(feature, "std")].round(2),
                                 "Min": temporal_stats[(feature, "min")].round(2),
@@ -435,30 +490,7 @@ elif selected == "Upload":
                             
                             with col1:
                                 st.dataframe(
-                                    feature_temporal_stats.style
-                                    .background_gradient(cmap="Blues", subset=["Mean"], low=0.1, high=0.8)
-                                    .background_gradient(cmap="Blues", subset=["Std Dev"], low=0.1, high=0.6)
-                                    .format(precision=2, na_rep="-")
-                                    .set_properties(**{
-                                        'text-align': 'center',
-                                        'font-size': '10pt',
-                                        'border': '1px solid #ddd',
-                                        'color': '#000000'
-                                    })
-                                    .set_table_styles([
-                                        {'selector': 'th', 
-                                         'props': [('background-color', '#4dabf7'), 
-                                                  ('color', 'white'), 
-                                                  ('font-weight', 'bold'),
-                                                  ('text-align', 'center'),
-                                                  ('padding', '10px'),
-                                                  ('font-size', '11pt')]},
-                                        {'selector': 'td', 
-                                         'props': [('padding', '8px 12px'),
-                                                  ('color', '#000000')]},
-                                        {'selector': 'tr:hover', 
-                                         'props': [('background-color', '#e3f2fd')]},
-                                    ]),
+                                    table_view.style_stats(feature_temporal_stats),
                                     use_container_width=True,
                                     height=250
                                 )
@@ -490,15 +522,12 @@ elif selected == "Upload":
                         index=selected_features.index('temperature') if 'temperature' in selected_features else 0
                     )
                     
-                    # Create pivot table for heatmap
-                    heatmap_data = data.groupby(['depth_bin', 'month_year'])[selected_heatmap_feature].mean().unstack(fill_value=np.nan)
-                    
-                    # Format column labels as "Mon YYYY"
-                    period_labels = [pd.to_datetime(my + '-01').strftime('%b %Y') for my in heatmap_data.columns]
+                    # depth bin x period means (same bins as the depth table)
+                    heatmap_data = periods.heatmap(selected_heatmap_feature, bin_width)
                     
                     fig_heatmap = px.imshow(
                         heatmap_data.values,
-                        x=period_labels,
+                        x=heatmap_data.columns,
                         y=heatmap_data.index,
                         color_continuous_scale='RdYlBu_r',
                         labels={'x': 'Period', 'y': 'Depth Range', 'color': selected_heatmap_feature},
@@ -518,27 +547,24 @@ elif selected == "Upload":
             st.markdown("---")
             col_dl1, col_dl2, col_dl3 = st.columns([1, 1, 2])
             with col_dl1:
-                st.download_button(
-                    "📥 Download Full Statistics",
-                    data=stats.to_csv().encode("utf-8"),
-                    file_name="depth_statistics.csv",
-                    mime="text/csv",
-                    use_container_width=True
+                # serialized only when asked for, not on every rerun
+                app_cache.lazy_download(
+                    "Full Statistics", stats,
+                    ("depth_stats", st.session_state["data_digest"], bin_width, tuple(selected_features)),
+                    "depth_statistics", export_fmt, key="dl_stats", index=True, use_container_width=True
                 )
             with col_dl2:
                 summary_df = pd.DataFrame({
                     "Measurement": selected_features,
-                    "Mean": [data[f].mean() for f in selected_features],
-                    "Std": [data[f].std() for f in selected_features],
-                    "Min": [data[f].min() for f in selected_features],
-                    "Max": [data[f].max() for f in selected_features]
+                    "Mean": overall["mean"].to_numpy(),
+                    "Std": overall["std"].to_numpy(),
+                    "Min": overall["min"].to_numpy(),
+                    "Max": overall["max"].to_numpy()
                 })
-                st.download_button(
-                    "📥 Download Summary",
-                    data=summary_df.to_csv(index=False).encode("utf-8"),
-                    file_name="summary_statistics.csv",
-                    mime="text/csv",
-                    use_container_width=True
+                app_cache.lazy_download(
+                    "Summary", summary_df,
+                    ("summary", st.session_state["data_digest"], tuple(selected_features)),
+                    "summary_statistics", export_fmt, key="dl_summary", use_container_width=True
                 )
         else:
             st.info("👈 Select at least one measurement from the sidebar to view statistics.")
@@ -570,52 +596,23 @@ elif selected == "Upload":
         )
         
         if selected_cols:
-            # styled data table (blue header, zebra stripes)
-            st.dataframe(
-                data[selected_cols].style
-                .format(precision=2, na_rep="-")
-                .set_properties(**{
-                    'text-align': 'center',
-                    'font-size': '10pt',
-                    'border': '1px solid #e0e0e0'
-                })
-                .set_table_styles([
-                    {'selector': 'th', 
-                     'props': [('background-color', '#4dabf7'), 
-                              ('color', 'white'), 
-                              ('font-weight', 'bold'),
-                              ('text-align', 'center'),
-                              ('padding', '12px'),
-                              ('font-size', '11pt')]},
-                    {'selector': 'td', 
-                     'props': [('padding', '10px')]},
-                    {'selector': 'tr:nth-child(even)', 
-                     'props': [('background-color', '#f8f9fa')]},
-                    {'selector': 'tr:hover', 
-                     'props': [('background-color', '#e3f2fd')]},
-                ]),
-                use_container_width=True,
-                height=500
-            )
+            # only the visible page is styled and sent to the browser
+            app_cache.raw_data_explorer(data, st.session_state["data_digest"], selected_cols)
             
             # download buttons
             st.markdown("---")
             col_dl1, col_dl2, col_dl3 = st.columns([1, 1, 2])
             with col_dl1:
-                st.download_button(
-                    "📥 Download All Data",
-                    data=data.to_csv(index=False).encode("utf-8"),
-                    file_name="lake_data_complete.csv",
-                    mime="text/csv",
-                    use_container_width=True
+                # serialized only when asked for, not on every rerun
+                app_cache.lazy_download(
+                    "All Data", data, ("data", st.session_state["data_digest"]),
+                    "lake_data_complete", export_fmt, key="dl_data", use_container_width=True
                 )
             with col_dl2:
-                st.download_button(
-                    "📥 Download Selected Columns",
-                    data=data[selected_cols].to_csv(index=False).encode("utf-8"),
-                    file_name="lake_data_selected.csv",
-                    mime="text/csv",
-                    use_container_width=True
+                app_cache.lazy_download(
+                    "Selected Columns", lambda: data[selected_cols],
+                    ("data", st.session_state["data_digest"], tuple(selected_cols)),
+                    "lake_data_selected", export_fmt, key="dl_selected", use_container_width=True
                 )
         else:
             st.info("👈 Select at least one column to display the data.")
@@ -624,6 +621,20 @@ elif selected == "Upload":
 
 # predict page (train & analyze)
 elif selected == "Predict":
+    # pick a lake / month range straight from the survey catalog
+    with st.sidebar.expander("🗂️ Survey catalog", expanded="data" not in st.session_state):
+        picked = app_cache.catalog_picker("predict")
+        if picked is not None and st.button("Load from catalog"):
+            lake, start, end = picked
+            data, ingest_info, digest = app_cache.load_slice(lake, start, end, parse_time=True)
+            st.session_state["data"] = data
+            st.session_state["data_digest"] = digest
+            st.session_state["ingest_info"] = ingest_info
+            st.session_state["has_month"] = ingest_info["has_time"]
+            st.session_state["lake"] = lake
+        if st.session_state.get("lake"):
+            st.caption(f"Current lake: {st.session_state['lake']}")
+
     # Guard: avoid KeyError when no data uploaded
     if "data" not in st.session_state or st.session_state["data"] is None:
         st.info("Please upload a dataset first on the Upload page.")
@@ -657,11 +668,9 @@ elif selected == "Predict":
     # -----------------------------------
     # Normalize input and output separately
     # -----------------------------------
-    scaler_x = skp.StandardScaler()
-    scaler_y = skp.StandardScaler()
-
-    X = scaler_x.fit_transform(data[input_cols])
-    Y = scaler_y.fit_transform(data[output_cols])
+    # float32 arrays built once per dataset, not on every rerun
+    arrays = app_cache.training_arrays_for(data, st.session_state["data_digest"], input_cols, output_cols)
+    scaler_x, scaler_y = arrays.scaler_x, arrays.scaler_y
 
 
     # Train & predict controls
@@ -680,6 +689,16 @@ elif selected == "Predict":
                 help="Number of iterations with no improvement before stopping training"
             )
             
+            eval_every = st.number_input(
+                "Validate Every",
+                min_value=1,
+                max_value=50,
+                value=1,
+                step=1,
+                help="Iterations (epochs for the sparse GP) between validation RMSE checks. "
+                     "Higher trains faster; 1 stops exactly when patience runs out"
+            )
+
             validation_split = st.slider(
                 "Validation Split Ratio",
                 min_value=0.1,
@@ -689,163 +708,211 @@ elif selected == "Predict":
                 help="Fraction of data to use for validation (0.2 = 80/20 split)"
             )
             
-            rank_param = st.number_input(
-                "Multitask Kernel Rank",
-                min_value=1,
-                max_value=5,
-                value=1,
-                step=1,
-                help="Higher rank captures more complex task correlations"
+            # the exact GP is cubic in the number of rows, large surveys default to the sparse one
+            # (KISS-GP interpolates on an x/y/depth grid, so not with month/year inputs)
+            model_type = st.radio(
+                "Model",
+                ["Exact GP", "Sparse variational GP"]
+                + (["KISS-GP"] if len(input_cols) <= gp_model.SKI_MAX_DIMS else []),
+                index=int(len(arrays.X) > gp_model.EXACT_MAX_ROWS),
+                key="gp_mode",
+                help="The sparse variational GP trains on minibatches against a few hundred inducing "
+                     "points and handles surveys of 100k+ rows. KISS-GP keeps exact inference on a "
+                     "kernel interpolated from a grid over the lake, one GP per measurement. "
+                     "The exact GP is best for small surveys."
+            )
+            variational = model_type == "Sparse variational GP"
+            ski = model_type == "KISS-GP"
+
+            if variational:
+                num_inducing = st.number_input(
+                    "Inducing Points",
+                    min_value=16,
+                    max_value=2048,
+                    value=gp_model.NUM_INDUCING,
+                    step=16,
+                    help="More inducing points give a more detailed model, each epoch costs more"
+                )
+                minibatch = st.number_input(
+                    "Minibatch Size",
+                    min_value=64,
+                    max_value=8192,
+                    value=gp_model.MINIBATCH,
+                    step=64,
+                    help="Rows per optimizer step"
+                )
+                num_latents = st.number_input(
+                    "Latent GPs",
+                    min_value=1,
+                    max_value=len(output_cols),
+                    value=len(output_cols),
+                    step=1,
+                    help="Independent GPs mixed into the measurements, fewer is faster"
+                )
+            else:
+                if ski:
+                    grid_size = st.number_input(
+                        "Grid Points per Axis",
+                        min_value=8,
+                        max_value=128,
+                        value=gp_model.SKI_GRID,
+                        step=4,
+                        help="Resolution of the interpolation grid over x, y and depth; "
+                             "finer follows small features, each iteration costs more"
+                    )
+                    # one GP per measurement, no task correlations to rank
+                    rank_param = 1
+                else:
+                    rank_param = st.number_input(
+                        "Multitask Kernel Rank",
+                        min_value=1,
+                        max_value=5,
+                        value=1,
+                        step=1,
+                        help="Higher rank captures more complex task correlations"
+                    )
+                optimizer_name = st.radio(
+                    "Optimizer",
+                    ["Adam", "L-BFGS"],
+                    horizontal=True,
+                    key="gp_optimizer",
+                    help="L-BFGS usually converges in 20-50 iterations, Adam needs hundreds"
+                )
+            reuse_stored = st.checkbox(
+                "Reuse stored model",
+                value=True,
+                key="gp_reuse",
+                help="Load the model stored for this dataset and these settings instead of training it again"
             )
 
-    if st.button("Train GP & Predict on Grid"):
-        # Use full dataset for training (no subsampling)
-        X_train_np = X
-        Y_train_np = Y
-
-        # Inform user training on full dataset may be slow, but proceed
-        if len(X_train_np) > 2000:
-            st.info(
-                "Training on the full dataset may be slow. Please be patient..."
+            # start from an earlier model's hyperparameters and only fine-tune them
+            gp_kind = "variational" if variational else "ski" if ski else "exact"
+            warm_models = {m.model_id: m for m in model_registry.list_models()[:20]
+                           if m.fits(input_cols, output_cols, gp_kind)}
+            warm_labels = {"off": "Off", "lake": "Latest model of this lake"}
+            warm_labels.update((model_id, m.label()) for model_id, m in warm_models.items())
+            if not st.session_state.get("lake"):
+                del warm_labels["lake"]
+            warm_choice = st.selectbox(
+                "Warm Start",
+                list(warm_labels),
+                format_func=warm_labels.get,
+                key="gp_warm_start",
+                help="Start training from a stored model (e.g. last week's survey) instead of default "
+                     "hyperparameters; repeat surveys then converge in far fewer iterations"
             )
 
-        X_train = torch.tensor(X_train_np, dtype=torch.float32)
-        Y_train = torch.tensor(Y_train_np, dtype=torch.float32)
+    # a model trained on this dataset with these settings is loaded from the registry, not retrained
+    if variational:
+        gp_settings = {"mode": "variational", "num_inducing": int(num_inducing), "minibatch": int(minibatch),
+                       "num_latents": int(num_latents)}
+    else:
+        gp_settings = {"mode": gp_kind, "optimizer": optimizer_name}
+        if ski:
+            gp_settings["grid_size"] = int(grid_size)
+        else:
+            gp_settings["rank"] = int(rank_param)
+    gp_settings.update(validation_split=round(float(validation_split), 4),
+                       patience=int(early_stopping_patience), eval_every=int(eval_every))
+    stored = model_registry.find(st.session_state["data_digest"], input_cols, output_cols, gp_settings)
+    if warm_choice == "lake":
+        warm_from = model_registry.latest(st.session_state["lake"], input_cols, output_cols, gp_kind)
+    else:
+        warm_from = warm_models.get(warm_choice)
+    if stored is not None and reuse_stored:
+        st.caption(
+            f"💾 A model with these settings was trained on this dataset on "
+            f"{time.strftime('%Y-%m-%d %H:%M', time.localtime(stored.created_at))}; it is loaded instead of training."
+        )
 
-        num_tasks = Y_train.shape[1]
+    if st.button("Train GP & Predict on Grid"):
+        # tensors share memory with the cached arrays
+        X_train, Y_train = arrays.tensors()
 
-        # Stratified split based on depth bins (configurable split)
-        # Create depth bins for stratification
-        depth_values = X_train_np[:, 2]  # depth is 3rd column
-        num_bins = 10
-        depth_bins = np.digitize(depth_values, bins=np.linspace(depth_values.min(), depth_values.max(), num_bins))
-        
-        # Manually stratify by depth bins
-        np.random.seed(42)
-        train_indices_list = []
-        val_indices_list = []
-        
-        train_ratio = 1 - validation_split
-        
-        for bin_idx in np.unique(depth_bins):
-            bin_mask = depth_bins == bin_idx
-            bin_indices = np.where(bin_mask)[0]
-            np.random.shuffle(bin_indices)
-            
-            split_point = int(train_ratio * len(bin_indices))
-            train_indices_list.extend(bin_indices[:split_point])
-            val_indices_list.extend(bin_indices[split_point:])
-        
-        train_indices = torch.tensor(train_indices_list, dtype=torch.long)
-        val_indices = torch.tensor(val_indices_list, dtype=torch.long)
-        
-        X_train_split = X_train[train_indices]
-        X_val_split = X_train[val_indices]
-        Y_train_split = Y_train[train_indices]
-        Y_val_split = Y_train[val_indices]
-
-        # Define model and  likelihood (Multitask) — RBF kernel
-        likelihood = gpytorch.likelihoods.MultitaskGaussianLikelihood(num_tasks=num_tasks)
-        class MultitaskExactGP(gpytorch.models.ExactGP):
-            def __init__(self, train_x, train_y, likelihood, num_tasks, rank):
-                super().__init__(train_x, train_y, likelihood)
-                self.mean_module = gpytorch.means.MultitaskMean(gpytorch.means.ConstantMean(), num_tasks=num_tasks)
-                # RBF kernel with ARD
-                base_kernel = gpytorch.kernels.ScaleKernel(
-                    gpytorch.kernels.RBFKernel(ard_num_dims=train_x.shape[1])
+        if stored is not None and reuse_stored:
+            model_full, likelihood = model_registry.load(stored, X_train, Y_train)
+            scaler_x, scaler_y = stored.scaler_x, stored.scaler_y
+            st.info("Loaded the stored model, training skipped.")
+        else:
+            # Use full dataset for training (no subsampling)
+            X_train_np = arrays.X
+            Y_train_np = arrays.Y
+
+            # Inform user training on full dataset may be slow, but proceed
+            if gp_kind == "exact" and len(X_train_np) > gp_model.EXACT_MAX_ROWS:
+                st.info(
+                    "Training on the full dataset may be slow. Please be patient..."
                 )
-                self.covar_module = gpytorch.kernels.MultitaskKernel(base_kernel, num_tasks=num_tasks, rank=rank)
-
-            def forward(self, x):
-                mean_x = self.mean_module(x)
-                covar_x = self.covar_module(x)
-                return gpytorch.distributions.MultitaskMultivariateNormal(mean_x, covar_x)
-
-        model = MultitaskExactGP(X_train_split, Y_train_split, likelihood, num_tasks=num_tasks, rank=rank_param)
-
-        model.train()
-        likelihood.train()
-
-        optimizer = torch.optim.Adam(model.parameters(), lr=0.1)
-        mll = gpytorch.mlls.ExactMarginalLogLikelihood(likelihood, model)
-
-        iters = 500
-        progress = st.progress(0)
-        last_loss = None
-        best_rmse = float("inf")
-        no_improve = 0
-        patience = early_stopping_patience # Early stopping patience from user settings
-
-        # Track RMSE per task over iterations
-        rmse_history = {col: [] for col in output_cols}
-        rmse_history1 = {col: [] for col in output_cols}
-        iteration_nums = []
-
-        # get per-task std (original data) from scaler_y
-        task_std = np.maximum(np.array(scaler_y.scale_), 1e-12)
-
-        for i in range(iters):
-            model.train()
-            optimizer.zero_grad()
-            output = model(X_train_split)
-            loss = -mll(output, Y_train_split)
-            loss.backward()
-            optimizer.step()
-
-            # Evaluate on validation set
-            model.eval()
-            likelihood.eval()
-            with torch.no_grad(), gpytorch.settings.fast_pred_var():
-                pred_dist1 = likelihood(model(X_train_split))
-                pred_mean1 = pred_dist1.mean.detach().cpu().numpy()
-                pred_dist = likelihood(model(X_val_split))
-                pred_mean = pred_dist.mean.detach().cpu().numpy()
-            y_train = Y_train_split.detach().cpu().numpy()
-            y_val = Y_val_split.detach().cpu().numpy()
-
-            # RMSE per task (currently in scaled units)
-            rmse_per_task_scaled = np.sqrt(np.mean((pred_mean - y_val) ** 2, axis=0))
-            rmse_per_task_scaled1 = np.sqrt(np.mean((pred_mean1 - y_train) ** 2, axis=0))
-            # Convert to original units by multiplying by each task's std
-            rmse_per_task = rmse_per_task_scaled * task_std
-            rmse_per_task1 = rmse_per_task_scaled1 * task_std
-            # Store RMSE history for each task (original units)
-            for j, col in enumerate(output_cols):
-                rmse_history[col].append(rmse_per_task[j])
-                rmse_history1[col].append(rmse_per_task1[j])
-            iteration_nums.append(i + 1)
-
-            val_rmse = float(np.sqrt(np.mean((pred_mean - y_val) ** 2))) * float(np.mean(task_std))  # overall approx in original units
-            # Early stopping
-            if val_rmse < best_rmse:
-                best_rmse = val_rmse
-                no_improve = 0
-            else:
-                no_improve += 1
-
-            if no_improve >= patience:
-                st.info(f"Early stopping at iteration {i+1}")
-                break
-
-            if i % max(1, iters // 100) == 0:
-                progress.progress(int((i + 1) / iters * 100))
 
-            last_loss = loss.item()
-        progress.progress(100)
-
-        # Save optimized hyperparameters
-        optimized_state_dict = model.state_dict()
-        
-        
-        # Create model with full dataset (no optimization, just conditioning)
-        model_full = MultitaskExactGP(X_train, Y_train, likelihood, num_tasks=num_tasks, rank=rank_param)
-        
-        # Load the optimized hyperparameters (this freezes them)
-        model_full.load_state_dict(optimized_state_dict)
+            # Stratified split based on depth bins (configurable split)
+            train_indices, val_indices = gp_model.stratified_split(X_train_np[:, 2], validation_split)
+            train_indices = torch.from_numpy(train_indices)
+            val_indices = torch.from_numpy(val_indices)
         
-        # Set to eval mode - GP is now conditioned on full data with optimized hyperparameters
-        model_full.eval()
-        likelihood.eval()
+            X_train_split = X_train[train_indices]
+            X_val_split = X_train[val_indices]
+            Y_train_split = Y_train[train_indices]
+            Y_val_split = Y_train[val_indices]
+
+            # Multitask GP (RBF kernel with ARD), trained with early stopping
+            # on the validation RMSE (patience from user settings)
+            if variational:
+                iters = gp_model.MAX_EPOCHS
+            else:
+                optimizer = "lbfgs" if optimizer_name == "L-BFGS" else "adam"
+                iters = gp_model.LBFGS_ITERS if optimizer == "lbfgs" else gp_model.MAX_ITERS
+            init_state = model_registry.warm_state(warm_from) if warm_from is not None else None
+            grid_bounds = None
+            if ski:
+                # the interpolation grid has to cover the prediction grid too, which starts at the surface
+                index = app_cache.spatial_index_for(data, st.session_state["data_digest"])
+                grid_bounds = gp_model.ski_bounds(
+                    X_train, session_store.scale_points(scaler_x, index.grid_points(n_x=60, n_y=60, n_depth=25))
+                )
+            progress = st.progress(0)
+
+            def show_progress(i):
+                if i % max(1, iters // 100) == 0:
+                    progress.progress(int((i + 1) / iters * 100))
+
+            if variational:
+                # one iteration is an epoch of minibatches
+                model, likelihood, history = gp_model.train_variational(
+                    X_train_split, Y_train_split, X_val_split, Y_val_split, scaler_y.scale_,
+                    num_latents=num_latents, num_inducing=num_inducing, batch_size=minibatch,
+                    epochs=iters, patience=early_stopping_patience, eval_every=eval_every,
+                    on_iteration=show_progress, init_state=init_state
+                )
+            else:
+                model, likelihood, history = gp_model.train(
+                    X_train_split, Y_train_split, X_val_split, Y_val_split, scaler_y.scale_,
+                    rank=rank_param, iters=iters, patience=early_stopping_patience, eval_every=eval_every,
+                    optimizer=optimizer, on_iteration=show_progress, init_state=init_state,
+                    grid_size=grid_size if ski else None, grid_bounds=grid_bounds
+                )
+            unit = "epoch" if variational else "iteration"
+            if history["stopped_early"]:
+                st.info(f"Early stopping at {unit} {history['iterations']}")
+            elif history["converged"]:
+                st.info(f"Converged at {unit} {history['iterations']}")
+            # the model keeps the hyperparameters of its best validation RMSE
+            st.caption(
+                f"Best validation RMSE at {unit} {history['best_iteration']} after "
+                f"{history['best_seconds']:.1f} s (training took {history['seconds']:.1f} s)"
+            )
+            if history["warm_started"]:
+                st.caption(f"Warm-started from {warm_from.label()}")
+            progress.progress(100)
+
+            # GP conditioned on the full dataset with the optimized (frozen) hyperparameters
+            # (the sparse GP is used as trained, KISS-GP keeps its grid)
+            model_full = gp_model.condition(model, likelihood, X_train, Y_train)
+
+            model_registry.save(
+                model_full, likelihood, scaler_x, scaler_y, st.session_state["data_digest"], input_cols,
+                output_cols, gp_settings, len(X_train), lake=st.session_state.get("lake"),
+                val_rmse=history["best_val_rmse"]
+            )
         
         
         # Store the final model in session state
@@ -881,109 +948,40 @@ elif selected == "Predict":
                 period_label = pd.to_datetime(f"{predict_year}-{predict_month:02d}-01").strftime('%B %Y')
                 st.metric("Selected Period", period_label)
         
-        # Get bounds from original data
-        x_min, x_max = data['x'].min(), data['x'].max()
-        y_min, y_max = data['y'].min(), data['y'].max()
-        
-        # Create dense 2D grid for continuous appearance
-        n_grid_x = 60
-        n_grid_y = 60
-        
-        x_grid = np.linspace(x_min, x_max, n_grid_x)
-        y_grid = np.linspace(y_min, y_max, n_grid_y)
-        
-        # Filter XY points to stay within lake boundaries using alpha shape (more accurate than convex hull)
-        from scipy.spatial import Delaunay
-        
-        train_points_2d = data[['x', 'y']].values
-        
-        # Use alpha shape approximation via Delaunay triangulation
-        tri = Delaunay(train_points_2d)
-        
-        # Create meshgrid for XY
-        X_mesh_2d, Y_mesh_2d = np.meshgrid(x_grid, y_grid, indexing='ij')
-        xy_points = np.column_stack([X_mesh_2d.ravel(), Y_mesh_2d.ravel()])
-        
-        # Find points inside the triangulation (more accurate boundary)
-        inside_mask = tri.find_simplex(xy_points) >= 0
-        xy_inside = xy_points[inside_mask]
-        
-        # For each XY location, find max depth from training data using nearest neighbors
-        from scipy.spatial import KDTree
-        
-        # Build KDTree for efficient nearest neighbor search
-        tree = KDTree(train_points_2d)
-        
-        # Find k nearest neighbors for each grid point
-        k_neighbors = 5
-        distances, indices = tree.query(xy_inside, k=min(k_neighbors, len(train_points_2d)))
-        
-        # Compute max depth as weighted average of k nearest neighbors
-        max_depth_at_xy = np.zeros(len(xy_inside))
-        for i in range(len(xy_inside)):
-            if distances.ndim == 1:  # Single neighbor case
-                weights = np.array([1.0])
-                neighbor_depths = data['depth'].values[indices]
-            else:
-                # Inverse distance weighting
-                weights = 1.0 / (distances[i] + 1e-10)
-                weights /= weights.sum()
-                neighbor_depths = data['depth'].values[indices[i]]
-            
-            # Use maximum depth from neighbors (conservative approach)
-            max_depth_at_xy[i] = np.max(neighbor_depths)
-        
-        # Generate depth points for each XY location
-        n_depth_per_location = 25
-        X_test_list = []
-        
-        for i, (x_pt, y_pt) in enumerate(xy_inside):
-            max_depth = max_depth_at_xy[i]
-            # Generate depths from 0 to max_depth for this location
-            depths = np.linspace(0, max_depth * 0.95, n_depth_per_location)  # 95% to stay conservative
-            for d in depths:
-                if has_month:
-                    year_encoded = predict_year - 2020
-                    X_test_list.append([x_pt, y_pt, d, predict_month, year_encoded])
-                else:
-                    X_test_list.append([x_pt, y_pt, d])
-        
-        X_test_filtered = np.array(X_test_list)
+        # 60x60 grid over the lake outline, 25 depths per location down to 95%
+        # of the deepest of the 5 nearest measurements (conservative). The
+        # triangulation and KD-tree behind it are built once per dataset.
+        with profiling.stage("grid") as rec:
+            index = app_cache.spatial_index_for(data, st.session_state["data_digest"])
+            grid = index.grid_points(n_x=60, n_y=60, n_depth=25)
+            rec["points"] = len(grid)
+        X_test_filtered = grid
+        if has_month:
+            year_encoded = predict_year - 2020
+            X_test_filtered = np.column_stack([
+                grid,
+                np.full(len(X_test_filtered), predict_month),
+                np.full(len(X_test_filtered), year_encoded),
+            ])
         
         # Debug information
         st.info(f"Total predictions: {len(X_test_filtered)}")
         
         # Normalize test points
-        X_test_scaled = scaler_x.transform(X_test_filtered)
+        X_test_tensor = session_store.scale_points(scaler_x, X_test_filtered)
         
-        # Normalize test points
-        X_test_tensor = torch.tensor(X_test_scaled, dtype=torch.float32)
-        
-        # Make predictions
-        model_full.eval()
-        likelihood.eval()
-        with torch.no_grad(), gpytorch.settings.fast_pred_var():
-            pred_dist = likelihood(model_full(X_test_tensor))
-            pred_mean = pred_dist.mean.detach().cpu().numpy()
-            pred_var = pred_dist.variance.detach().cpu().numpy()
+        # Make predictions (in batches over the grid)
+        pred_mean, pred_var = gp_model.predict(model_full, likelihood, X_test_tensor)
         
         # Convert back to original scale
-        pred_mean_original = scaler_y.inverse_transform(pred_mean)
-        task_std = np.array(scaler_y.scale_)
-        pred_std_original = np.sqrt(pred_var) * task_std[np.newaxis, :]
+        pred_mean_original, pred_std_original = gp_model.to_original(scaler_y, pred_mean, pred_var)
         
         # Create prediction dataframe
         if has_month:
-            pred_df = pd.DataFrame(X_test_filtered, columns=['x', 'y', 'depth', 'month', 'year_encoded'])
-            # Convert year_encoded back to actual year
-            pred_df['year'] = pred_df['year_encoded'] + 2020
-            pred_df = pred_df.drop(columns=['year_encoded'])
+            pred_df = session_store.prediction_frame(grid, output_cols, pred_mean_original, pred_std_original,
+                                                     month=predict_month, year=predict_year)
         else:
-            pred_df = pd.DataFrame(X_test_filtered, columns=['x', 'y', 'depth'])
-        
-        for j, col in enumerate(output_cols):
-            pred_df[f'{col}_pred'] = pred_mean_original[:, j]
-            pred_df[f'{col}_std'] = pred_std_original[:, j]
+            pred_df = session_store.prediction_frame(grid, output_cols, pred_mean_original, pred_std_original)
         
         if has_month:
             period_label = pd.to_datetime(f"{predict_year}-{predict_month:02d}-01").strftime('%B %Y')
@@ -998,6 +996,22 @@ elif selected == "Predict":
             st.session_state["predict_month"] = predict_month
             st.session_state["predict_year"] = predict_year
 
+    # reopen an exported prediction set instead of retraining
+    with st.expander("📂 Open saved predictions"):
+        saved_preds = st.file_uploader(
+            "Prediction file (Parquet or CSV)", type=["parquet", "csv", "gz"], key="saved_predictions"
+        )
+        if saved_preds is not None:
+            if st.session_state.get("saved_predictions_id") != saved_preds.file_id:
+                pred_df = exports.read_predictions(saved_preds)
+                st.session_state["predictions"] = pred_df
+                st.session_state["output_cols"] = [c for c in exports.prediction_outputs(pred_df) if c in data.columns]
+                st.session_state["saved_predictions_id"] = saved_preds.file_id
+                if "month" in pred_df.columns and "year" in pred_df.columns:
+                    st.session_state["predict_month"] = int(pred_df["month"].iloc[0])
+                    st.session_state["predict_year"] = int(pred_df["year"].iloc[0])
+            st.success(f"Loaded {len(st.session_state['predictions'])} saved predictions.")
+
     # -----------------------------------
     # Tabbed Visualization (outside button block)
     # -----------------------------------
@@ -1009,15 +1023,16 @@ elif selected == "Predict":
         
         # Download button with period in filename if applicable
         if predict_month and predict_year:
-            filename = f"gp_predictions_{predict_year}_{predict_month:02d}.csv"
+            filename = f"gp_predictions_{predict_year}_{predict_month:02d}"
         else:
-            filename = "gp_predictions.csv"
-            
-        st.download_button(
-            "Download Predictions CSV",
-            data=pred_df.to_csv(index=False).encode("utf-8"),
-            file_name=filename,
-            mime="text/csv",
+            filename = "gp_predictions"
+
+        pred_fmt = st.radio(
+            "Predictions format:", options=list(exports.EXPORT_FORMATS), horizontal=True, key="pred_export_fmt"
+        )
+        app_cache.lazy_download(
+            "Predictions", pred_df, ("predictions", app_cache.frame_version(pred_df)),
+            filename, pred_fmt, key="dl_predictions"
         )
         
         st.markdown("### Prediction Results")
@@ -1060,74 +1075,24 @@ elif selected == "Predict":
                         scaler_x = st.session_state["scaler_x"]
                         scaler_y = st.session_state["scaler_y"]
                         
-                        # Re-use the same grid generation logic but with new month and year
-                        x_min, x_max = data['x'].min(), data['x'].max()
-                        y_min, y_max = data['y'].min(), data['y'].max()
-                        
-                        n_grid_x = 60
-                        n_grid_y = 60
-                        
-                        x_grid = np.linspace(x_min, x_max, n_grid_x)
-                        y_grid = np.linspace(y_min, y_max, n_grid_y)
-                        
-                        from scipy.spatial import Delaunay, KDTree
-                        
-                        train_points_2d = data[['x', 'y']].values
-                        tri = Delaunay(train_points_2d)
+                        # same grid as at training time (cached index), new month and year
+                        with profiling.stage("grid") as rec:
+                            index = app_cache.spatial_index_for(data, st.session_state["data_digest"])
+                            grid = index.grid_points(n_x=60, n_y=60, n_depth=25)
+                            rec["points"] = len(grid)
+                        year_encoded = analyze_year - 2020
+                        X_test_filtered = np.column_stack([
+                            grid,
+                            np.full(len(grid), analyze_month),
+                            np.full(len(grid), year_encoded),
+                        ])
+                        X_test_tensor = session_store.scale_points(scaler_x, X_test_filtered)
                         
-                        X_mesh_2d, Y_mesh_2d = np.meshgrid(x_grid, y_grid, indexing='ij')
-                        xy_points = np.column_stack([X_mesh_2d.ravel(), Y_mesh_2d.ravel()])
-                        inside_mask = tri.find_simplex(xy_points) >= 0
-                        xy_inside = xy_points[inside_mask]
+                        pred_mean, pred_var = gp_model.predict(model_full, likelihood, X_test_tensor)
+                        pred_mean_original, pred_std_original = gp_model.to_original(scaler_y, pred_mean, pred_var)
                         
-                        tree = KDTree(train_points_2d)
-                        k_neighbors = 5
-                        distances, indices = tree.query(xy_inside, k=min(k_neighbors, len(train_points_2d)))
-                        
-                        max_depth_at_xy = np.zeros(len(xy_inside))
-                        for i in range(len(xy_inside)):
-                            if distances.ndim == 1:
-                                weights = np.array([1.0])
-                                neighbor_depths = data['depth'].values[indices]
-                            else:
-                                weights = 1.0 / (distances[i] + 1e-10)
-                                weights /= weights.sum()
-                                neighbor_depths = data['depth'].values[indices[i]]
-                            max_depth_at_xy[i] = np.max(neighbor_depths)
-                        
-                        n_depth_per_location = 25
-                        X_test_list = []
-                        
-                        for i, (x_pt, y_pt) in enumerate(xy_inside):
-                            max_depth = max_depth_at_xy[i]
-                            depths = np.linspace(0, max_depth * 0.95, n_depth_per_location)
-                            for d in depths:
-                                year_encoded = analyze_year - 2020
-                                X_test_list.append([x_pt, y_pt, d, analyze_month, year_encoded])
-                        
-                        X_test_filtered = np.array(X_test_list)
-                        X_test_scaled = scaler_x.transform(X_test_filtered)
-                        X_test_tensor = torch.tensor(X_test_scaled, dtype=torch.float32)
-                        
-                        model_full.eval()
-                        likelihood.eval()
-                        with torch.no_grad(), gpytorch.settings.fast_pred_var():
-                            pred_dist = likelihood(model_full(X_test_tensor))
-                            pred_mean = pred_dist.mean.detach().cpu().numpy()
-                            pred_var = pred_dist.variance.detach().cpu().numpy()
-                        
-                        pred_mean_original = scaler_y.inverse_transform(pred_mean)
-                        task_std = np.array(scaler_y.scale_)
-                        pred_std_original = np.sqrt(pred_var) * task_std[np.newaxis, :]
-                        
-                        pred_df = pd.DataFrame(X_test_filtered, columns=['x', 'y', 'depth', 'month', 'year_encoded'])
-                        # Convert year_encoded back to actual year
-                        pred_df['year'] = pred_df['year_encoded'] + 2020
-                        pred_df = pred_df.drop(columns=['year_encoded'])
-                        
-                        for j, col in enumerate(output_cols):
-                            pred_df[f'{col}_pred'] = pred_mean_original[:, j]
-                            pred_df[f'{col}_std'] = pred_std_original[:, j]
+                        pred_df = session_store.prediction_frame(grid, output_cols, pred_mean_original, pred_std_original,
+                                                                 month=analyze_month, year=analyze_year)
                         
                         st.session_state["predictions"] = pred_df
                         st.session_state["predict_month"] = analyze_month
@@ -1174,23 +1139,14 @@ elif selected == "Predict":
                         delta_color="off"
                     )
             
-            # Combine training data and predictions
-            train_df = data[['x', 'y', 'depth']].copy()
-            for col in output_cols:
-                train_df[f'{col}_pred'] = data[col].values
-            train_df['source'] = 'Training Data'
-            
-            pred_df_display = pred_df.copy()
-            pred_df_display['source'] = 'Prediction'
-            
-            # Combine both datasets
-            combined_df = pd.concat([
-                train_df[['x', 'y', 'depth', f'{selected_measurement}_pred', 'source']],
-                pred_df_display[['x', 'y', 'depth', f'{selected_measurement}_pred', 'source']]
-            ], ignore_index=True)
-            
-            # Invert depth for visualization
-            combined_df['depth_inverted'] = -combined_df['depth']
+            # Combine training data and predictions (only the plotted columns,
+            # depth inverted for visualization)
+            timed = profiling.begin("3D figure", points=len(data) + len(pred_df))
+            combined_df = session_store.plot_frame(data, pred_df, selected_measurement)
+            # thinned out per source, so both training points and predictions stay visible
+            combined_df = app_cache.lod_view(
+                combined_df, "predict_lod", value=f'{selected_measurement}_pred', group="source"
+            )
             
             # Create 3D scatter plot with smaller markers for continuous appearance
             fig_3d = px.scatter_3d(
@@ -1235,6 +1191,7 @@ elif selected == "Predict":
             )
             
             st.plotly_chart(fig_3d, use_container_width=True)
+            profiling.end(timed)
         
         # ----- TAB 2: Measurement vs Depth -----
         with tab2:
@@ -1249,6 +1206,7 @@ elif selected == "Predict":
             
             # Prepare data
             train_depth = data['depth'].values
+            timed = profiling.begin("depth profile figure")
             train_values = data[selected_measurement_tab2].values
             
             # Create dataframe for predictions with bounds
@@ -1316,16 +1274,19 @@ elif selected == "Predict":
             )
             
             st.plotly_chart(fig_depth, use_container_width=True)
+            profiling.end(timed)
         
         # ----- TAB 3 or 4: Temporal Trends (if temporal data exists) -----
         if has_temporal_training:
             with tab3:
                 st.markdown("#### 🗓️ Temporal Trends Analysis")
                 
-                # Get unique periods from training data
-                training_periods = sorted(data['month_year'].unique())
+                # depth x period cube of the training data, summarised once per dataset
+                periods = app_cache.depth_period_stats_for(data, st.session_state["data_digest"], output_cols)
+                training_periods = periods.periods
+                label_of = dict(zip(periods.periods, periods.labels))
                 
-                st.info(f"📊 Training data includes {len(training_periods)} time periods: {', '.join([pd.to_datetime(p + '-01').strftime('%b %Y') for p in training_periods])}")
+                st.info(f"📊 Training data includes {len(training_periods)} time periods: {', '.join(periods.labels)}")
                 
                 # Select measurement for temporal analysis
                 temp_feature = st.selectbox(
@@ -1348,12 +1309,9 @@ elif selected == "Predict":
                 
                 with col1:
                     st.markdown("**Training Data - Temporal Averages**")
-                    # Filter training data by depth range
-                    depth_mask = (data['depth'] >= depth_ranges[0]) & (data['depth'] <= depth_ranges[1])
-                    temporal_avg_train = data[depth_mask].groupby('month_year')[temp_feature].agg(['mean', 'std', 'count']).reset_index()
-                    
-                    # Format period labels
-                    temporal_avg_train['Period'] = temporal_avg_train['month_year'].apply(lambda x: pd.to_datetime(x + '-01').strftime('%b %Y'))
+                    # training data in the depth range (to the nearest 0.1 m), per period
+                    temporal_avg_train = periods.period_table([temp_feature], depth_ranges)[temp_feature]
+                    temporal_avg_train = temporal_avg_train[temporal_avg_train['count'] > 0].reset_index()
                     
                     # Plot training temporal trend
                     fig_train_temporal = px.line(
@@ -1384,7 +1342,7 @@ elif selected == "Predict":
                         "Select periods to compare:",
                         options=training_periods,
                         default=training_periods[:min(3, len(training_periods))],
-                        format_func=lambda x: pd.to_datetime(x + '-01').strftime('%b %Y')
+                        format_func=label_of.get
                     )
                     
                     if compare_periods:
@@ -1392,15 +1350,14 @@ elif selected == "Predict":
                         fig_depth_period = px.scatter()
                         
                         for period in compare_periods:
-                            period_data = data[data['month_year'] == period]
-                            period_profile = period_data.groupby('depth')[temp_feature].mean().reset_index()
-                            period_label = pd.to_datetime(period + '-01').strftime('%b %Y')
+                            # mean per 0.1 m depth bin
+                            period_profile = periods.profile(temp_feature, period)
                             
                             fig_depth_period.add_scatter(
                                 x=period_profile[temp_feature],
                                 y=period_profile['depth'],
                                 mode='lines+markers',
-                                name=period_label,
+                                name=label_of[period],
                                 line=dict(width=2),
                                 marker=dict(size=6)
                             )
@@ -1421,20 +1378,15 @@ elif selected == "Predict":
                 st.markdown("---")
                 st.markdown("**📈 Temporal Pattern Summary**")
                 
-                temporal_summary = []
-                for period in training_periods:
-                    period_data = data[data['month_year'] == period]
-                    period_label = pd.to_datetime(period + '-01').strftime('%b %Y')
-                    temporal_summary.append({
-                        'Period': period_label,
-                        'Mean': period_data[temp_feature].mean(),
-                        'Std': period_data[temp_feature].std(),
-                        'Min': period_data[temp_feature].min(),
-                        'Max': period_data[temp_feature].max(),
-                        'Samples': len(period_data)
-                    })
-                
-                summary_df = pd.DataFrame(temporal_summary)
+                feature_periods = periods.period_table([temp_feature])[temp_feature]
+                summary_df = pd.DataFrame({
+                    'Period': periods.labels,
+                    'Mean': feature_periods['mean'].to_numpy(),
+                    'Std': feature_periods['std'].to_numpy(),
+                    'Min': feature_periods['min'].to_numpy(),
+                    'Max': feature_periods['max'].to_numpy(),
+                    'Samples': periods.samples().to_numpy()
+                })
                 st.dataframe(
                     summary_df.style
                     .format({'Mean': '{:.2f}', 'Std': '{:.2f}', 'Min': '{:.2f}', 'Max': '{:.2f}', 'Samples': '{:.0f}'})
@@ -1450,6 +1402,7 @@ elif selected == "Predict":
             # --- Thermocline detection (if temperature available) ---
             if 'temperature' in output_cols:
                 st.markdown("**Thermocline Analysis**")
+                timed = profiling.begin("thermocline analysis")
                 temp_profile = (
                     pred_df[['depth', 'temperature_pred']]
                     .groupby('depth', as_index=False)
@@ -1538,12 +1491,14 @@ elif selected == "Predict":
                         fig_tc.add_scatter(x=[x0, x1], y=[y0, y1], mode='lines', name='Tangent at thermocline', line=dict(color='red', width=2, dash='dot'))
 
                 st.plotly_chart(fig_tc, use_container_width=True)
+                profiling.end(timed)
                 st.divider()
 
             # --- Hypoxia risk (if dissolved oxygen available) ---
             if 'dissolved_oxygen' in output_cols:
                 st.markdown("**Hypoxia Risk**")
                 hyp_thresh = st.slider("Hypoxia threshold (mg/L)", 1.0, 6.0, 4.0, 0.5, key="hyp_thresh")
+                timed = profiling.begin("hypoxia analysis")
                 do_values = pred_df['dissolved_oxygen_pred']
                 below_mask = do_values < hyp_thresh
                 frac_below = below_mask.mean() if len(do_values) else 0.0
@@ -1570,6 +1525,7 @@ elif selected == "Predict":
                 fig_do.update_xaxes(title='Depth (m)')
                 fig_do.update_yaxes(title='Dissolved Oxygen (mg/L)')
                 st.plotly_chart(fig_do, use_container_width=True)
+                profiling.end(timed)
                 st.divider()
 
             # --- Horizontal temperature gradient (if temperature available) ---
@@ -1583,6 +1539,7 @@ elif selected == "Predict":
                     key="horiz_grad_depth")
                 
                 # Filter predictions near selected depth (±0.5m tolerance)
+                timed = profiling.begin("horizontal gradient")
                 depth_slice = pred_df[abs(pred_df['depth'] - depth_for_gradient) <= 0.5].copy()
                 
                 if len(depth_slice) > 10:
@@ -1629,11 +1586,13 @@ elif selected == "Predict":
                                 st.metric("Mean horizontal gradient (°C/m)", f"{mean_grad_horiz:.4f}")
                 else:
                     st.info(f"Not enough data points at depth {depth_for_gradient:.1f}m for gradient analysis")
+                profiling.end(timed)
                 st.divider()
 
             # --- Uncertainty summary for any measurement ---
             st.markdown("**Uncertainty Summary**")
             sel_unc = st.selectbox("Measurement for uncertainty stats", output_cols, key="uncertainty_measurement")
+            timed = profiling.begin("uncertainty summary")
             mean_pred = pred_df[f'{sel_unc}_pred']
             std_pred = pred_df[f'{sel_unc}_std']
             p10 = np.percentile(mean_pred, 10) if len(mean_pred) else np.nan
@@ -1660,6 +1619,7 @@ elif selected == "Predict":
             fig_unc.update_xaxes(title='Depth (m)')
             fig_unc.update_yaxes(title='Std Dev')
             st.plotly_chart(fig_unc, use_container_width=True)
+            profiling.end(timed)
 
 
         # # Plot individual RMSE curves for each task (original units)
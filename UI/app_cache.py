@@ -0,0 +1,477 @@
+"""
+Streamlit caching around the ingestion helpers, shared by Projekt.py and the
+experimental V2 app.
+
+Every rerun of the Upload page used to re-read and re-clean the CSV. Now the
+cleaned frame is cached by (file content hash, ingest options), so reruns only
+pay for a dictionary lookup and a new file is parsed exactly once. Slices of
+the survey catalog are cached the same way, keyed by catalog.slice_digest.
+
+What is derived from a dataset (spatial index, depth-bin statistics, the
+scaled training arrays) is kept per dataset digest too, and append_upload
+updates it with the new rows only where that is possible.
+"""
+import copy
+import io
+import itertools
+import uuid
+from collections import OrderedDict
+
+import streamlit as st
+
+import catalog
+import depth_stats
+import exports
+import ingest
+import lod
+import partitions
+import period_stats
+import profiling
+import session_store
+import spatial_index
+import table_view
+
+# datasets whose derived objects are kept around
+MAX_DERIVED = 8
+
+
+def upload_digest(uploaded):
+    """Content hash of an st.file_uploader file, hashed once per upload."""
+    # hashing a few hundred MB on every rerun would eat most of the win,
+    # so remember the digest per uploaded file id
+    digests = st.session_state.setdefault("_upload_digests", {})
+    if uploaded.file_id not in digests:
+        digests[uploaded.file_id] = ingest.file_digest(uploaded.getvalue())
+    return digests[uploaded.file_id]
+
+
+# cache_resource hands back the same object instead of unpickling a copy of
+# the whole frame every rerun; callers get a shallow copy (see load_upload)
+@st.cache_resource(max_entries=4, show_spinner="Parsing survey...")
+def _load_survey(digest, _raw, min_sats, parse_time):
+    return ingest.load_survey(io.BytesIO(_raw), min_sats=min_sats, parse_time=parse_time)
+
+
+def load_upload(uploaded, min_sats=ingest.MIN_SATS, parse_time=False):
+    """
+    Cleaned, projected frame for an uploaded survey.
+
+    Returns (data, info, digest), see ingest.clean_survey for info.
+    Raises ValueError if the required columns are missing.
+    """
+    digest = upload_digest(uploaded)
+    with profiling.stage("ingest") as rec:
+        data, info = _load_survey(digest, uploaded.getvalue(), min_sats, parse_time)
+        rec["rows"] = len(data)
+    # remembered so a later append of the same, grown file only reads the new part
+    st.session_state["_append_source"] = (uploaded.size, ingest.end_check(uploaded.getbuffer(), uploaded.size))
+    # shallow copy so adding columns on a page never touches the cached frame
+    return data.copy(deep=False), info, digest
+
+
+def append_upload(uploaded, data, digest, min_sats=ingest.MIN_SATS, parse_time=False):
+    """
+    Add the new rows of an uploaded file to the current dataset (data, digest).
+
+    New rows are the part of a plain CSV after the previously uploaded version
+    of the same file, otherwise the rows after the last timestamp, otherwise
+    the whole file (a delta with just the new casts). For a grown CSV only
+    the new bytes are parsed and hashed: the new digest is derived from the
+    current one and those bytes. The spatial index and depth statistics of
+    the dataset are updated with the new rows only. The frame itself is
+    still concatenated, which copies its columns once but parses nothing.
+
+    Returns (data, info, digest) like load_upload; info["appended"] is the
+    number of rows added.
+    """
+    # a view of the upload's bytes, so nothing is copied unless it is parsed
+    raw = uploaded.getbuffer()
+    source = st.session_state.get("_append_source")
+    tail = ingest.csv_tail(raw, *source) if source else None
+    if tail == b"":
+        return data, {"removed": 0, "has_time": False, "time_error": None, "appended": 0}, digest
+
+    with st.spinner("Reading new rows..."), profiling.stage("ingest (append)"):
+        # projected around the current dataset's origin so x/y line up
+        new, info = ingest.load_survey(io.BytesIO(raw if tail is None else tail),
+                                       min_sats=min_sats, parse_time=parse_time,
+                                       origin=data.attrs.get("origin"))
+    if tail is None:
+        new = ingest.newer_rows(data, new)
+    info["appended"] = len(new)
+    st.session_state["_append_source"] = (uploaded.size, ingest.end_check(raw, uploaded.size))
+    if len(new) == 0:
+        return data, info, digest
+
+    combined = ingest.append_rows(data, new)
+    # a grown file is keyed by the current dataset plus its new bytes, anything else was read whole anyway
+    added = upload_digest(uploaded) if tail is None else ingest.file_digest(tail)
+    new_digest = ingest.file_digest(f"{digest}+{added}".encode())
+
+    # derive the new dataset's objects from the old one's. The cache is shared
+    # by all sessions, and others may still be on the old dataset, so the old
+    # objects stay as they are and copies are updated
+    derived = _derived()
+    for key in [k for k in derived if k[1] == digest]:
+        obj = derived[key]
+        if key[0] == "spatial_index":
+            # append() only rebinds attributes, a shallow copy keeps the original intact
+            obj = copy.copy(obj)
+            obj.append(new["x"].to_numpy(), new["y"].to_numpy(), new["depth"].to_numpy())
+        elif key[0] == "depth_stats":
+            # update() adds into the bin arrays in place (they are small)
+            obj = copy.deepcopy(obj)
+            obj.update(new)
+        else:
+            # e.g. training arrays (new rows change the scaling) or the period
+            # cube (new rows may add a period): rebuilt on use
+            continue
+        derived[(key[0], new_digest) + key[2:]] = obj
+    while len(derived) > MAX_DERIVED:
+        derived.popitem(last=False)
+    return combined, info, new_digest
+
+
+@st.cache_resource
+def _derived():
+    """
+    (kind, dataset digest, ...) -> object derived from that dataset.
+    A plain dict rather than cached functions so append_upload can derive
+    the new digest's objects from updated copies instead of rebuilding them.
+    """
+    return OrderedDict()
+
+
+def _get_derived(key, build):
+    derived = _derived()
+    if key in derived:
+        derived.move_to_end(key)
+        return derived[key]
+    obj = build()
+    derived[key] = obj
+    while len(derived) > MAX_DERIVED:
+        derived.popitem(last=False)
+    return obj
+
+
+def spatial_index_for(data, digest):
+    """
+    SpatialIndex over data's x/y/depth, built once per dataset digest (see
+    load_upload / load_slice) and shared by every page and rerun.
+    """
+    def build():
+        with st.spinner("Indexing survey points..."), profiling.stage("spatial index"):
+            return spatial_index.SpatialIndex(
+                data["x"].to_numpy(), data["y"].to_numpy(), data["depth"].to_numpy()
+            )
+    return _get_derived(("spatial_index", digest), build)
+
+
+def depth_stats_for(data, digest, features):
+    """DepthBinStats of features, built once per dataset digest."""
+    features = tuple(features)
+
+    def build():
+        with st.spinner("Binning by depth..."), profiling.stage("depth binning"):
+            return depth_stats.DepthBinStats.from_frame(data, features)
+    return _get_derived(("depth_stats", digest, features), build)
+
+
+def depth_period_stats_for(data, digest, features):
+    """period_stats.DepthPeriodStats of features, built once per dataset digest."""
+    features = tuple(features)
+
+    def build():
+        with st.spinner("Summarising periods..."), profiling.stage("period statistics"):
+            return period_stats.DepthPeriodStats(data, features)
+    return _get_derived(("depth_period_stats", digest, features), build)
+
+
+def period_partition_for(data, digest):
+    """partitions.PeriodPartition of data (rows in time order), built once per dataset digest."""
+    def build():
+        with profiling.stage("period partition"):
+            return partitions.PeriodPartition(data)
+    return _get_derived(("period_partition", digest), build)
+
+
+# the tables are small, so cache_data's copy per hit is cheap and keeps
+# pages from modifying the cached one
+@st.cache_data(max_entries=32, show_spinner=False)
+def _depth_table(digest, features, bin_width, selected, _stats):
+    with profiling.stage("depth table", bin_width=bin_width):
+        return _stats.table(bin_width, selected)
+
+
+@st.cache_data(max_entries=32, show_spinner=False)
+def _overall_stats(digest, features, selected, _stats):
+    with profiling.stage("overall statistics"):
+        return _stats.overall(selected)
+
+
+def depth_table_for(data, digest, features, bin_width, selected=None):
+    """
+    Per-depth statistics of the selected features (DepthBinStats.table),
+    computed once per (dataset, bin width, features) so reruns that only open
+    an expander or switch tabs don't merge the bins again.
+    """
+    features = tuple(features)
+    selected = features if selected is None else tuple(selected)
+    stats = depth_stats_for(data, digest, features)
+    return _depth_table(digest, features, round(float(bin_width), 1), selected, stats)
+
+
+def overall_stats_for(data, digest, features, selected=None):
+    """Whole-survey mean/std/min/max/count per feature (DepthBinStats.overall), cached like depth_table_for."""
+    features = tuple(features)
+    selected = features if selected is None else tuple(selected)
+    stats = depth_stats_for(data, digest, features)
+    return _overall_stats(digest, features, selected, stats)
+
+
+def training_arrays_for(data, digest, input_cols, output_cols):
+    """
+    Scaled float32 model inputs/outputs (session_store.TrainingArrays), built
+    once per dataset digest instead of on every rerun of the Predict page.
+    """
+    input_cols, output_cols = tuple(input_cols), tuple(output_cols)
+
+    def build():
+        return session_store.TrainingArrays(data, input_cols, output_cols)
+    return _get_derived(("training", digest, input_cols, output_cols), build)
+
+
+@st.cache_data(max_entries=16, show_spinner="Thinning out points...")
+def _decimate(digest, value, budget, mode, group, bounds, _frame):
+    return lod.decimate(_frame, value=value, budget=budget, mode=mode, group=group, bounds=bounds)
+
+
+def lod_view(frame, key, digest=None, value=None, group=None):
+    """
+    Level-of-detail controls for a 3D scatter of frame (x, y, depth) and the
+    rows to plot (lod.decimate). The x/y/depth sliders zoom into a sub-volume,
+    which is then decimated on its own, i.e. at a finer grid. With a digest
+    identifying frame the decimation is cached across reruns.
+    """
+    if frame.empty:
+        return frame
+    with st.expander("🔍 Level of detail"):
+        col1, col2 = st.columns(2)
+        budget = col1.number_input(
+            "Max points:", min_value=1000, max_value=500_000, value=lod.MAX_POINTS, step=5000,
+            key=f"{key}_budget", help="More points show more detail but make the plot slower."
+        )
+        mode = col2.radio(
+            "Keep per voxel:", ["Representative", "Extremes"], horizontal=True, key=f"{key}_mode",
+            help="Representative keeps the point closest to the voxel's mean value, "
+                 "Extremes its lowest and highest value."
+        ).lower()
+
+        bounds, zoomed = [], False
+        for col, label in (("x", "X (m)"), ("y", "Y (m)"), ("depth", "Depth (m)")):
+            lo, hi = float(frame[col].min()), float(frame[col].max())
+            if hi <= lo:
+                bounds += [lo, hi]
+                continue
+            # range in the key so another dataset starts from its full extent
+            picked = st.slider(f"{label}:", lo, hi, (lo, hi), key=f"{key}_{col}_{lo:g}_{hi:g}")
+            bounds += list(picked)
+            zoomed = zoomed or picked != (lo, hi)
+    bounds = tuple(bounds) if zoomed else None
+
+    with profiling.stage("level of detail") as rec:
+        if digest is None:
+            rows, res = lod.decimate(frame, value=value, budget=budget, mode=mode, group=group, bounds=bounds)
+        else:
+            rows, res = _decimate(digest, value, budget, mode, group, bounds, frame)
+        rec["points"] = len(rows)
+    if res is not None:
+        st.caption(f"Showing {len(rows):,} of {len(frame):,} points ({res}×{res}×{res} voxel grid). "
+                   f"Zoom in with the sliders under Level of detail to see more.")
+    elif zoomed:
+        st.caption(f"Showing all {len(rows):,} points of the selected sub-volume.")
+    return rows
+
+
+# positions only, read-only for the callers, so no copy per hit
+@st.cache_resource(max_entries=8, show_spinner="Sorting...")
+def _sort_order(digest, column, ascending, _data):
+    return table_view.sort_order(_data, column, ascending)
+
+
+def raw_data_explorer(data, digest, columns, key="raw"):
+    """
+    One page of data[columns] at a time, sorted and filtered on the server
+    (table_view). Sort orders are cached per dataset digest, so paging
+    through a sorted survey doesn't sort it again.
+    """
+    col1, col2, col3 = st.columns([2, 1, 2])
+    sort_col = col1.selectbox("Sort by:", [None] + columns, key=f"{key}_sort",
+                              format_func=lambda c: "File order" if c is None else c)
+    descending = col2.checkbox("Descending", key=f"{key}_desc", disabled=sort_col is None)
+    filter_col = col3.selectbox("Filter on:", [None] + columns, key=f"{key}_filter",
+                                format_func=lambda c: "No filter" if c is None else c)
+
+    mask = None
+    if filter_col is not None:
+        lo, hi = float(data[filter_col].min()), float(data[filter_col].max())
+        if hi > lo:
+            # range in the key so another dataset starts from its full extent
+            picked = st.slider(f"{filter_col} range:", lo, hi, (lo, hi),
+                               key=f"{key}_range_{filter_col}_{lo:g}_{hi:g}")
+            if picked != (lo, hi):
+                mask = table_view.range_mask(data, filter_col, *picked)
+
+    with profiling.stage("raw data filter") as rec:
+        order = None if sort_col is None else _sort_order(digest, sort_col, not descending, data)
+        rows = table_view.view_rows(len(data), order, mask)
+        rec["rows"] = len(rows)
+
+    col1, col2 = st.columns([1, 3])
+    page_size = col1.selectbox("Rows per page:", table_view.PAGE_SIZES, index=1, key=f"{key}_page_size")
+    n_pages = table_view.page_count(len(rows), page_size)
+    number = col2.number_input(f"Page (of {n_pages:,}):", min_value=1, max_value=n_pages, value=1,
+                               key=f"{key}_page_{n_pages}")
+
+    page = table_view.page(data, rows, columns, number, page_size)
+    st.dataframe(table_view.style_page(page), use_container_width=True, height=500)
+    first = (number - 1) * page_size
+    shown = f"Rows {first + 1:,}-{first + len(page):,} of {len(rows):,}" if len(rows) else "No rows"
+    if mask is not None:
+        shown += f" (filtered from {len(data):,})"
+    st.caption(shown)
+
+
+# bytes are immutable, so cache_resource hands out the same object without a copy
+@st.cache_resource(max_entries=8, show_spinner="Preparing download...")
+def _export(version, fmt, index, _frame):
+    return exports.to_bytes(_frame() if callable(_frame) else _frame, fmt, index=index)
+
+
+def frame_version(frame):
+    """
+    Token for the content of a frame that has no digest (e.g. predictions):
+    the same for one frame object across reruns, new for every new frame.
+    """
+    return frame.attrs.setdefault("export_version", uuid.uuid4().hex)
+
+
+def lazy_download(label, frame, version, stem, fmt, key, index=False, use_container_width=False):
+    """
+    Download button that only serializes frame once someone asks for it.
+
+    Shows "Prepare <label>" first; after a click the payload is built (see
+    exports.write), cached by (version, fmt) and offered for download until
+    version or fmt changes. frame may be a callable returning the frame, so
+    idle reruns don't even build it. version identifies the content, e.g.
+    the dataset digest or frame_version(pred_df).
+    """
+    token = (version, fmt, index)
+    if st.session_state.get(key) != token:
+        if not st.button(f"⚙️ Prepare {label}", key=f"{key}_prepare", use_container_width=use_container_width):
+            return
+        st.session_state[key] = token
+    st.download_button(
+        f"📥 {label}",
+        data=_export(version, fmt, index, frame),
+        file_name=exports.file_name(stem, fmt),
+        mime=exports.mime(fmt),
+        key=f"{key}_download",
+        use_container_width=use_container_width,
+    )
+
+
+@st.cache_resource(max_entries=4, show_spinner="Loading surveys from the catalog...")
+def _load_slice(digest, lake, start, end, parse_time):
+    return catalog.load_slice(lake, start, end, parse_time=parse_time)
+
+
+def load_slice(lake, start=None, end=None, parse_time=False):
+    """
+    Cleaned, projected frame for one lake and month range of the catalog.
+
+    Returns (data, info, digest) like load_upload. The digest changes when a
+    survey overlapping the slice is added, so the cache never goes stale.
+    """
+    digest = catalog.slice_digest(lake, start, end)
+    with profiling.stage("catalog slice") as rec:
+        data, info = _load_slice(digest, lake, start, end, parse_time)
+        rec["rows"] = len(data)
+    st.session_state.pop("_append_source", None)
+    return data.copy(deep=False), info, digest
+
+
+def catalog_picker(key):
+    """
+    Lake and month range widgets for the survey catalog.
+
+    Returns (lake, start, end) for load_slice, or None if the catalog is empty.
+    start/end are None when the whole time range is picked, so surveys without
+    timestamps are included too.
+    """
+    lakes = catalog.lakes()
+    if lakes.empty:
+        st.info("The survey catalog is empty. Upload a file and save it to the catalog first.")
+        return None
+
+    lake = st.selectbox("Lake:", lakes["lake"], key=f"{key}_lake")
+    row = lakes.set_index("lake").loc[lake]
+    months = catalog.month_starts(row["t_min"], row["t_max"])
+    start = end = None
+    if len(months) > 1:
+        first, last = st.select_slider(
+            "Months:", options=months, value=(months[0], months[-1]), key=f"{key}_months"
+        )
+        if (first, last) != (months[0], months[-1]):
+            start, end = catalog.month_range(first, last)
+    st.caption(f"{row['surveys']} surveys, {row['rows']:,} points in the catalog")
+    return lake, start, end
+
+
+def save_survey(data, lake, digest, name=None):
+    """Add an uploaded survey to the catalog. Returns False if it was already there."""
+    _, added = catalog.add_survey(data, lake, digest, name=name)
+    return added
+
+
+def profiling_panel(page):
+    """
+    "Performance" panel in the sidebar. With recording on, this run's
+    pipeline stages (profiling.stage) are timed for the session and the
+    panel shows them whenever an outermost stage finishes (outside every
+    timed stage, so drawing it doesn't count), with the session's log as JSON.
+    Call once per run, before the page does any work.
+    """
+    with st.sidebar.expander("⏱️ Performance"):
+        on = st.checkbox(
+            "Record stage timings", key="profiling",
+            help="Times ingest, statistics, figures, training, grid, prediction and the analyses "
+                 "of this session, with peak Python memory (tracemalloc) and process RSS."
+        )
+        slot = st.empty()
+    if not on:
+        # also stops tracemalloc once no session records any more
+        profiling.deactivate(st.session_state.get("profiler"))
+        return
+
+    profiler = st.session_state.setdefault("profiler", profiling.Profiler())
+    profiler.start_run(page)
+    draws = itertools.count(1)
+
+    def show(rec=None):
+        run = profiler.last_run
+        with slot.container():
+            if run is None:
+                st.caption("Nothing recorded yet.")
+                return
+            st.caption(f"Run {run['run']} ({run['page']}), {run['started']}")
+            st.dataframe(profiler.table(run), hide_index=True, use_container_width=True)
+            # redrawn after every outermost stage, so each drawing needs its own key
+            st.download_button(
+                "📥 Session log (JSON)", data=profiler.to_json(), mime="application/json",
+                file_name=f"profile_{profiler.started.replace(':', '')}.json", on_click="ignore",
+                key=f"profiling_log_{next(draws)}",
+            )
+    profiler.on_record = show
+    show()
+    profiling.activate(profiler)
@@ -0,0 +1,335 @@
+"""
+End-to-end benchmark of the dashboard pipeline, outside Streamlit.
+
+For each size a synthetic lake survey is generated (the lake of
+`Synthetic Data/Data_gen5.py`, or with --temporal the seasonal months of
+`UI_V2/Data_gen_temporal.py`, both vectorised so that 10M rows take seconds)
+and written to CSV, then every stage of the Projekt.py pipeline is timed
+with the same functions the app calls:
+
+    csv_parse       ingest.read_survey_csv
+    projection      ingest.finish_survey (lat/lon -> x/y, month/year)
+    depth_stats     DepthBinStats.from_frame + table + overall
+    scaling         session_store.TrainingArrays
+    split           gp_model.stratified_split
+    gp_training     gp_model.train, a fixed number of iterations (or until --patience
+                    stops it, for the time to converge of --optimizer)
+    condition       gp_model.condition
+    grid            SpatialIndex + grid_points (60 x 60 x 25)
+    prediction      gp_model.predict + to_original + prediction_frame
+    figure          plot_frame + lod.decimate + px.scatter_3d + to_json
+
+The exact GP is O(n^3), so it is trained and conditioned on a random
+subsample of --train-rows rows; everything else runs on the whole survey.
+--grid-size trains a KISS-GP on a grid of that many points per axis instead
+(one GP per measurement); run both at the same --train-rows to compare them.
+Results (seconds per repeat, per GP iteration, plus the commit and library
+versions) go to a JSON file for comparing runs across versions.
+
+    python benchmark.py --sizes 1000 10000 100000 1000000 -o bench.json
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time
+import warnings
+
+import numpy as np
+import pandas as pd
+
+import gp_model
+import ingest
+import lod
+import session_store
+from depth_stats import DepthBinStats
+from spatial_index import SpatialIndex
+
+SIZES = (1_000, 10_000, 100_000, 1_000_000)
+TRAIN_ROWS = 1000
+TRAIN_ITERS = 20
+GEN_CHUNK_ROWS = 1_000_000
+
+# lake of Data_gen5.py
+LAT_MIN, LAT_MAX = 60.640, 60.650
+LON_MIN, LON_MAX = 17.840, 17.850
+MIN_DEPTH, MAX_DEPTH = 1.5, 11
+MONTHS = (4, 6, 8, 10)
+YEAR = 2024
+
+INPUT_COLS = ["x", "y", "depth"]
+OUTPUT_COLS = ["pH", "temperature", "turbidity", "dissolved_oxygen", "TDS"]
+
+
+def lake_locations(n_side, rng):
+    """lat, lon and max depth of the nodes of an n_side x n_side grid inside the lake outline."""
+    lats = np.linspace(LAT_MIN, LAT_MAX, n_side)
+    lons = np.linspace(LON_MIN, LON_MAX, n_side)
+    lat_grid, lon_grid = np.meshgrid(lats, lons, indexing="ij")
+    lat_center, lon_center = (LAT_MIN + LAT_MAX) / 2, (LON_MIN + LON_MAX) / 2
+    lat_radius = (LAT_MAX - LAT_MIN) / 2 * 0.9
+    lon_radius = (LON_MAX - LON_MIN) / 2 * 0.7
+
+    angle = np.arctan2(lat_grid - lat_center, lon_grid - lon_center)
+    radial_noise = 0.1 * np.sin(5 * angle) + 0.05 * rng.random(angle.shape)
+    inside = (((lat_grid - lat_center) / (lat_radius * (1 + radial_noise))) ** 2 +
+              ((lon_grid - lon_center) / (lon_radius * (1 + radial_noise))) ** 2) <= 1
+    dist = np.clip(np.sqrt(((lat_grid - lat_center) / lat_radius) ** 2 +
+                           ((lon_grid - lon_center) / lon_radius) ** 2), 0, 1)
+    depth_map = MIN_DEPTH + (1 - dist) * (MAX_DEPTH - MIN_DEPTH)
+    return lat_grid[inside], lon_grid[inside], depth_map[inside]
+
+
+def seasonal_params(month):
+    """(T_surface, T_deep, thermocline_strength, DO_depletion) per row, as in Data_gen_temporal.py."""
+    t_surface = np.select(
+        [np.isin(month, [12, 1, 2]), np.isin(month, [3, 4, 5]), np.isin(month, [6, 7, 8])],
+        [4.0, 10.0 + (month - 3) * 2.5, 20.0 + (month - 6) * 1.5], 18.0 - (month - 9) * 3.0)
+    t_deep = np.select(
+        [np.isin(month, [12, 1, 2]), np.isin(month, [3, 4, 5]), np.isin(month, [6, 7, 8])],
+        [4.0, 4.5, 6.0], 5.0)
+    strength = np.select(
+        [np.isin(month, [12, 1, 2]), np.isin(month, [3, 4, 5]), np.isin(month, [6, 7, 8])],
+        [0.1, 0.3 + (month - 3) * 0.1, 0.7 + (month - 6) * 0.1], 0.6 - (month - 9) * 0.15)
+    depletion = np.select(
+        [np.isin(month, [12, 1, 2]), np.isin(month, [3, 4, 5]), np.isin(month, [6, 7, 8])],
+        [0.1, 0.15, 0.35 + (month - 6) * 0.05], 0.3 - (month - 9) * 0.05)
+    return t_surface, t_deep, strength, depletion
+
+
+def synthetic_chunk(n, lat, lon, depth_map, rng, temporal=False):
+    """
+    n measurements at random lake locations and depths. Without temporal it
+    is the summer lake of Data_gen5.py, with it a random month of MONTHS and
+    a timestamp in it.
+    """
+    loc = rng.integers(0, len(lat), n)
+    depth = rng.uniform(0, depth_map[loc])
+    noise = rng.normal
+
+    if temporal:
+        month = np.asarray(MONTHS)[rng.integers(0, len(MONTHS), n)]
+        t_surface, t_deep, strength, depletion = seasonal_params(month)
+        width = 2.5 / strength
+    else:
+        t_surface, t_deep, width, depletion = 18.0, 4.0, 2.5, 0.15
+    T = t_deep + (t_surface - t_deep) * 0.5 * (1 - np.tanh((depth - 6.0) / width))
+    T = T + noise(0, 0.01, n) + noise(0, 0.05, n)
+
+    if temporal:
+        pH_base = np.where(np.isin(month, [12, 1, 2, 3]), 7.6, 7.5)
+        turb_base = np.where(np.isin(month, [3, 4, 5]), 5.5, 5.0)
+        tds0 = 100 + 1.5 * depth + np.where(np.isin(month, [6, 7, 8]), 10, 0)
+    else:
+        pH_base, turb_base, tds0 = 7.6, 5.0, 100 + 1.5 * depth
+    pH = pH_base - 0.03 * depth + 0.03 * (T - 25) + noise(0, 0.1, n)
+    turbidity = turb_base + 0.3 * depth - 0.02 * (T - 16) + noise(0, 0.2, n)
+    do_sat = 14.6 - 0.4 * T + 0.01 * T ** 2
+    # Data_gen5 depletes 0.3 per metre, the seasonal file 2 * DO_depletion
+    dissolved_oxygen = do_sat - 2 * depletion * depth + noise(0, 0.2, n)
+    tds = tds0 / (1 + 0.02 * (T - 25)) + noise(0, 10, n)
+
+    frame = pd.DataFrame({
+        "latitude": lat[loc], "longitude": lon[loc], "depth": depth,
+        "pH": pH.round(2), "temperature": T.round(2), "turbidity": turbidity.round(2),
+        "dissolved_oxygen": dissolved_oxygen.round(2), "TDS": tds.round(1),
+        "num_sats": rng.integers(7, 15, n),
+    })
+    if temporal:
+        start = pd.to_datetime({"year": np.full(n, YEAR), "month": month, "day": 1})
+        frame["timestamp"] = start + pd.to_timedelta(
+            rng.integers(0, 28 * 86400, n), unit="s"
+        )
+    return frame
+
+
+def write_survey(path, n_rows, temporal=False, seed=42, chunk_rows=GEN_CHUNK_ROWS):
+    """Write an n_rows synthetic survey CSV to path, chunk_rows rows at a time."""
+    rng = np.random.default_rng(seed)
+    # about 4 depths per location like the generators, but never fewer nodes than their 15 x 15 grid
+    n_side = max(15, int(np.sqrt(n_rows / 4)))
+    lat, lon, depth_map = lake_locations(n_side, rng)
+    for start in range(0, n_rows, chunk_rows):
+        chunk = synthetic_chunk(min(chunk_rows, n_rows - start), lat, lon, depth_map, rng, temporal)
+        chunk.to_csv(path, mode="w" if start == 0 else "a", header=start == 0, index=False)
+
+
+def survey_path(data_dir, n_rows, temporal, seed):
+    name = f"lake_{n_rows}{'_temporal' if temporal else ''}_{seed}.csv"
+    return os.path.join(data_dir, name)
+
+
+def timed(stages, name, repeat, fn):
+    """Run fn repeat times, record the wall times under stages[name] and return the last result."""
+    seconds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        seconds.append(time.perf_counter() - start)
+    stages[name] = {"seconds": seconds, "best": min(seconds)}
+    return result
+
+
+def run_size(path, temporal, repeat, train_rows, iters, rank, budget, seed, eval_every=1, optimizer="adam",
+             patience=None, grid_size=None):
+    """Time every stage on the survey at path. Returns the stage timings and GP details."""
+    import plotly.express as px
+    import torch
+
+    stages = {}
+    data, info = timed(stages, "csv_parse", repeat, lambda: ingest.read_survey_csv(path))
+    data, info = timed(stages, "projection", repeat,
+                       lambda: ingest.finish_survey(data, dict(info), parse_time=temporal))
+    features = [c for c in OUTPUT_COLS if c in data.columns]
+
+    def depth_statistics():
+        stats = DepthBinStats.from_frame(data, features)
+        return stats.table(1.0), stats.overall()
+    timed(stages, "depth_stats", repeat, depth_statistics)
+
+    arrays = timed(stages, "scaling", repeat,
+                   lambda: session_store.TrainingArrays(data, INPUT_COLS, features))
+    timed(stages, "split", repeat, lambda: gp_model.stratified_split(arrays.X[:, 2]))
+
+    def grid():
+        index = SpatialIndex(data["x"].to_numpy(), data["y"].to_numpy(), data["depth"].to_numpy())
+        return index.grid_points(n_x=60, n_y=60, n_depth=25)
+    points = timed(stages, "grid", repeat, grid)
+
+    # the exact GP on a subsample, with patience > iters so every run does iters iterations
+    rng = np.random.default_rng(seed)
+    rows = np.sort(rng.choice(len(arrays), min(train_rows, len(arrays)), replace=False))
+    X, Y = torch.from_numpy(arrays.X[rows]), torch.from_numpy(arrays.Y[rows])
+    train_idx, val_idx = gp_model.stratified_split(arrays.X[rows, 2])
+    train_idx, val_idx = torch.from_numpy(train_idx), torch.from_numpy(val_idx)
+    # a KISS-GP's interpolation grid has to cover the prediction grid as well
+    bounds = gp_model.ski_bounds(X, session_store.scale_points(arrays.scaler_x, points)) if grid_size else None
+    model, likelihood, history = timed(stages, "gp_training", repeat, lambda: gp_model.train(
+        X[train_idx], Y[train_idx], X[val_idx], Y[val_idx], arrays.scaler_y.scale_,
+        rank=rank, iters=iters, patience=patience or iters + 1, eval_every=eval_every, optimizer=optimizer,
+        grid_size=grid_size, grid_bounds=bounds,
+    ))
+    model_full = timed(stages, "condition", repeat, lambda: gp_model.condition(model, likelihood, X, Y))
+
+    def prediction():
+        mean, var = gp_model.predict(model_full, likelihood, session_store.scale_points(arrays.scaler_x, points))
+        mean, std = gp_model.to_original(arrays.scaler_y, mean, var)
+        return session_store.prediction_frame(points, features, mean, std)
+    pred_df = timed(stages, "prediction", repeat, prediction)
+
+    measurement = "temperature" if "temperature" in features else features[0]
+
+    def figure():
+        frame = session_store.plot_frame(data, pred_df, measurement)
+        frame, _ = lod.decimate(frame, value=f"{measurement}_pred", budget=budget, group="source")
+        fig = px.scatter_3d(frame, x="x", y="y", z="depth_inverted", color=f"{measurement}_pred",
+                            symbol="source", color_continuous_scale="Thermal", opacity=0.8)
+        return len(frame), len(fig.to_json())
+    plotted, figure_bytes = timed(stages, "figure", repeat, figure)
+
+    per_iter = np.asarray(history["iteration_seconds"])
+    return {
+        "rows": len(data),
+        "removed": info["removed"],
+        "stages": stages,
+        "gp": {
+            "train_rows": len(rows),
+            "optimizer": optimizer,
+            "grid_size": grid_size,
+            "iterations": history["iterations"],
+            "converged": history["converged"],
+            "best_iteration": history["best_iteration"],
+            "seconds_to_best": history["best_seconds"],
+            "iteration_seconds": per_iter.tolist(),
+            "iteration_median": float(np.median(per_iter)) if len(per_iter) else None,
+            "grid_points": len(points),
+        },
+        "figure": {"points": plotted, "json_bytes": figure_bytes},
+    }
+
+
+def metadata():
+    """Commit, library versions and machine of a run."""
+    import gpytorch
+    import plotly
+    import sklearn
+    import torch
+
+    here = os.path.dirname(os.path.abspath(__file__))
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=here, capture_output=True,
+                                text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=here,
+                                    capture_output=True, text=True, check=True).stdout.strip())
+    except (OSError, subprocess.CalledProcessError):
+        commit, dirty = None, None
+    return {
+        "commit": commit,
+        "dirty": dirty,
+        "started": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "torch_threads": torch.get_num_threads(),
+        "versions": {
+            "numpy": np.__version__, "pandas": pd.__version__, "torch": torch.__version__,
+            "gpytorch": gpytorch.__version__, "sklearn": sklearn.__version__, "plotly": plotly.__version__,
+        },
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time the dashboard pipeline on synthetic lake surveys.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(SIZES),
+                        help="survey sizes in rows (up to 10M)")
+    parser.add_argument("--temporal", action="store_true", help="seasonal surveys with timestamps (V2)")
+    parser.add_argument("--repeat", type=int, default=1, help="runs of every stage")
+    parser.add_argument("--train-rows", type=int, default=TRAIN_ROWS, help="subsample the GP is trained on")
+    parser.add_argument("--iters", type=int, default=TRAIN_ITERS, help="GP training iterations")
+    parser.add_argument("--rank", type=int, default=1, help="multitask kernel rank")
+    parser.add_argument("--eval-every", type=int, default=1, help="GP iterations per validation")
+    parser.add_argument("--optimizer", choices=gp_model.OPTIMIZERS, default="adam", help="GP optimizer")
+    parser.add_argument("--patience", type=int,
+                        help="early-stopping patience, for time to converge (default: run all --iters)")
+    parser.add_argument("--grid-size", type=int,
+                        help="train a KISS-GP with this many grid points per axis (default: exact GP)")
+    parser.add_argument("--budget", type=int, default=lod.MAX_POINTS, help="3D plot point budget")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--data-dir", help="where the generated CSVs are kept (reused between runs)")
+    parser.add_argument("-o", "--output", default="benchmark.json", help="JSON file to write")
+    args = parser.parse_args(argv)
+    # gp_model.train(train_rmse=True) evaluates the training rows in eval mode on purpose
+    warnings.filterwarnings("ignore", message="The input matches the stored training data")
+
+    data_dir = args.data_dir or os.path.join(tempfile.gettempdir(), "lake_benchmark")
+    os.makedirs(data_dir, exist_ok=True)
+    report = {"meta": metadata(), "settings": {k: v for k, v in vars(args).items() if k != "output"},
+              "results": []}
+
+    for n_rows in args.sizes:
+        path = survey_path(data_dir, n_rows, args.temporal, args.seed)
+        if not os.path.exists(path):
+            start = time.perf_counter()
+            write_survey(path, n_rows, args.temporal, args.seed)
+            print(f"generated {n_rows} rows in {time.perf_counter() - start:.1f}s -> {path}")
+        result = run_size(path, args.temporal, args.repeat, args.train_rows, args.iters,
+                          args.rank, args.budget, args.seed, args.eval_every, args.optimizer, args.patience,
+                          args.grid_size)
+        result["size"] = n_rows
+        result["file_bytes"] = os.path.getsize(path)
+        report["results"].append(result)
+        print(f"{n_rows:>10} rows: " + ", ".join(
+            f"{name} {stage['best']:.3f}s" for name, stage in result["stages"].items()
+        ))
+        # written after every size, so a long run keeps what it has measured
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    print(f"wrote {args.output}")
+
+
+if __name__ == "__main__":
+    main()
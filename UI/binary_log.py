@@ -0,0 +1,247 @@
+"""
+Read the binary SD card log of `Sensor code/combined_sensor_code.ino`
+(LOG_BINARY) into rows in the dashboard's CSV schema.
+
+The file is a 16-byte header followed by one 16-byte record per pressure
+reading, all little-endian:
+
+    header: magic "LWQ1", version u16, record size u16, start unix time u32
+            (0 = unknown), reserved u32
+    record: millis u32, pressure / TDS / DO ADC u16, pH ADC sum (6 readings)
+            u16, DS18B20 raw i16 (1/16 degC), flags u8, reserved u8
+    marker: millis u32 at boot, start unix time u32 (0 = unknown), 6 bytes
+            reserved, flags u8 (FLAG_SESSION), reserved u8
+
+The logger appends to the same file after every power cycle, and millis()
+starts again at 0, so each boot begins a session. Version 2 logs write a
+marker record at every boot; in version 1 logs a session starts wherever
+millis drops by more than WRAP_WINDOW_MS, because a real 2**32 wrap only
+moves it forward by a few readings' worth. Every session is timed from its
+own start.
+
+open_log memory-maps the records as a numpy structured array, so opening a
+day's log reads nothing but the header; the sensor formulas of the sketch are
+then applied column-wise to the raw ADC values.
+
+    python binary_log.py LOG.BIN --lat 60.645 --lon 17.845 \\
+        --start "2024-06-01 09:30" -o cast.parquet
+"""
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from serial_log import KPA_PER_M, MEASUREMENTS
+
+MAGIC = b"LWQ1"
+VERSIONS = (1, 2)
+
+HEADER_DTYPE = np.dtype([
+    ("magic", "S4"),
+    ("version", "<u2"),
+    ("record_size", "<u2"),
+    ("start_unix", "<u4"),
+    ("reserved", "<u4"),
+])
+RECORD_DTYPE = np.dtype([
+    ("millis", "<u4"),
+    ("pressure_adc", "<u2"),
+    ("tds_adc", "<u2"),
+    ("do_adc", "<u2"),
+    ("ph_adc_sum", "<u2"),
+    ("temp_raw", "<i2"),
+    ("flags", "u1"),
+    ("reserved", "u1"),
+])
+
+FLAG_PRESSURE_OK = 0x01
+FLAG_TEMP_VALID = 0x02
+FLAG_SESSION = 0x80
+
+# largest step across millis() wrapping at 2**32 that is still the same session
+WRAP_WINDOW_MS = 3_600_000
+
+# constants of the sketch
+VREF = 3.3
+ADC_RES = 4096
+PRESSURE_OFFSET = 0.491  # V, from calibration
+PRESSURE_KPA_PER_V = 400
+PH_READINGS = 6
+PH_OFFSET = 0.12
+DO_OFFSET = 0.2325
+CAL1_V = 1600  # mV at CAL1_T
+CAL1_T = 25
+DO_TABLE = np.array([
+    14460, 14220, 13820, 13440, 13090, 12740, 12420, 12110, 11810, 11530,
+    11260, 11010, 10770, 10530, 10300, 10080, 9860, 9660, 9460, 9270,
+    9080, 8900, 8730, 8570, 8410, 8250, 8110, 7960, 7820, 7690,
+    7560, 7430, 7300, 7180, 7070, 6950, 6840, 6730, 6630, 6530, 6410,
+])
+
+
+def read_header(path):
+    """Header of a binary log as a dict (ValueError if it isn't one)."""
+    header = np.fromfile(path, dtype=HEADER_DTYPE, count=1)
+    if len(header) == 0 or header["magic"][0] != MAGIC:
+        raise ValueError(f"{path} is not a binary sensor log")
+    header = {name: header[name][0].item() for name in HEADER_DTYPE.names}
+    if header["version"] not in VERSIONS or header["record_size"] != RECORD_DTYPE.itemsize:
+        raise ValueError(f"unsupported log version {header['version']} "
+                         f"(record size {header['record_size']})")
+    return header
+
+
+def open_log(path):
+    """
+    (header, records) of a binary log, records memory-mapped read-only.
+    A partly written last record (logger switched off mid-write) is ignored.
+    """
+    header = read_header(path)
+    with open(path, "rb") as f:
+        f.seek(0, 2)
+        n = (f.tell() - HEADER_DTYPE.itemsize) // RECORD_DTYPE.itemsize
+    if n == 0:
+        return header, np.zeros(0, dtype=RECORD_DTYPE)
+    records = np.memmap(path, dtype=RECORD_DTYPE, mode="r", offset=HEADER_DTYPE.itemsize, shape=(n,))
+    return header, records
+
+
+def sessions(records):
+    """
+    Session number (from 0) of every record: a new one at each marker and
+    wherever millis drops by more than WRAP_WINDOW_MS (a reboot without a
+    marker, version 1 logs).
+    """
+    if len(records) == 0:
+        return np.zeros(0, dtype=np.int64)
+    millis = records["millis"].astype(np.int64)
+    drop = np.diff(millis)
+    reset = (drop < 0) & (drop % (1 << 32) > WRAP_WINDOW_MS)
+    new = np.concatenate([[True], reset]) | ((records["flags"] & FLAG_SESSION) != 0)
+    new[0] = True
+    return np.cumsum(new) - 1
+
+
+def session_starts(header, records, session, start=None):
+    """
+    Start time of every session (datetime64[ns], NaT where unknown): from
+    start (one time for the first session, or a list with one per session),
+    else from the session's marker, else the header's start time for the
+    first session.
+    """
+    n = int(session[-1]) + 1 if len(session) else 0
+    starts = np.full(n, np.datetime64("NaT"), dtype="datetime64[ns]")
+    if header["start_unix"] and n:
+        starts[0] = pd.Timestamp(header["start_unix"], unit="s").to_datetime64()
+    marker = np.flatnonzero((records["flags"] & FLAG_SESSION) != 0)
+    # the marker's start time sits where a record has its pressure and TDS ADC
+    start_unix = records["pressure_adc"][marker].astype(np.int64) | (records["tds_adc"][marker].astype(np.int64) << 16)
+    known = start_unix > 0
+    starts[session[marker][known]] = pd.to_datetime(start_unix[known], unit="s").to_numpy()
+    if start is not None:
+        given = [start] if isinstance(start, (str, pd.Timestamp)) or not np.iterable(start) else list(start)
+        for i, t in enumerate(given[:n]):
+            if t is not None:
+                starts[i] = pd.Timestamp(t).to_datetime64()
+    return starts
+
+
+def elapsed_ms(millis, session=None):
+    """
+    Milliseconds since the first record (of its session, given session),
+    across millis() wrapping at 2**32.
+    """
+    step = np.diff(millis.astype(np.int64)) % (1 << 32)
+    total = np.concatenate([[0], np.cumsum(step)])
+    if session is None or len(total) == 0:
+        return total
+    first = np.flatnonzero(np.concatenate([[True], np.diff(session) != 0]))
+    return total - np.repeat(total[first], np.diff(np.append(first, len(total))))
+
+
+def to_physical(records):
+    """
+    Sensor values of the records with the sketch's formulas, as a DataFrame of
+    depth and the measurements (temperature is NaN where no valid reading).
+
+    The sketch computes DO from (uint32_t)VREF, i.e. 3 V instead of 3300 mV,
+    which makes its printed DO almost constant; here the millivolts are used
+    as in the sensor's reference code.
+    """
+    temp_ok = (records["flags"] & FLAG_TEMP_VALID) != 0
+    temperature = np.where(temp_ok, records["temp_raw"] / 16.0, np.nan)
+    # like the sketch: compensate with the last valid temperature, 25 degC before the first
+    temp_c = pd.Series(temperature).ffill().fillna(25.0).to_numpy()
+
+    pressure_kpa = (records["pressure_adc"] * VREF / ADC_RES - PRESSURE_OFFSET) * PRESSURE_KPA_PER_V
+
+    tds_v = records["tds_adc"] * VREF / ADC_RES / (1.0 + 0.02 * (temp_c - 25.0))
+    tds = (133.42 * tds_v ** 3 - 255.86 * tds_v ** 2 + 857.39 * tds_v) * 0.5
+
+    ph_v = records["ph_adc_sum"] * VREF / ADC_RES / PH_READINGS
+    ph = 3.5 * ph_v + PH_OFFSET + (temp_c - 25.0) * 0.03
+
+    t_idx = np.clip(temp_c.astype(np.int64), 0, len(DO_TABLE) - 1)
+    mv = records["do_adc"].astype(np.int64) * int(VREF * 1000) // ADC_RES
+    v_sat = CAL1_V + 35 * t_idx - CAL1_T * 35
+    dissolved_oxygen = (mv * DO_TABLE[t_idx] // v_sat) / 1000.0 + DO_OFFSET
+
+    return pd.DataFrame({
+        "depth": np.maximum(pressure_kpa / KPA_PER_M, 0).astype(np.float32),
+        "temperature": temperature.astype(np.float32),
+        "TDS": tds.astype(np.float32),
+        "pH": ph.astype(np.float32),
+        "dissolved_oxygen": dissolved_oxygen.astype(np.float32),
+    })
+
+
+def read_binary_log(path, lat, lon, start=None, keep_empty=False):
+    """
+    Binary log as a DataFrame in the dashboard schema.
+
+    lat/lon are the position of the cast (the logger has no GPS). Timestamps
+    are the start of each session (see session_starts; start is one time or
+    a list with one per session) plus the logger's millis() since the
+    session began. Sessions without a known start get NaT; with no start at
+    all there is no timestamp column. Readings taken before the pressure was
+    stable carry no measurements and are dropped unless keep_empty (then
+    their measurements are NaN). Session markers are never rows.
+    """
+    header, records = open_log(path)
+    session = sessions(records)
+    starts = session_starts(header, records, session, start)
+
+    frame = to_physical(records)
+    ok = (records["flags"] & FLAG_PRESSURE_OK) != 0
+    reading = (records["flags"] & FLAG_SESSION) == 0
+    frame.loc[~ok, MEASUREMENTS] = np.nan
+    frame.insert(0, "latitude", np.full(len(frame), lat))
+    frame.insert(1, "longitude", np.full(len(frame), lon))
+    if not np.isnat(starts).all():
+        frame["timestamp"] = starts[session] + elapsed_ms(records["millis"], session).astype("timedelta64[ms]")
+    keep = reading & ok if not keep_empty else reading
+    return frame[keep].reset_index(drop=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Convert a combined_sensor_code.ino binary log to the dashboard CSV.")
+    parser.add_argument("log", help="binary log (LOG.BIN)")
+    parser.add_argument("--lat", type=float, required=True, help="latitude of the cast")
+    parser.add_argument("--lon", type=float, required=True, help="longitude of the cast")
+    parser.add_argument("--start", nargs="+",
+                        help="date/time the logger was switched on, e.g. '2024-06-01 09:30'; "
+                             "one per session if it was power cycled")
+    parser.add_argument("--keep-empty", action="store_true", help="keep readings without measurements")
+    parser.add_argument("-o", "--output", required=True, help="CSV (.gz/.zst compress it) or .parquet to write")
+    args = parser.parse_args(argv)
+
+    frame = read_binary_log(args.log, args.lat, args.lon, args.start, keep_empty=args.keep_empty)
+    if args.output.endswith(".parquet"):
+        frame.to_parquet(args.output, index=False)
+    else:
+        frame.to_csv(args.output, index=False)
+    print(f"wrote {len(frame)} rows to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,315 @@
+"""
+Local survey catalog.
+
+Every survey saved from the Upload page goes into one SQLite file, so it
+survives browser refreshes, is shared between sessions and can be queried
+across surveys. The pages then load only the slice they need (one lake, a
+month range, optionally a lat/lon box) instead of re-uploading whole CSVs.
+
+Each survey row keeps its time range and lat/lon bounding box, so a slice
+query first prunes whole surveys and then reads measurements through the
+(lake, time) or (lake, lat, lon) index.
+
+Every lake has one fixed x/y origin (the centroid of its first survey), so
+slices of the same lake always come back on the same local plane.
+"""
+import hashlib
+import os
+import sqlite3
+import time
+
+import numpy as np
+import pandas as pd
+
+import ingest
+
+DEFAULT_PATH = os.environ.get(
+    "LAKE_CATALOG", os.path.join(os.path.dirname(os.path.abspath(__file__)), "lake_catalog.db")
+)
+
+MEASUREMENT_COLUMNS = ["pH", "temperature", "turbidity", "dissolved_oxygen", "TDS"]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS lakes (
+    lake_id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE,
+    origin_lat REAL,
+    origin_lon REAL
+);
+CREATE TABLE IF NOT EXISTS surveys (
+    survey_id INTEGER PRIMARY KEY,
+    lake_id INTEGER NOT NULL REFERENCES lakes(lake_id),
+    name TEXT,
+    digest TEXT NOT NULL UNIQUE,
+    ingested_at REAL NOT NULL,
+    n_rows INTEGER NOT NULL,
+    t_min INTEGER,
+    t_max INTEGER,
+    lat_min REAL NOT NULL,
+    lat_max REAL NOT NULL,
+    lon_min REAL NOT NULL,
+    lon_max REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS surveys_lake_time ON surveys (lake_id, t_min, t_max);
+CREATE TABLE IF NOT EXISTS measurements (
+    survey_id INTEGER NOT NULL REFERENCES surveys(survey_id),
+    lake_id INTEGER NOT NULL,
+    ts INTEGER,
+    latitude REAL NOT NULL,
+    longitude REAL NOT NULL,
+    depth REAL NOT NULL,
+    pH REAL,
+    temperature REAL,
+    turbidity REAL,
+    dissolved_oxygen REAL,
+    TDS REAL,
+    num_sats INTEGER
+);
+CREATE INDEX IF NOT EXISTS measurements_lake_time ON measurements (lake_id, ts);
+CREATE INDEX IF NOT EXISTS measurements_lake_pos ON measurements (lake_id, latitude, longitude);
+"""
+
+INSERT_ROWS = 200_000
+
+# what NaT turned into before missing timestamps were stored as NULL
+NAT_EPOCH = np.iinfo(np.int64).min
+
+
+def connect(path=DEFAULT_PATH):
+    """Open (and if needed create) the catalog database."""
+    con = sqlite3.connect(path)
+    con.executescript(SCHEMA)
+    # catalogs created before lakes had an origin
+    if "origin_lat" not in [row[1] for row in con.execute("PRAGMA table_info(lakes)")]:
+        con.execute("ALTER TABLE lakes ADD COLUMN origin_lat REAL")
+        con.execute("ALTER TABLE lakes ADD COLUMN origin_lon REAL")
+    # surveys saved with missing timestamps as NAT_EPOCH: NULL those and redo their time range
+    bad = [row[0] for row in con.execute(
+        "SELECT survey_id FROM surveys WHERE t_min = ? OR t_max = ?", (NAT_EPOCH, NAT_EPOCH))]
+    if bad:
+        marks = ", ".join("?" * len(bad))
+        con.execute(f"UPDATE measurements SET ts = NULL WHERE ts = ? AND survey_id IN ({marks})", [NAT_EPOCH] + bad)
+        con.execute(
+            "UPDATE surveys SET"
+            " t_min = (SELECT MIN(ts) FROM measurements m WHERE m.survey_id = surveys.survey_id),"
+            " t_max = (SELECT MAX(ts) FROM measurements m WHERE m.survey_id = surveys.survey_id)"
+            f" WHERE survey_id IN ({marks})", bad,
+        )
+        con.commit()
+    return con
+
+
+def _to_epoch(ts):
+    """pandas timestamps -> unix seconds (None stays None)."""
+    if ts is None:
+        return None
+    return int(pd.Timestamp(ts).timestamp())
+
+
+def add_survey(data, lake, digest, name=None, path=DEFAULT_PATH):
+    """
+    Store a cleaned survey (as returned by ingest.load_survey) under lake.
+
+    digest is the content hash of the source file; a survey that is already in
+    the catalog is not stored twice. Returns (survey_id, added).
+    """
+    con = connect(path)
+    try:
+        row = con.execute("SELECT survey_id FROM surveys WHERE digest = ?", (digest,)).fetchone()
+        if row is not None:
+            return row[0], False
+
+        con.execute("INSERT OR IGNORE INTO lakes (name) VALUES (?)", (lake,))
+        lake_id = con.execute("SELECT lake_id FROM lakes WHERE name = ?", (lake,)).fetchone()[0]
+        # the first survey of a lake fixes its x/y origin
+        origin = data.attrs.get("origin") or ingest.centroid(data["latitude"], data["longitude"])
+        con.execute(
+            "UPDATE lakes SET origin_lat = ?, origin_lon = ? WHERE lake_id = ? AND origin_lat IS NULL",
+            (origin[0], origin[1], lake_id),
+        )
+
+        has_time = "timestamp" in data.columns
+        if has_time:
+            # blank timestamp cells are NaT: NULL in the table, left out of the survey's time range
+            stamps = data["timestamp"].to_numpy("datetime64[s]")
+            valid = ~np.isnat(stamps)
+            seconds = stamps[valid].astype("int64")
+            ts = np.where(valid, stamps.astype("int64"), None)
+        cur = con.execute(
+            "INSERT INTO surveys (lake_id, name, digest, ingested_at, n_rows, t_min, t_max,"
+            " lat_min, lat_max, lon_min, lon_max) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                lake_id, name, digest, time.time(), len(data),
+                int(seconds.min()) if has_time and len(seconds) else None,
+                int(seconds.max()) if has_time and len(seconds) else None,
+                float(data["latitude"].min()), float(data["latitude"].max()),
+                float(data["longitude"].min()), float(data["longitude"].max()),
+            ),
+        )
+        survey_id = cur.lastrowid
+
+        # columns as python lists, written in blocks so huge surveys don't
+        # build one giant list of tuples
+        n = len(data)
+        cols = [
+            np.full(n, survey_id), np.full(n, lake_id),
+            ts if has_time else np.full(n, None),
+            data["latitude"].to_numpy(), data["longitude"].to_numpy(), data["depth"].to_numpy(),
+        ]
+        for c in MEASUREMENT_COLUMNS + ["num_sats"]:
+            cols.append(data[c].to_numpy() if c in data.columns else np.full(n, None))
+        for start in range(0, n, INSERT_ROWS):
+            block = zip(*(c[start:start + INSERT_ROWS].tolist() for c in cols))
+            con.executemany(
+                "INSERT INTO measurements (survey_id, lake_id, ts, latitude, longitude, depth,"
+                " pH, temperature, turbidity, dissolved_oxygen, TDS, num_sats)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                block,
+            )
+        con.commit()
+        return survey_id, True
+    finally:
+        con.close()
+
+
+def lakes(path=DEFAULT_PATH):
+    """
+    One row per lake: name, number of surveys and rows, time range and bbox.
+    Times are pandas timestamps (NaT if no survey of the lake had timestamps).
+    """
+    con = connect(path)
+    try:
+        df = pd.read_sql_query(
+            "SELECT l.name AS lake, COUNT(*) AS surveys, SUM(s.n_rows) AS rows,"
+            " MIN(s.t_min) AS t_min, MAX(s.t_max) AS t_max,"
+            " MIN(s.lat_min) AS lat_min, MAX(s.lat_max) AS lat_max,"
+            " MIN(s.lon_min) AS lon_min, MAX(s.lon_max) AS lon_max,"
+            " MAX(s.survey_id) AS last_survey"
+            " FROM surveys s JOIN lakes l USING (lake_id) GROUP BY l.name ORDER BY l.name",
+            con,
+        )
+    finally:
+        con.close()
+    for c in ("t_min", "t_max"):
+        df[c] = pd.to_datetime(df[c], unit="s")
+    return df
+
+
+def lake_origin(con, lake):
+    """(lat, lon) x/y origin of lake, fixed from its surveys' centroid if not set yet."""
+    row = con.execute("SELECT lake_id, origin_lat, origin_lon FROM lakes WHERE name = ?", (lake,)).fetchone()
+    if row is None:
+        return None
+    lake_id, lat, lon = row
+    if lat is None:
+        lat, lon = con.execute(
+            "SELECT AVG(latitude), AVG(longitude) FROM measurements WHERE lake_id = ?", (lake_id,)
+        ).fetchone()
+        if lat is None:
+            return None
+        con.execute("UPDATE lakes SET origin_lat = ?, origin_lon = ? WHERE lake_id = ?", (lat, lon, lake_id))
+        con.commit()
+    return lat, lon
+
+
+def _slice_where(lake, start, end, bbox, prefix=""):
+    """WHERE clause + params shared by the survey and measurement queries."""
+    p = prefix
+    where = [f"{p}lake_id = (SELECT lake_id FROM lakes WHERE name = ?)"]
+    params = [lake]
+    if prefix == "s.":
+        # survey level: keep surveys whose ranges overlap the slice
+        if start is not None:
+            where.append("s.t_max >= ?")
+            params.append(_to_epoch(start))
+        if end is not None:
+            where.append("s.t_min < ?")
+            params.append(_to_epoch(end))
+        if bbox is not None:
+            lat_min, lat_max, lon_min, lon_max = bbox
+            where.append("s.lat_max >= ? AND s.lat_min <= ? AND s.lon_max >= ? AND s.lon_min <= ?")
+            params += [lat_min, lat_max, lon_min, lon_max]
+    else:
+        if start is not None:
+            where.append("ts >= ?")
+            params.append(_to_epoch(start))
+        if end is not None:
+            where.append("ts < ?")
+            params.append(_to_epoch(end))
+        if bbox is not None:
+            lat_min, lat_max, lon_min, lon_max = bbox
+            where.append("latitude BETWEEN ? AND ? AND longitude BETWEEN ? AND ?")
+            params += [lat_min, lat_max, lon_min, lon_max]
+    return " AND ".join(where), params
+
+
+def slice_surveys(lake, start=None, end=None, bbox=None, path=DEFAULT_PATH):
+    """Surveys of lake overlapping [start, end) and bbox (lat_min, lat_max, lon_min, lon_max)."""
+    where, params = _slice_where(lake, start, end, bbox, prefix="s.")
+    con = connect(path)
+    try:
+        return pd.read_sql_query(
+            f"SELECT s.survey_id, s.name, s.digest, s.n_rows FROM surveys s WHERE {where}"
+            " ORDER BY s.survey_id",
+            con, params=params,
+        )
+    finally:
+        con.close()
+
+
+def slice_digest(lake, start=None, end=None, bbox=None, path=DEFAULT_PATH):
+    """
+    Stable identity of a slice: changes only when the query or the set of
+    surveys it touches changes. Used like a file digest for caching.
+    """
+    surveys = slice_surveys(lake, start, end, bbox, path)
+    key = repr((lake, _to_epoch(start), _to_epoch(end), bbox, surveys["digest"].tolist()))
+    return hashlib.blake2b(key.encode(), digest_size=16).hexdigest()
+
+
+def load_slice(lake, start=None, end=None, bbox=None, parse_time=False, path=DEFAULT_PATH):
+    """
+    Measurements of one lake within [start, end) and bbox, cleaned like an
+    upload (see ingest.load_survey) and projected around the lake's origin.
+    Returns (data, info).
+    """
+    surveys = slice_surveys(lake, start, end, bbox, path)
+    where, params = _slice_where(lake, start, end, bbox)
+    ids = surveys["survey_id"].tolist()
+    con = connect(path)
+    try:
+        data = pd.read_sql_query(
+            "SELECT ts, latitude, longitude, depth, pH, temperature, turbidity,"
+            " dissolved_oxygen, TDS, num_sats FROM measurements"
+            f" WHERE {where} AND survey_id IN ({','.join('?' * len(ids)) or 'NULL'})"
+            " ORDER BY survey_id, rowid",
+            con, params=params + ids,
+        )
+        origin = lake_origin(con, lake)
+    finally:
+        con.close()
+
+    info = {"removed": 0, "has_time": False, "time_error": None}
+    # drop measurement columns none of the surveys had
+    data = data.dropna(axis=1, how="all")
+    if "ts" in data.columns:
+        data["timestamp"] = pd.to_datetime(data.pop("ts"), unit="s")
+    data = data.astype({c: t for c, t in ingest.CSV_DTYPES.items() if c in data.columns}, copy=False)
+    # surveys without num_sats leave gaps; the column then stays float like in ingest.CSV_DTYPES
+    if "num_sats" in data.columns and data["num_sats"].notna().all():
+        data["num_sats"] = data["num_sats"].astype("uint8")
+    return ingest.finish_survey(data, info, parse_time=parse_time, origin=origin)
+
+
+def month_starts(t_min, t_max):
+    """First day of every month between two timestamps, as YYYY-MM strings."""
+    if pd.isna(t_min) or pd.isna(t_max):
+        return []
+    return [p.strftime("%Y-%m") for p in pd.period_range(t_min, t_max, freq="M")]
+
+
+def month_range(first, last):
+    """[start, end) timestamps covering the months first..last (YYYY-MM)."""
+    start = pd.Timestamp(first + "-01")
+    end = pd.Timestamp(last + "-01") + pd.offsets.MonthBegin(1)
+    return start, end
@@ -0,0 +1,316 @@
+"""
+Depth-binned statistics that can be updated with new rows.
+
+Measurements are summarised once into fixed 0.1 m base bins (right-closed,
+like pd.cut): count, mean, M2 (sum of squared deviations), min, max and a
+value histogram for the median. All of these merge by simple sums / min /
+max, so the per-depth table for any bin width that is a multiple of 0.1 m is
+merged from the base bins in time proportional to the number of bins, not
+rows: neither changing the width nor appending a few casts re-bins the
+whole survey. The whole-survey summary (overall) is merged from the same bins.
+
+The histogram is a quantile sketch: SKETCH_BUCKETS buckets per base bin with
+a power-of-two width, aligned to multiples of the width and shared by all
+depths of a feature. When new values don't fit, neighbouring buckets are
+merged (width doubled) until they do, so building from the whole survey or
+appending it in parts ends with the same buckets. A median is off by less
+than one bucket, at most 1/256 of the feature's value range.
+"""
+import numpy as np
+import pandas as pd
+
+BASE_BIN = 0.1
+SKETCH_BUCKETS = 512
+
+
+def base_bin_index(depth):
+    """
+    Index i of the base bin (i*0.1, (i+1)*0.1] holding each depth. Depths
+    must be finite (see finite_depth); NaN would turn into a huge index.
+    """
+    # rounding first so 0.3 (stored as 0.30000001) stays in (0.2, 0.3]
+    scaled = np.round(np.asarray(depth, dtype=np.float64) / BASE_BIN, 6)
+    return np.ceil(scaled).astype(np.int64) - 1
+
+
+def finite_depth(depth):
+    """
+    depth as float64 and a mask of its finite entries. Rows without a depth
+    are left out of the bins, like pd.cut does.
+    """
+    depth = np.asarray(depth, dtype=np.float64)
+    return depth, np.isfinite(depth)
+
+
+def bins_per_width(bin_width):
+    """Base bins per displayed bin of bin_width metres (widths are rounded to 0.1 m)."""
+    return max(1, int(round(bin_width / BASE_BIN)))
+
+
+def bin_labels(first_bin, n_bins, bin_width):
+    """Labels like '1.2-2.2 m' for n_bins bins starting at base bin first_bin."""
+    m = bins_per_width(bin_width)
+    starts = (first_bin + np.arange(n_bins) * m) * BASE_BIN
+    return [f"{round(b, 1)}-{round(b + m * BASE_BIN, 1)} m" for b in starts]
+
+
+def sketch_exponent(v_min, v_max, exponent=None):
+    """
+    Smallest power-of-two bucket width 2**e (e >= exponent) for which
+    [v_min, v_max] spans at most SKETCH_BUCKETS aligned buckets. Value
+    histograms built with it (bucket floor(v / 2**e) - floor(v_min / 2**e))
+    can be read with sketch_quantile.
+    """
+    span = v_max - v_min
+    if exponent is None:
+        # 2**e below span / SKETCH_BUCKETS never fits, so start just under it
+        exponent = int(np.ceil(np.log2(span / SKETCH_BUCKETS))) - 1 if span > 0 else -30
+    while np.floor(v_max / 2.0 ** exponent) - np.floor(v_min / 2.0 ** exponent) >= SKETCH_BUCKETS:
+        exponent += 1
+    return exponent
+
+
+def _sketch_rank(hist, cum, first, exponent, rank):
+    """Estimated value of the given 0-based rank in each row of a value histogram."""
+    rows = np.arange(len(hist))
+    k = np.minimum((cum <= rank[:, None]).sum(axis=1), hist.shape[1] - 1)
+    in_bucket = hist[rows, k].astype(np.float64)
+    before = cum[rows, k] - in_bucket
+    # the c values of a bucket are taken as evenly spread over it
+    with np.errstate(invalid="ignore", divide="ignore"):
+        frac = np.where(in_bucket > 0, (rank - before + 0.5) / in_bucket, 0.5)
+    return (first + k + frac) * 2.0 ** exponent
+
+
+def sketch_quantile(hist, first, exponent, q, lo=None, hi=None):
+    """
+    q-quantile of each row of a (merged) value histogram whose bucket k
+    covers [(first + k) * 2**e, (first + k + 1) * 2**e), interpolated
+    between the two nearest ranks like np.quantile. lo/hi (the exact min/max
+    of each row) clip the result, which makes it exact for rows holding a
+    single distinct value. Empty rows give NaN.
+    """
+    n = hist.sum(axis=1).astype(np.float64)
+    cum = np.cumsum(hist, axis=1).astype(np.float64)
+    pos = q * np.maximum(n - 1, 0)
+    below, above = np.floor(pos), np.ceil(pos)
+    v_below = _sketch_rank(hist, cum, first, exponent, below)
+    v_above = _sketch_rank(hist, cum, first, exponent, above)
+    value = v_below + (pos - below) * (v_above - v_below)
+    if lo is not None:
+        value = np.clip(value, lo, hi)
+    return np.where(n > 0, value, np.nan)
+
+
+def merge_moments(count, mean, m2, axis):
+    """
+    Merge per-bin (count, mean, M2) along axis into (n, mean, std); mean is
+    NaN where n is 0 and std where n < 2 (ddof=1, like pandas).
+    """
+    n = count.sum(axis=axis)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        total_mean = (count * mean).sum(axis=axis) / n
+        total_m2 = m2.sum(axis=axis) + (count * (mean - np.expand_dims(total_mean, axis)) ** 2).sum(axis=axis)
+        std = np.sqrt(total_m2 / (n - 1))
+    std[n < 2] = np.nan
+    total_mean[n == 0] = np.nan
+    return n, total_mean, std
+
+
+def cut_depth(depth, bin_width):
+    """
+    Depth bins as a Categorical, with the same edges and labels as
+    DepthBinStats.table for the same data (first bin at the shallowest point).
+    Missing depths get no bin (NaN), like pd.cut.
+    """
+    depth, finite = finite_depth(depth)
+    base = base_bin_index(depth[finite])
+    m = bins_per_width(bin_width)
+    first = base.min() if len(base) else 0
+    codes = np.full(len(depth), -1, dtype=np.int64)
+    codes[finite] = (base - first) // m
+    return pd.Categorical.from_codes(codes, bin_labels(first, codes.max() + 1, bin_width))
+
+
+class DepthBinStats:
+    """Running per-depth-bin statistics of some measurement columns."""
+
+    def __init__(self, features):
+        self.features = list(features)
+        n_feat = len(self.features)
+        self.first = 0  # base bin of row 0 of the arrays below
+        self.rows = np.zeros(0, dtype=np.int64)
+        self.count = np.zeros((0, n_feat), dtype=np.int64)
+        self.mean = np.zeros((0, n_feat))
+        self.m2 = np.zeros((0, n_feat))
+        self.min = np.zeros((0, n_feat))
+        self.max = np.zeros((0, n_feat))
+        # per feature: (rows, SKETCH_BUCKETS) counts, first bucket and width exponent
+        self.hist = [np.zeros((0, SKETCH_BUCKETS), dtype=np.uint32) for _ in self.features]
+        self.hist_first = [0] * n_feat
+        self.hist_exponent = [None] * n_feat
+
+    @classmethod
+    def from_frame(cls, data, features):
+        stats = cls(features)
+        stats.update(data)
+        return stats
+
+    def _grow(self, lo, hi):
+        """Extend the arrays so base bins lo..hi have a row."""
+        if len(self.rows) == 0:
+            self.first = lo
+        new_first = min(self.first, lo)
+        new_last = max(self.first + len(self.rows) - 1, hi)
+        before = self.first - new_first
+        after = new_last - (self.first + len(self.rows) - 1)
+        if before == 0 and after == 0:
+            return
+        pad = ((before, after), (0, 0))
+        self.rows = np.pad(self.rows, (before, after))
+        self.count = np.pad(self.count, pad)
+        self.mean = np.pad(self.mean, pad)
+        self.m2 = np.pad(self.m2, pad)
+        self.min = np.pad(self.min, pad, constant_values=np.inf)
+        self.max = np.pad(self.max, pad, constant_values=-np.inf)
+        self.hist = [np.pad(h, ((before, after), (0, 0))) for h in self.hist]
+        self.first = new_first
+
+    def _fit_sketch(self, j, v_min, v_max):
+        """Coarsen / shift feature j's value buckets so [v_min, v_max] fits too."""
+        old_exponent = self.hist_exponent[j]
+        if old_exponent is not None:
+            filled = self.count[:, j] > 0
+            if filled.any():
+                v_min = min(v_min, self.min[filled, j].min())
+                v_max = max(v_max, self.max[filled, j].max())
+        exponent = sketch_exponent(v_min, v_max, old_exponent)
+        first = int(np.floor(v_min / 2.0 ** exponent))
+        if old_exponent is not None and (exponent, first) != (old_exponent, self.hist_first[j]):
+            # old bucket a (absolute) lands in bucket a // 2**(exponent - old_exponent)
+            old = self.hist[j]
+            absolute = self.hist_first[j] + np.arange(SKETCH_BUCKETS)
+            target = (absolute >> (exponent - old_exponent)) - first
+            # buckets outside the value range are empty, clipping only keeps them in bounds
+            target = np.clip(target, 0, SKETCH_BUCKETS - 1)
+            new = np.zeros_like(old)
+            np.add.at(new, (slice(None), target), old)
+            self.hist[j] = new
+        self.hist_exponent[j] = exponent
+        self.hist_first[j] = first
+
+    def update(self, data):
+        """
+        Add the rows of data (features missing from data count as empty).
+        Rows without a depth are skipped.
+        """
+        if len(data) == 0:
+            return
+        depth, finite = finite_depth(data["depth"].to_numpy())
+        if not finite.all():
+            data = data[finite]
+            if len(data) == 0:
+                return
+        base = base_bin_index(depth[finite])
+        self._grow(base.min(), base.max())
+        pos = base - self.first
+        n_rows = len(self.rows)
+        self.rows += np.bincount(pos, minlength=n_rows)
+
+        for j, feature in enumerate(self.features):
+            if feature not in data.columns:
+                continue
+            v = data[feature].to_numpy(dtype=np.float64)
+            ok = ~np.isnan(v)
+            v, p = v[ok], pos[ok]
+            if len(v) == 0:
+                continue
+
+            # stats of the new rows per bin, then merged into the running
+            # ones (Chan et al.'s pairwise update, stable for large counts)
+            n_b = np.bincount(p, minlength=n_rows)
+            sum_b = np.bincount(p, weights=v, minlength=n_rows)
+            hit = n_b > 0
+            mean_b = np.zeros(n_rows)
+            mean_b[hit] = sum_b[hit] / n_b[hit]
+            m2_b = np.bincount(p, weights=(v - mean_b[p]) ** 2, minlength=n_rows)
+
+            n_a = self.count[:, j]
+            n = n_a + n_b
+            delta = mean_b - self.mean[:, j]
+            self.mean[hit, j] += delta[hit] * n_b[hit] / n[hit]
+            self.m2[hit, j] += m2_b[hit] + delta[hit] ** 2 * n_a[hit] * n_b[hit] / n[hit]
+            self.count[:, j] = n
+            np.minimum.at(self.min[:, j], p, v)
+            np.maximum.at(self.max[:, j], p, v)
+
+            self._fit_sketch(j, v.min(), v.max())
+            bucket = np.floor(v / 2.0 ** self.hist_exponent[j]).astype(np.int64) - self.hist_first[j]
+            self.hist[j] += np.bincount(
+                p * SKETCH_BUCKETS + bucket, minlength=n_rows * SKETCH_BUCKETS
+            ).reshape(n_rows, SKETCH_BUCKETS).astype(np.uint32)
+
+    def table(self, bin_width, features=None):
+        """
+        Per-depth statistics like
+        data.groupby(depth bin)[features].agg(["mean", "std", "min", "median", "max", "count"])
+        with bins of bin_width metres starting at the shallowest measurement.
+        """
+        features = self.features if features is None else list(features)
+        m = bins_per_width(bin_width)
+        filled = np.flatnonzero(self.rows)
+        if filled.size == 0:
+            # nothing binned (empty upload, period or filter): same columns, no rows
+            columns = pd.MultiIndex.from_product([features, ["mean", "std", "min", "median", "max", "count"]])
+            return pd.DataFrame(index=pd.Index([], dtype=object, name="depth_bin"), columns=columns, dtype=float)
+        lo, hi = filled[0], filled[-1]
+        n_bins = (hi - lo) // m + 1
+        # pad the base-bin arrays to whole displayed bins, then merge m at a time
+        span = slice(lo, min(lo + n_bins * m, len(self.rows)))
+        short = n_bins * m - (span.stop - span.start)
+
+        def blocks(arr, fill=0):
+            arr = np.pad(arr[span], ((0, short), (0, 0)), constant_values=fill)
+            return arr.reshape(n_bins, m, -1)
+
+        n, total_mean, std = merge_moments(blocks(self.count), blocks(self.mean), blocks(self.m2), axis=1)
+        mins = blocks(self.min, np.inf).min(axis=1)
+        maxs = blocks(self.max, -np.inf).max(axis=1)
+        mins[n == 0] = np.nan
+        maxs[n == 0] = np.nan
+
+        first_bin = self.first + lo
+        columns = {}
+        for feature in features:
+            j = self.features.index(feature)
+            if self.hist_exponent[j] is None:
+                medians = np.full(n_bins, np.nan)
+            else:
+                hist = blocks(self.hist[j]).sum(axis=1)
+                medians = sketch_quantile(hist, self.hist_first[j], self.hist_exponent[j], 0.5,
+                                          mins[:, j], maxs[:, j])
+            columns[(feature, "mean")] = total_mean[:, j]
+            columns[(feature, "std")] = std[:, j]
+            columns[(feature, "min")] = mins[:, j]
+            columns[(feature, "median")] = medians
+            columns[(feature, "max")] = maxs[:, j]
+            columns[(feature, "count")] = n[:, j]
+
+        index = pd.Index(bin_labels(first_bin, n_bins, bin_width), name="depth_bin")
+        return pd.DataFrame(columns, index=index)
+
+    def overall(self, features=None):
+        """
+        Whole-survey mean, std, min, max and count per feature (one row each),
+        merged from the bins instead of another pass over the rows.
+        """
+        features = self.features if features is None else list(features)
+        cols = [self.features.index(f) for f in features]
+        n, mean, std = merge_moments(self.count[:, cols], self.mean[:, cols], self.m2[:, cols], axis=0)
+        with np.errstate(invalid="ignore"):
+            mins = np.where(n > 0, self.min[:, cols].min(axis=0, initial=np.inf), np.nan)
+            maxs = np.where(n > 0, self.max[:, cols].max(axis=0, initial=-np.inf), np.nan)
+        return pd.DataFrame(
+            {"mean": mean, "std": std, "min": mins, "max": maxs, "count": n},
+            index=pd.Index(features, name="feature"),
+        )
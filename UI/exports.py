@@ -0,0 +1,90 @@
+"""
+Download payloads for the dashboard's export buttons.
+
+CSV is what everyone can open; Parquet keeps the dtypes, is a fraction of the
+size and reopens in milliseconds (see ingest.read_survey_parquet). Gzipped
+CSV is for large CSV downloads; the Upload page reads it back as well.
+
+Frames are written CHUNK_ROWS rows at a time, so a big export never holds the
+whole CSV text (or Arrow table) next to the encoded bytes. The buttons only
+call this once a download is asked for (app_cache.lazy_download).
+"""
+import gzip
+import io
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# label -> (file extension, mime type)
+EXPORT_FORMATS = {
+    "CSV": ("csv", "text/csv"),
+    "CSV (gzip)": ("csv.gz", "application/gzip"),
+    "Parquet": ("parquet", "application/vnd.apache.parquet"),
+}
+
+CHUNK_ROWS = 100_000
+
+
+def write(df, out, fmt="CSV", index=False, chunk_rows=CHUNK_ROWS):
+    """Write df to the binary file-like out in one of EXPORT_FORMATS, chunk_rows rows at a time."""
+    starts = range(0, max(len(df), 1), chunk_rows)
+    if fmt == "Parquet":
+        writer = None
+        for start in starts:
+            table = pa.Table.from_pandas(df.iloc[start:start + chunk_rows], preserve_index=index)
+            if writer is None:
+                writer = pq.ParquetWriter(out, table.schema, compression="zstd")
+            else:
+                # an all-missing chunk would otherwise come out as another type
+                table = table.cast(writer.schema)
+            writer.write_table(table)
+        writer.close()
+        return
+
+    target = gzip.GzipFile(fileobj=out, mode="wb", compresslevel=6, mtime=0) if fmt == "CSV (gzip)" else out
+    for start in starts:
+        chunk = df.iloc[start:start + chunk_rows].to_csv(index=index, header=start == 0)
+        target.write(chunk.encode("utf-8"))
+    if target is not out:
+        target.close()
+
+
+def to_bytes(df, fmt="CSV", index=False):
+    """Serialize df in one of EXPORT_FORMATS."""
+    out = io.BytesIO()
+    write(df, out, fmt, index=index)
+    return out.getvalue()
+
+
+def file_name(stem, fmt="CSV"):
+    """stem plus the extension for fmt, e.g. gp_predictions.parquet"""
+    return f"{stem}.{EXPORT_FORMATS[fmt][0]}"
+
+
+def mime(fmt="CSV"):
+    return EXPORT_FORMATS[fmt][1]
+
+
+def read_predictions(source):
+    """
+    Reopen an exported prediction set (Parquet, CSV or gzipped CSV, path or
+    file-like).
+    In-memory Parquet uploads are read without copying the buffer.
+    """
+    if hasattr(source, "read"):
+        head = source.read(4)
+        source.seek(0)
+    else:
+        with open(source, "rb") as f:
+            head = f.read(4)
+    if head == b"PAR1":
+        if hasattr(source, "getbuffer"):
+            source = pa.BufferReader(source.getbuffer())
+        return pq.read_table(source, memory_map=True).to_pandas()
+    return pd.read_csv(source, compression="gzip" if head[:2] == b"\x1f\x8b" else None)
+
+
+def prediction_outputs(pred_df):
+    """Measurement names in a prediction frame (the *_pred columns)."""
+    return [c[:-len("_pred")] for c in pred_df.columns if c.endswith("_pred")]
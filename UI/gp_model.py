@@ -0,0 +1,582 @@
+"""
+The multitask Gaussian process of the Predict page, without Streamlit.
+
+Both apps fit the same model: MultitaskExactGP (RBF kernel with ARD inside a
+multitask kernel of some rank) trained with Adam on a depth-stratified split
+and early-stopped on the validation RMSE, then conditioned on every row with
+the learned hyperparameters. The pages and benchmark.py call the functions
+here, so what is benchmarked is what the app runs. Full-batch L-BFGS can
+replace Adam; either way the hyperparameters of the best validation RMSE are
+kept, not those of the iteration where patience ran out. Training can start
+from the hyperparameters of an earlier model (init_state, e.g. last week's
+survey of the same lake) instead of the defaults and only fine-tune them.
+
+The exact GP costs O((rows x tasks)^3) per iteration, which rules out logger
+surveys of 50k+ rows. For those, MultitaskSVGP is a sparse variational GP:
+num_latents latent GPs (same RBF ARD kernel), each on its own learnable
+inducing points, mixed linearly into the tasks (LMC). train_variational fits
+it on minibatches from a DataLoader, one epoch per iteration, so an epoch
+costs O(rows x inducing^2) and memory doesn't grow with the survey. It needs
+no conditioning step and predicts through the same predict().
+
+In between, MultitaskSKIGP (KISS-GP) keeps exact inference but interpolates
+the RBF ARD kernel from a regular grid over the (x, y, depth) bounding box:
+K ~ W K_grid W^T with sparse cubic interpolation weights W and a Kronecker /
+Toeplitz K_grid, so a matrix-vector product is near-linear in the rows. The
+tasks are independent GPs (a batch, one kernel each) with per-task noise:
+the covariance stays block diagonal plus a diagonal, and gpytorch solves it
+with preconditioned conjugate gradients. Inside a MultitaskKernel with the
+default likelihood it would become a Kronecker product plus noise, whose
+solve eigendecomposes the rows x rows factor densely (O(rows^3) again).
+Task correlations are what that gives up. It works on at most SKI_MAX_DIMS
+inputs (the grid has grid_size^dims points).
+
+Prediction goes through the grid in batches: the posterior cache is built on
+the first batch and reused, and the cross-covariance between a batch and the
+training rows (batch x tasks by rows x tasks) is kept to about
+PREDICT_CELLS entries instead of being built for the whole grid at once.
+"""
+import copy
+import re
+import time
+
+import gpytorch
+import numpy as np
+import torch
+
+import profiling
+
+MAX_ITERS = 500
+LEARNING_RATE = 0.1
+OPTIMIZERS = ("adam", "lbfgs")
+# full-batch L-BFGS (strong Wolfe line search) converges in far fewer steps
+LBFGS_ITERS = 100
+LBFGS_LR = 1.0
+# relative change of the training loss below which L-BFGS has converged
+LBFGS_TOL = 1e-5
+DEPTH_STRATA = 10
+PREDICT_BATCH = 4096
+# float32 entries of one batch's cross-covariance (~64 MB)
+PREDICT_CELLS = 16_000_000
+
+# sparse variational mode, the default above EXACT_MAX_ROWS rows
+EXACT_MAX_ROWS = 2000
+MAX_EPOCHS = 100
+VARIATIONAL_LR = 0.01
+NUM_INDUCING = 256
+MINIBATCH = 1024
+# rows the per-epoch training RMSE is measured on
+RMSE_SAMPLE = 10_000
+
+# KISS-GP mode: grid points per input dimension, at most x, y, depth
+SKI_GRID = 32
+SKI_MAX_DIMS = 3
+# grid margin beyond the data's bounding box, as a share of its extent
+SKI_PADDING = 0.1
+# GridInterpolationKernel buffers (grid_0, grid_1, ..., has_initialized_grid):
+# the grid follows the survey's bounds, so warm_start never copies it from another model
+SKI_GRID_STATE = re.compile(r"grid(_\d+)?|full_grid|has_initialized_grid")
+
+
+class MultitaskExactGP(gpytorch.models.ExactGP):
+    def __init__(self, train_x, train_y, likelihood, num_tasks, rank):
+        super().__init__(train_x, train_y, likelihood)
+        self.mean_module = gpytorch.means.MultitaskMean(gpytorch.means.ConstantMean(), num_tasks=num_tasks)
+        # RBF kernel with ARD
+        base_kernel = gpytorch.kernels.ScaleKernel(
+            gpytorch.kernels.RBFKernel(ard_num_dims=train_x.shape[1])
+        )
+        self.covar_module = gpytorch.kernels.MultitaskKernel(base_kernel, num_tasks=num_tasks, rank=rank)
+        self.num_tasks = num_tasks
+        self.rank = rank
+
+    def forward(self, x):
+        mean_x = self.mean_module(x)
+        covar_x = self.covar_module(x)
+        return gpytorch.distributions.MultitaskMultivariateNormal(mean_x, covar_x)
+
+
+class MultitaskSKIGP(gpytorch.models.ExactGP):
+    """
+    One GP per task (a batch of num_tasks), each with an RBF ARD kernel
+    interpolated from a grid of grid_size points per input over grid_bounds
+    ((low, high) per input, by default ski_bounds(train_x)). Every point it
+    is evaluated at has to lie within grid_bounds. Takes a likelihood from
+    ski_likelihood, whose noise is diagonal.
+    """
+
+    def __init__(self, train_x, train_y, likelihood, num_tasks, grid_size=SKI_GRID, grid_bounds=None):
+        dims = train_x.shape[1]
+        if dims > SKI_MAX_DIMS:
+            raise ValueError(f"KISS-GP takes at most {SKI_MAX_DIMS} inputs, not {dims}")
+        super().__init__(train_x, train_y, likelihood)
+        batch = torch.Size([num_tasks])
+        grid_bounds = [tuple(b) for b in (grid_bounds or ski_bounds(train_x))]
+        self.mean_module = gpytorch.means.ConstantMean(batch_shape=batch)
+        self.covar_module = gpytorch.kernels.ScaleKernel(
+            gpytorch.kernels.GridInterpolationKernel(
+                gpytorch.kernels.RBFKernel(batch_shape=batch, ard_num_dims=dims),
+                grid_size=grid_size, num_dims=dims, grid_bounds=grid_bounds,
+            ),
+            batch_shape=batch,
+        )
+        self.num_tasks = num_tasks
+        self.grid_size = grid_size
+        self.grid_bounds = grid_bounds
+
+    def forward(self, x):
+        # (tasks, rows) batch -> (rows, tasks) multitask, block diagonal over the tasks
+        return gpytorch.distributions.MultitaskMultivariateNormal.from_batch_mvn(
+            gpytorch.distributions.MultivariateNormal(self.mean_module(x), self.covar_module(x))
+        )
+
+
+def ski_likelihood(num_tasks):
+    """
+    Likelihood of a MultitaskSKIGP: independent noise per task (rank 0), so
+    the noise adds a diagonal and the solves keep the interpolated structure.
+    """
+    return gpytorch.likelihoods.MultitaskGaussianLikelihood(num_tasks=num_tasks, rank=0)
+
+
+def ski_bounds(*arrays, padding=SKI_PADDING):
+    """
+    Grid bounds of a KISS-GP covering the rows of all arrays (e.g. the scaled
+    training rows and prediction grid): their bounding box, widened by padding.
+    """
+    X = torch.cat([torch.as_tensor(a, dtype=torch.float32) for a in arrays])
+    low, high = X.min(dim=0).values, X.max(dim=0).values
+    margin = (high - low).clamp_min(1e-6) * padding
+    return [(float(lo), float(hi)) for lo, hi in zip(low - margin, high + margin)]
+
+
+class MultitaskSVGP(gpytorch.models.ApproximateGP):
+    """
+    Sparse variational multitask GP: num_latents independent GPs on learnable
+    inducing points (inducing_points is (num_latents, m, dims)) mixed into
+    num_tasks outputs by a learned LMC matrix.
+    """
+
+    def __init__(self, inducing_points, num_tasks, num_latents):
+        batch = torch.Size([num_latents])
+        variational_distribution = gpytorch.variational.CholeskyVariationalDistribution(
+            inducing_points.size(-2), batch_shape=batch
+        )
+        variational_strategy = gpytorch.variational.LMCVariationalStrategy(
+            gpytorch.variational.VariationalStrategy(
+                self, inducing_points, variational_distribution, learn_inducing_locations=True
+            ),
+            num_tasks=num_tasks, num_latents=num_latents, latent_dim=-1,
+        )
+        super().__init__(variational_strategy)
+        self.mean_module = gpytorch.means.ConstantMean(batch_shape=batch)
+        # RBF kernel with ARD, one per latent GP
+        self.covar_module = gpytorch.kernels.ScaleKernel(
+            gpytorch.kernels.RBFKernel(batch_shape=batch, ard_num_dims=inducing_points.size(-1)),
+            batch_shape=batch,
+        )
+        self.num_tasks = num_tasks
+        self.num_latents = num_latents
+        self.num_inducing = inducing_points.size(-2)
+
+    def forward(self, x):
+        mean_x = self.mean_module(x)
+        covar_x = self.covar_module(x)
+        return gpytorch.distributions.MultivariateNormal(mean_x, covar_x)
+
+
+def is_variational(model):
+    return isinstance(model, MultitaskSVGP)
+
+
+def is_ski(model):
+    return isinstance(model, MultitaskSKIGP)
+
+
+def model_kind(model):
+    """"exact", "ski" or "variational"."""
+    if is_variational(model):
+        return "variational"
+    return "ski" if is_ski(model) else "exact"
+
+
+def stratified_split(depth, validation_split=0.2, num_bins=DEPTH_STRATA, seed=42):
+    """
+    (train, validation) row indices with the same share of validation rows
+    in each of num_bins depth strata.
+    """
+    depth = np.asarray(depth)
+    depth_bins = np.digitize(depth, bins=np.linspace(depth.min(), depth.max(), num_bins))
+    rng = np.random.RandomState(seed)
+    train_ratio = 1 - validation_split
+    train_idx, val_idx = [], []
+    for bin_idx in np.unique(depth_bins):
+        bin_indices = np.flatnonzero(depth_bins == bin_idx)
+        rng.shuffle(bin_indices)
+        split_point = int(train_ratio * len(bin_indices))
+        train_idx.append(bin_indices[:split_point])
+        val_idx.append(bin_indices[split_point:])
+    return np.concatenate(train_idx), np.concatenate(val_idx)
+
+
+class EvalSchedule:
+    """
+    When the training loops validate: every `every` iterations, in between
+    as soon as the training loss plateaus (relative change at most
+    plateau_tol, off by default), and on the last iteration.
+
+    Validating is most of an iteration's cost on small surveys (a prediction
+    on the validation rows, another on the training rows if their RMSE is
+    wanted). Patience still counts iterations, so with every=1 training stops
+    at the same iteration as validating every time.
+    """
+
+    def __init__(self, every=1, plateau_tol=None):
+        self.every = max(1, int(every))
+        self.plateau_tol = plateau_tol
+        self._loss = None
+
+    def due(self, i, loss, last=False):
+        """True if iteration i (from 0), whose training loss was loss, should validate."""
+        previous, self._loss = self._loss, loss
+        if last or (i + 1) % self.every == 0:
+            return True
+        if self.plateau_tol is None or previous is None:
+            return False
+        return abs(previous - loss) <= self.plateau_tol * max(abs(previous), 1e-12)
+
+
+def warm_start(model, likelihood, init_state):
+    """
+    Load init_state, (model state dict, likelihood state dict) of an earlier
+    model, into model and likelihood as a starting point. Entries whose name
+    or shape doesn't fit (another rank, other tasks) keep their defaults, and
+    a KISS-GP keeps its own grid (SKI_GRID_STATE): only the hyperparameters
+    carry over. Returns the number of entries loaded.
+    """
+    loaded = 0
+    for module, state in zip((model, likelihood), init_state):
+        own = module.state_dict()
+        fitting = {name: value for name, value in state.items()
+                   if name in own and own[name].shape == value.shape
+                   and not SKI_GRID_STATE.fullmatch(name.rsplit(".", 1)[-1])}
+        module.load_state_dict(fitting, strict=False)
+        loaded += len(fitting)
+    return loaded
+
+
+def train(X_train, Y_train, X_val, Y_val, task_std, rank=1, iters=None, patience=10, lr=None,
+          on_iteration=None, eval_every=1, plateau_tol=None, train_rmse=False, optimizer="adam", tol=None,
+          init_state=None, grid_size=None, grid_bounds=None):
+    """
+    Fit the hyperparameters on (X_train, Y_train), stopping once the
+    validation RMSE hasn't improved for patience iterations or the training
+    loss changes by at most tol (relative) in an iteration. The model ends
+    up with the hyperparameters of its best validation RMSE.
+
+    optimizer is "adam" (iters, lr and tol default to MAX_ITERS,
+    LEARNING_RATE and none) or "lbfgs", full-batch L-BFGS with a strong
+    Wolfe line search, one L-BFGS step per iteration (LBFGS_ITERS, LBFGS_LR,
+    LBFGS_TOL). task_std (per output, from the y scaler) turns the RMSEs into
+    original units. on_iteration(i) is called after every iteration, e.g.
+    for a progress bar. The validation RMSE is measured on the EvalSchedule
+    of eval_every and plateau_tol; train_rmse=True measures the training
+    RMSE along with it. init_state (see warm_start) starts from an earlier
+    model's hyperparameters. With grid_size the model is a MultitaskSKIGP
+    (rank is ignored) with grid_size points per input over grid_bounds,
+    which have to cover every point the model will predict at: pass
+    ski_bounds of all rows and the prediction points. The default, the
+    training and validation rows only, leaves out e.g. a prediction grid
+    starting at the surface above the shallowest cast.
+    Returns (model, likelihood, history), history a dict with
+      iterations       - iterations run
+      stopped_early    - True if patience ran out
+      converged        - True if the loss change fell below tol
+      best_iteration   - iteration (from 1) whose state the model has
+      best_val_rmse    - its validation RMSE over all tasks, original units (approx.)
+      seconds          - wall time of the whole loop
+      best_seconds     - wall time until best_iteration (time to converge)
+      evaluated        - the iterations (from 1) that were validated
+      val_rmse         - (evaluations, tasks) validation RMSE, original units
+      train_rmse       - (evaluations, tasks) training RMSE, original units, or None
+      iteration_seconds - wall time of each iteration (step + evaluation)
+      warm_started     - entries of init_state loaded (0 without one)
+    """
+    if optimizer not in OPTIMIZERS:
+        raise ValueError(f"optimizer must be one of {OPTIMIZERS}, not {optimizer!r}")
+    lbfgs = optimizer == "lbfgs"
+    iters = iters or (LBFGS_ITERS if lbfgs else MAX_ITERS)
+    lr = lr or (LBFGS_LR if lbfgs else LEARNING_RATE)
+    if tol is None and lbfgs:
+        tol = LBFGS_TOL
+
+    mode = "ski" if grid_size else "exact"
+    with profiling.stage("gp training", mode=mode, optimizer=optimizer) as rec:
+        num_tasks = Y_train.shape[1]
+        if grid_size:
+            likelihood = ski_likelihood(num_tasks)
+            model = MultitaskSKIGP(X_train, Y_train, likelihood, num_tasks=num_tasks, grid_size=grid_size,
+                                   grid_bounds=grid_bounds or ski_bounds(X_train, X_val))
+        else:
+            likelihood = gpytorch.likelihoods.MultitaskGaussianLikelihood(num_tasks=num_tasks)
+            model = MultitaskExactGP(X_train, Y_train, likelihood, num_tasks=num_tasks, rank=rank)
+        warm = warm_start(model, likelihood, init_state) if init_state is not None else 0
+        model.train()
+        likelihood.train()
+
+        mll = gpytorch.mlls.ExactMarginalLogLikelihood(likelihood, model)
+
+        def closure():
+            opt.zero_grad()
+            loss = -mll(model(X_train), Y_train)
+            loss.backward()
+            return loss
+
+        if lbfgs:
+            # max_iter=1: the loop below is the L-BFGS iteration, its curvature history lives in opt.
+            # max_eval would default to 1 as well, leaving the line search no evaluations
+            opt = torch.optim.LBFGS(model.parameters(), lr=lr, max_iter=1, max_eval=20, history_size=10,
+                                    line_search_fn="strong_wolfe")
+        else:
+            opt = torch.optim.Adam(model.parameters(), lr=lr)
+
+        def step():
+            model.train()
+            # the loss before the step, for both optimizers
+            return opt.step(closure).item()
+
+        history = _fit(step, model, likelihood, X_train, Y_train, X_val, Y_val, task_std, iters, patience,
+                       EvalSchedule(eval_every, plateau_tol), train_rmse, on_iteration, tol)
+        history["warm_started"] = warm
+        _record_training(rec, history, len(X_train))
+        if grid_size:
+            rec["grid_size"] = grid_size
+    return model, likelihood, history
+
+
+def _fit(step, model, likelihood, X_train, Y_train, X_val, Y_val, task_std, iters, patience, schedule,
+         train_rmse, on_iteration, tol=None):
+    """
+    The early-stopping loop of both training modes: step() runs one
+    iteration and returns its loss, validation follows schedule. Stops
+    when patience runs out or the loss changes by at most tol (relative),
+    then loads the state of the best validation RMSE into model and
+    likelihood.
+    """
+    task_std = np.maximum(np.asarray(task_std, dtype=np.float64), 1e-12)
+    if train_rmse:
+        # one prediction for both sets, so the predictive cache is built once per validation
+        sample = torch.randperm(len(X_train), generator=torch.Generator().manual_seed(0))[:RMSE_SAMPLE]
+        X_eval = torch.cat([X_val, X_train[sample]])
+        y_train = Y_train[sample].detach().cpu().numpy()
+    else:
+        X_eval = X_val
+    y_val = Y_val.detach().cpu().numpy()
+    history = {"iterations": 0, "stopped_early": False, "converged": False, "best_iteration": 0,
+               "seconds": 0.0, "best_seconds": 0.0, "evaluated": [], "val_rmse": [], "train_rmse": [],
+               "iteration_seconds": []}
+    best_rmse = float("inf")
+    best_iteration = 0
+    best_state = None
+    previous = None
+    began = time.perf_counter()
+
+    for i in range(iters):
+        start = time.perf_counter()
+        loss = step()
+        history["iterations"] = i + 1
+        converged = (tol is not None and previous is not None
+                     and abs(previous - loss) <= tol * max(abs(previous), 1e-12))
+        previous = loss
+
+        if schedule.due(i, loss, last=converged or i == iters - 1):
+            pred = _predict_mean(model, likelihood, X_eval)
+            pred_val = pred[:len(X_val)]
+            # RMSE per task, scaled units times each task's std
+            history["val_rmse"].append(np.sqrt(np.mean((pred_val - y_val) ** 2, axis=0)) * task_std)
+            if train_rmse:
+                pred_train = pred[len(X_val):]
+                history["train_rmse"].append(np.sqrt(np.mean((pred_train - y_train) ** 2, axis=0)) * task_std)
+            history["evaluated"].append(i + 1)
+
+            # overall approx in original units
+            val_rmse = float(np.sqrt(np.mean((pred_val - y_val) ** 2))) * float(np.mean(task_std))
+            if val_rmse < best_rmse:
+                best_rmse = val_rmse
+                best_iteration = i + 1
+                # hyperparameters (and variational parameters) only, not the training data
+                best_state = (copy.deepcopy(model.state_dict()), copy.deepcopy(likelihood.state_dict()))
+                history["best_seconds"] = time.perf_counter() - began
+        history["iteration_seconds"].append(time.perf_counter() - start)
+
+        if on_iteration is not None:
+            on_iteration(i)
+        if history["evaluated"] and history["evaluated"][-1] == i + 1 and i + 1 - best_iteration >= patience:
+            history["stopped_early"] = True
+            break
+        if converged:
+            history["converged"] = True
+            break
+
+    history["seconds"] = time.perf_counter() - began
+    history["best_iteration"] = best_iteration
+    history["best_val_rmse"] = best_rmse
+    if best_state is not None and best_iteration != history["iterations"]:
+        model.load_state_dict(best_state[0])
+        likelihood.load_state_dict(best_state[1])
+    # drops predictive caches of the state the loop ended in
+    model.train()
+    likelihood.train()
+    history["val_rmse"] = np.array(history["val_rmse"])
+    history["train_rmse"] = np.array(history["train_rmse"]) if train_rmse else None
+    return history
+
+
+def train_variational(X_train, Y_train, X_val, Y_val, task_std, num_latents=None, num_inducing=NUM_INDUCING,
+                      batch_size=MINIBATCH, epochs=MAX_EPOCHS, patience=10, lr=VARIATIONAL_LR,
+                      on_iteration=None, seed=0, eval_every=1, plateau_tol=None, train_rmse=False, tol=None,
+                      init_state=None):
+    """
+    Fit a MultitaskSVGP on (X_train, Y_train) with minibatch Adam on the
+    variational ELBO, stopping once the validation RMSE hasn't improved for
+    patience epochs (or the epoch loss changes by at most tol), and keep
+    the state of the best validation RMSE.
+
+    num_latents defaults to one latent GP per task. The inducing points start
+    at random training rows, or with init_state (see warm_start) where the
+    earlier model left them, along with its variational distribution and
+    hyperparameters. Returns (model, likelihood, history) like train,
+    with history["iterations"] counting epochs (the loss of an epoch is its
+    mean minibatch loss); train_rmse is measured on up to RMSE_SAMPLE
+    training rows.
+    """
+    with profiling.stage("gp training", mode="variational") as rec:
+        num_tasks = Y_train.shape[1]
+        num_latents = num_latents or num_tasks
+        generator = torch.Generator().manual_seed(seed)
+        m = min(num_inducing, len(X_train))
+        inducing = torch.stack([
+            X_train[torch.randperm(len(X_train), generator=generator)[:m]] for _ in range(num_latents)
+        ])
+        model = MultitaskSVGP(inducing.clone(), num_tasks, num_latents)
+        likelihood = gpytorch.likelihoods.MultitaskGaussianLikelihood(num_tasks=num_tasks)
+        warm = warm_start(model, likelihood, init_state) if init_state is not None else 0
+
+        optimizer = torch.optim.Adam(list(model.parameters()) + list(likelihood.parameters()), lr=lr)
+        mll = gpytorch.mlls.VariationalELBO(likelihood, model, num_data=len(X_train))
+        loader = torch.utils.data.DataLoader(
+            torch.utils.data.TensorDataset(X_train, Y_train), batch_size=batch_size, shuffle=True,
+            generator=generator,
+        )
+
+        def epoch():
+            model.train()
+            likelihood.train()
+            total = 0.0
+            for x_batch, y_batch in loader:
+                optimizer.zero_grad()
+                loss = -mll(model(x_batch), y_batch)
+                loss.backward()
+                optimizer.step()
+                total += loss.item() * len(x_batch)
+            return total / len(X_train)
+
+        history = _fit(epoch, model, likelihood, X_train, Y_train, X_val, Y_val, task_std, epochs, patience,
+                       EvalSchedule(eval_every, plateau_tol), train_rmse, on_iteration, tol)
+        history["warm_started"] = warm
+        _record_training(rec, history, len(X_train))
+        rec["inducing"] = m
+        rec["minibatch"] = batch_size
+    return model, likelihood, history
+
+
+def _predict_mean(model, likelihood, X, batch_size=None):
+    """
+    Predictive mean (numpy) of model at X, in eval mode and batches. No
+    variances are computed; an exact GP builds its mean cache on the first
+    batch and reuses it for the rest.
+    """
+    if len(X) == 0:
+        return np.empty((0, model.num_tasks), dtype=np.float32)
+    batch_size = batch_size or predict_batch_size(model)
+    model.eval()
+    likelihood.eval()
+    # the likelihood's noise doesn't change the mean
+    with torch.no_grad(), gpytorch.settings.skip_posterior_variances():
+        means = [model(X[start:start + batch_size]).mean.cpu().numpy()
+                 for start in range(0, len(X), batch_size)]
+    return np.concatenate(means)
+
+
+def _record_training(rec, history, n_rows):
+    """Iteration details of a training run on its profiling record."""
+    seconds = history["iteration_seconds"]
+    rec["rows"] = n_rows
+    rec["iterations"] = history["iterations"]
+    rec["evaluations"] = len(history["evaluated"])
+    rec["best_iteration"] = history["best_iteration"]
+    rec["converge_s"] = history["best_seconds"]
+    rec["converged"] = history["converged"]
+    rec["warm_started"] = history["warm_started"]
+    if seconds:
+        rec["iteration_mean_s"] = float(np.mean(seconds))
+        rec["iteration_max_s"] = float(np.max(seconds))
+    rec["iteration_seconds"] = [round(t, 5) for t in seconds]
+
+
+def condition(model, likelihood, X, Y):
+    """
+    The model conditioned on all of (X, Y) with model's learned
+    hyperparameters (no further optimisation), in eval mode. A variational
+    model summarises the data in its inducing points and is returned as is.
+    """
+    if is_variational(model):
+        model.eval()
+        likelihood.eval()
+        return model
+    with profiling.stage("condition", rows=len(X)):
+        if is_ski(model):
+            # on the same grid, so the interpolated kernel has the same hyperparameters
+            model_full = MultitaskSKIGP(X, Y, likelihood, num_tasks=model.num_tasks,
+                                        grid_size=model.grid_size, grid_bounds=model.grid_bounds)
+        else:
+            model_full = MultitaskExactGP(X, Y, likelihood, num_tasks=model.num_tasks, rank=model.rank)
+        model_full.load_state_dict(model.state_dict())
+        model_full.eval()
+        likelihood.eval()
+    return model_full
+
+
+def predict_batch_size(model):
+    """Grid points per prediction batch for model, between 64 and PREDICT_BATCH."""
+    if is_ski(model):
+        # a batch's covariance with the training rows is interpolated (sparse), never dense
+        return PREDICT_BATCH
+    # what each grid point is compared with: training rows or inducing points
+    n_train = model.num_inducing if is_variational(model) else len(model.train_inputs[0])
+    return int(np.clip(PREDICT_CELLS // max(n_train * model.num_tasks ** 2, 1), 64, PREDICT_BATCH))
+
+
+def predict(model, likelihood, X, batch_size=None):
+    """
+    Predictive mean and variance (numpy, scaled units) at X, batch_size
+    points at a time (by default sized to the training set, see PREDICT_CELLS).
+    """
+    if batch_size is None:
+        batch_size = predict_batch_size(model)
+    model.eval()
+    likelihood.eval()
+    means, variances = [], []
+    with profiling.stage("prediction", points=len(X), batch=batch_size), \
+            torch.no_grad(), gpytorch.settings.fast_pred_var():
+        for start in range(0, len(X), batch_size):
+            pred_dist = likelihood(model(X[start:start + batch_size]))
+            means.append(pred_dist.mean.detach().cpu().numpy())
+            variances.append(pred_dist.variance.detach().cpu().numpy())
+    return np.concatenate(means), np.concatenate(variances)
+
+
+def to_original(scaler_y, mean, variance):
+    """Predictive mean and standard deviation in the measurements' units."""
+    task_std = np.array(scaler_y.scale_)
+    return scaler_y.inverse_transform(mean), np.sqrt(variance) * task_std[np.newaxis, :]
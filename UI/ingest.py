@@ -0,0 +1,369 @@
+"""
+Survey ingestion for the dashboard: parse an uploaded lake CSV (or Parquet)
+file once, drop the unreliable GPS fixes and project lat/lon to x/y.
+
+Kept free of streamlit so the same code can be used from scripts; the caching
+around it lives in app_cache.py.
+"""
+import hashlib
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+import profiling
+
+REQUIRED_COLUMNS = {"latitude", "longitude", "depth"}
+MIN_SATS = 4
+R_EARTH = 6371000
+
+# columns the dashboard knows about, everything else in a logger dump is skipped
+KNOWN_COLUMNS = ["latitude", "longitude", "depth", "pH", "temperature", "turbidity",
+                 "dissolved_oxygen", "TDS", "num_sats", "timestamp"]
+
+# lat/lon stay float64: float32 only resolves ~1 m at these coordinates.
+# num_sats is read as float (it may have gaps) and becomes uint8 once the
+# unreliable fixes are filtered out.
+CSV_DTYPES = {
+    "latitude": "float64",
+    "longitude": "float64",
+    "depth": "float32",
+    "pH": "float32",
+    "temperature": "float32",
+    "turbidity": "float32",
+    "dissolved_oxygen": "float32",
+    "TDS": "float32",
+    "num_sats": "float32",
+}
+
+CHUNK_ROWS = 500_000
+
+# bytes at the end of a previous upload that csv_tail checks a grown file against
+TAIL_CHECK = 64 * 1024
+
+# magic bytes of the compressed uploads we accept
+_MAGIC = {
+    b"\x1f\x8b": "gzip",
+    b"\x28\xb5\x2f\xfd": "zstd",
+}
+
+
+def file_digest(raw):
+    """Content hash of an uploaded file, used as the cache key."""
+    return hashlib.blake2b(raw, digest_size=16).hexdigest()
+
+
+def _peek(source, n=4):
+    """First n bytes of a path or file-like, leaving the file position alone."""
+    if isinstance(source, str) or hasattr(source, "__fspath__"):
+        with open(source, "rb") as f:
+            return f.read(n)
+    pos = source.tell()
+    head = source.read(n)
+    source.seek(pos)
+    return head
+
+
+def sniff_compression(source):
+    """Return 'gzip', 'zstd' or None by peeking at the first bytes of source."""
+    head = _peek(source)
+    for magic, name in _MAGIC.items():
+        if head.startswith(magic):
+            return name
+    return None
+
+
+def is_parquet(source):
+    """True if source starts with the Parquet magic bytes."""
+    return _peek(source) == b"PAR1"
+
+
+def centroid(lat_deg, lon_deg):
+    """Mean (lat, lon) of the points, the default origin of their x/y."""
+    return float(np.mean(lat_deg)), float(np.mean(lon_deg))
+
+
+def project_xy(lat_deg, lon_deg, origin=None):
+    """
+    Convert lat/lon (degrees) to local east/north x/y in meters on the plane
+    tangent to the earth at origin (lat, lon), the centroid if not given.
+
+    Earth-centred coordinates are ~6e6 m and differ only in the last digits
+    over a lake; relative to a point on the lake they stay within a few km, so
+    they keep their precision as float32 and in the GP's scaling.
+    """
+    lat0, lon0 = centroid(lat_deg, lon_deg) if origin is None else origin
+    lat = np.deg2rad(np.asarray(lat_deg, dtype=np.float64))
+    dlon = np.deg2rad(np.asarray(lon_deg, dtype=np.float64) - lon0)
+    lat0 = np.deg2rad(lat0)
+    # ENU of the earth-centred position relative to the origin (sphere)
+    x = R_EARTH * np.cos(lat) * np.sin(dlon)
+    y = R_EARTH * (np.sin(lat) * np.cos(lat0) - np.cos(lat) * np.sin(lat0) * np.cos(dlon))
+    return x, y
+
+
+def add_xy(data, info, origin=None):
+    """
+    Project data's lat/lon to x/y around origin (the centroid if None) and
+    remember the origin in info["origin"] and data.attrs["origin"], so rows
+    added later can be projected onto the same plane.
+    """
+    if origin is None:
+        origin = centroid(data["latitude"], data["longitude"]) if len(data) else (0.0, 0.0)
+    origin = (float(origin[0]), float(origin[1]))
+    with profiling.stage("projection"):
+        data["x"], data["y"] = project_xy(data["latitude"], data["longitude"], origin)
+    data.attrs["origin"] = origin
+    info["origin"] = origin
+    return data
+
+
+def parse_time_columns(data):
+    """
+    Parse the timestamp column and add month, year and month_year (YYYY-MM).
+    Raises whatever pandas raises if the timestamps can't be parsed.
+    """
+    data["timestamp"] = pd.to_datetime(data["timestamp"])
+    data["month"] = data["timestamp"].dt.month
+    data["year"] = data["timestamp"].dt.year
+    data["month_year"] = month_year(data["timestamp"])
+    return data
+
+
+def month_year(timestamps):
+    """
+    YYYY-MM of each timestamp as a Categorical (one small code per row
+    instead of a python string), categories in time order, NaT -> NaN.
+    """
+    ts = pd.DatetimeIndex(timestamps)
+    ok = ~ts.isna()
+    key = np.full(len(ts), -1, dtype=np.int64)
+    key[ok] = ts.year[ok] * 12 + ts.month[ok] - 1
+    months, codes = np.unique(key[ok], return_inverse=True)
+    all_codes = np.full(len(ts), -1, dtype=np.int64)
+    all_codes[ok] = codes
+    return pd.Categorical.from_codes(all_codes, [f"{k // 12}-{k % 12 + 1:02d}" for k in months])
+
+
+def clean_survey(data, min_sats=MIN_SATS, parse_time=False, origin=None):
+    """
+    Clean a raw survey frame the way the Upload page expects it.
+
+    Returns (data, info) where info is a dict with
+      removed    - rows dropped because num_sats < min_sats
+      has_time   - True if a timestamp column was parsed
+      time_error - error message if parsing the timestamps failed, else None
+      origin     - (lat, lon) the x/y are relative to (see add_xy)
+    """
+    missing = REQUIRED_COLUMNS - set(data.columns)
+    if missing:
+        raise ValueError(f"Your file must include: {REQUIRED_COLUMNS}")
+
+    info = {"removed": 0, "has_time": False, "time_error": None}
+
+    if parse_time and "timestamp" in data.columns:
+        try:
+            data = parse_time_columns(data)
+            info["has_time"] = True
+        except Exception as e:
+            info["time_error"] = str(e)
+
+    # drop gps points with too few sats (less reliable)
+    if "num_sats" in data.columns:
+        before = len(data)
+        data = data[data["num_sats"] >= min_sats].reset_index(drop=True)
+        info["removed"] = before - len(data)
+
+    data = add_xy(data, info, origin)
+    return data, info
+
+
+def iter_survey_chunks(source, min_sats=MIN_SATS, chunk_rows=CHUNK_ROWS):
+    """
+    Stream a survey CSV (path or binary file-like, optionally gzip/zstd
+    compressed) in chunks of chunk_rows rows.
+
+    Only KNOWN_COLUMNS are kept, measurements are read as float32 and the
+    num_sats filter is applied per chunk, so the full-width float64 frame never
+    exists in memory. Yields (chunk, removed, time_error) per chunk.
+    """
+    reader = pd.read_csv(
+        source,
+        usecols=lambda c: c in KNOWN_COLUMNS,
+        dtype=CSV_DTYPES,
+        chunksize=chunk_rows,
+        compression=sniff_compression(source),
+    )
+    with reader:
+        for chunk in reader:
+            missing = REQUIRED_COLUMNS - set(chunk.columns)
+            if missing:
+                raise ValueError(f"Your file must include: {REQUIRED_COLUMNS}")
+
+            removed = 0
+            if "num_sats" in chunk.columns:
+                keep = chunk["num_sats"].to_numpy() >= min_sats
+                removed = int(len(chunk) - keep.sum())
+                # shallow copy drops pandas' "view of a slice" flag, nothing is copied
+                chunk = chunk[keep].copy(deep=False)
+                chunk["num_sats"] = chunk["num_sats"].astype("uint8")
+
+            # datetime64 is 8 bytes a row, the raw strings are ~60
+            time_error = None
+            if "timestamp" in chunk.columns:
+                try:
+                    chunk["timestamp"] = pd.to_datetime(chunk["timestamp"])
+                except Exception as e:
+                    time_error = str(e)
+                    chunk = chunk.drop(columns="timestamp")
+            yield chunk, removed, time_error
+
+
+def read_survey_csv(source, min_sats=MIN_SATS, chunk_rows=CHUNK_ROWS):
+    """
+    Read a whole survey CSV through iter_survey_chunks.
+
+    Returns (data, info) with info as in clean_survey (has_time is left False,
+    see load_survey).
+    """
+    info = {"removed": 0, "has_time": False, "time_error": None}
+    pieces = []
+    for chunk, removed, time_error in iter_survey_chunks(source, min_sats, chunk_rows):
+        info["removed"] += removed
+        if time_error is not None and info["time_error"] is None:
+            info["time_error"] = time_error
+        pieces.append(chunk)
+
+    if not pieces:
+        raise ValueError(f"Your file must include: {REQUIRED_COLUMNS}")
+    data = pd.concat(pieces, ignore_index=True)
+    del pieces
+
+    # one bad chunk means the column is unusable for the whole survey
+    if info["time_error"] is not None and "timestamp" in data.columns:
+        data = data.drop(columns="timestamp")
+    return data, info
+
+
+def read_survey_parquet(source, min_sats=MIN_SATS):
+    """
+    Read a survey saved as Parquet (path or file-like).
+
+    Paths are memory-mapped and in-memory uploads are read straight out of
+    their buffer; only KNOWN_COLUMNS are decoded and the num_sats filter runs
+    on the Arrow table before anything is converted to pandas.
+    Returns (data, info) like read_survey_csv.
+    """
+    if hasattr(source, "getbuffer"):
+        source = pa.BufferReader(source.getbuffer())
+    pf = pq.ParquetFile(source, memory_map=True)
+    columns = [c for c in KNOWN_COLUMNS if c in pf.schema_arrow.names]
+    if not REQUIRED_COLUMNS.issubset(columns):
+        raise ValueError(f"Your file must include: {REQUIRED_COLUMNS}")
+    table = pf.read(columns=columns)
+
+    info = {"removed": 0, "has_time": False, "time_error": None}
+    if "num_sats" in columns:
+        keep = pc.fill_null(pc.greater_equal(table["num_sats"], min_sats), False)
+        before = table.num_rows
+        table = table.filter(keep)
+        info["removed"] = before - table.num_rows
+
+    data = table.to_pandas()
+    data = data.astype({c: t for c, t in CSV_DTYPES.items() if c in data.columns}, copy=False)
+    if "num_sats" in data.columns:
+        data["num_sats"] = data["num_sats"].astype("uint8")
+    if "timestamp" in data.columns:
+        try:
+            data["timestamp"] = pd.to_datetime(data["timestamp"])
+        except Exception as e:
+            info["time_error"] = str(e)
+            data = data.drop(columns="timestamp")
+    return data, info
+
+
+def load_survey(source, min_sats=MIN_SATS, parse_time=False, chunk_rows=CHUNK_ROWS, origin=None):
+    """
+    Read a survey file (path or file-like; CSV, gzip/zstd compressed CSV or
+    Parquet) and clean it, see clean_survey for what comes back. Pass the
+    origin of an existing dataset to project new rows onto its x/y.
+    """
+    with profiling.stage("parse") as rec:
+        if is_parquet(source):
+            data, info = read_survey_parquet(source, min_sats=min_sats)
+        else:
+            data, info = read_survey_csv(source, min_sats=min_sats, chunk_rows=chunk_rows)
+        rec["rows"] = len(data)
+    return finish_survey(data, info, parse_time=parse_time, origin=origin)
+
+
+def finish_survey(data, info, parse_time=False, origin=None):
+    """
+    Last ingest step for an already filtered frame (from a file or the survey
+    catalog): derive the month/year columns and project to x/y around origin
+    (the centroid if None).
+    """
+    if parse_time and "timestamp" in data.columns and info["time_error"] is None:
+        data = parse_time_columns(data)
+        info["has_time"] = True
+
+    data = add_xy(data, info, origin)
+    return data, info
+
+
+def end_check(raw, length):
+    """Hash of the last TAIL_CHECK bytes of raw[:length], for csv_tail."""
+    return file_digest(raw[max(length - TAIL_CHECK, 0):length])
+
+
+def csv_tail(raw, prev_len, prev_check):
+    """
+    If raw (bytes or a memoryview) is a plain CSV that continues the file
+    seen last time (prev_len bytes whose end_check was prev_check), return
+    its header plus only the rows after that, so a growing logger file isn't
+    parsed from the top again. b"" means nothing was added, None that raw
+    isn't such a continuation.
+
+    Only the end of the previous file is compared, so the cost depends on
+    the new rows, not on the size of the file.
+    """
+    head = bytes(raw[:TAIL_CHECK])
+    if head.startswith(tuple(_MAGIC)) or head.startswith(b"PAR1") or b"\n" not in head:
+        return None
+    if len(raw) < prev_len or bytes(raw[prev_len - 1:prev_len]) != b"\n":
+        return None
+    if end_check(raw, prev_len) != prev_check:
+        return None
+    if len(raw) == prev_len:
+        return b""
+    return head[:head.index(b"\n") + 1] + bytes(raw[prev_len:])
+
+
+def newer_rows(data, new):
+    """Rows of new with a timestamp after the last one in data (all of new if either has none)."""
+    if "timestamp" not in data.columns or "timestamp" not in new.columns or len(data) == 0:
+        return new
+    return new[new["timestamp"] > data["timestamp"].max()].reset_index(drop=True)
+
+
+def append_rows(data, new):
+    """
+    data with the (already cleaned and projected) rows of new added at the end.
+    new must have been projected around data's origin (load_survey's origin).
+    """
+    if len(new) == 0:
+        return data
+    combined = pd.concat([data, new[[c for c in new.columns if c in data.columns]]], ignore_index=True)
+    combined.attrs = dict(data.attrs)
+    # concat widens e.g. uint8 to float when new is missing a column, and
+    # categoricals with different categories to strings
+    for c, dtype in data.dtypes.items():
+        if isinstance(dtype, pd.CategoricalDtype) and combined[c].dtype != dtype:
+            # YYYY-MM categories sort in time order
+            combined[c] = combined[c].astype("category")
+            combined[c] = combined[c].cat.reorder_categories(sorted(combined[c].cat.categories))
+        elif combined[c].dtype != dtype and not combined[c].isna().any():
+            combined[c] = combined[c].astype(dtype)
+    return combined
@@ -0,0 +1,116 @@
+"""
+Level-of-detail decimation for the 3D scatter plots.
+
+Plotly sends every point to the browser, so a survey of a few hundred
+thousand rows freezes the page. decimate puts the points on a voxel grid
+over x/y/depth and keeps one point per occupied voxel (the one closest to the
+voxel's mean value, or the min and max value points), choosing the finest
+grid that stays within a point budget. Restricting the bounds to a
+sub-volume re-decimates that part at a finer grid, i.e. zooming in shows
+more detail.
+"""
+import numpy as np
+import pandas as pd
+
+MAX_POINTS = 20_000
+# finest grid, voxels per axis
+MAX_RESOLUTION = 1 << 16
+
+MODES = ("representative", "extremes")
+
+
+def in_bounds(frame, x, y, z, bounds):
+    """Mask of the rows inside bounds = (x_min, x_max, y_min, y_max, z_min, z_max)."""
+    x_min, x_max, y_min, y_max, z_min, z_max = bounds
+    xv, yv, zv = frame[x].to_numpy(), frame[y].to_numpy(), frame[z].to_numpy()
+    return (xv >= x_min) & (xv <= x_max) & (yv >= y_min) & (yv <= y_max) & (zv >= z_min) & (zv <= z_max)
+
+
+def _unit(frame, x, y, z):
+    """x, y, z of every point scaled to [0, 1] (each axis over its own extent)."""
+    unit = []
+    for c in (x, y, z):
+        v = frame[c].to_numpy(dtype=np.float64)
+        lo, hi = v.min(), v.max()
+        unit.append((v - lo) / (hi - lo) if hi > lo else np.zeros_like(v))
+    return unit
+
+
+def _voxel_keys(unit, res, group):
+    """One int64 key per point for a res x res x res grid (and group codes, if any)."""
+    cx, cy, cz = (np.minimum((u * res).astype(np.int64), res - 1) for u in unit)
+    key = (cx * res + cy) * res + cz
+    if group is not None:
+        key += group * res ** 3
+    return key
+
+
+def decimate(frame, x="x", y="y", z="depth", value=None, budget=MAX_POINTS, mode="representative",
+             group=None, bounds=None):
+    """
+    Rows of frame to plot: at most budget of them (roughly), one or two per
+    occupied voxel of the finest grid that fits the budget.
+
+    value   - column whose voxel mean picks the representative point
+              ("representative") or whose min and max are kept ("extremes");
+              without it the first point of each voxel is kept
+    group   - column kept apart in the voxels (e.g. training vs prediction)
+    bounds  - (x_min, x_max, y_min, y_max, z_min, z_max) sub-volume to show
+
+    Returns (rows, resolution) with resolution the voxels per axis of the
+    grid used (None when nothing had to be dropped).
+    """
+    if bounds is not None:
+        frame = frame[in_bounds(frame, x, y, z, bounds)]
+    if len(frame) <= budget:
+        return frame, None
+
+    per_voxel = 2 if mode == "extremes" and value is not None else 1
+    codes = None
+    if group is not None:
+        codes = pd.factorize(frame[group])[0].astype(np.int64)
+    unit = _unit(frame, x, y, z)
+
+    def fits(res):
+        return len(pd.unique(_voxel_keys(unit, res, codes))) * per_voxel <= budget
+
+    # finest grid whose occupied voxels fit the budget: double the resolution
+    # until it doesn't, then bisect to within ~5%
+    lo, hi = 1, 2
+    while hi <= MAX_RESOLUTION and fits(hi):
+        lo, hi = hi, hi * 2
+    hi = min(hi, MAX_RESOLUTION + 1)
+    while hi - lo > max(1, lo // 20):
+        mid = (lo + hi) // 2
+        if fits(mid):
+            lo = mid
+        else:
+            hi = mid
+    res = lo
+    voxel = pd.factorize(_voxel_keys(unit, res, codes))[0]
+    n_voxels = voxel.max() + 1
+
+    if value is None:
+        _, keep = np.unique(voxel, return_index=True)
+        return frame.iloc[np.sort(keep)], res
+
+    v = frame[value].to_numpy(dtype=np.float64)
+    nan = np.isnan(v)
+    if mode == "extremes":
+        # NaN sorts last, so the last non-NaN value of a voxel is its max
+        order = np.lexsort((v, voxel))
+        starts = np.searchsorted(voxel[order], np.arange(n_voxels))
+        n_valid = np.bincount(voxel, weights=~nan, minlength=n_voxels).astype(np.int64)
+        last = starts + np.maximum(n_valid, 1) - 1
+        keep = np.unique(np.concatenate([order[starts], order[last]]))
+    else:
+        # closest to the voxel mean; voxels with only NaN keep their first point
+        total = np.bincount(voxel, weights=np.where(nan, 0, v), minlength=n_voxels)
+        count = np.bincount(voxel, weights=~nan, minlength=n_voxels)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = total / count
+        dev = np.abs(v - mean[voxel])
+        dev[np.isnan(dev)] = np.inf
+        order = np.lexsort((dev, voxel))
+        keep = np.sort(order[np.searchsorted(voxel[order], np.arange(n_voxels))])
+    return frame.iloc[keep], res
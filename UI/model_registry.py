@@ -0,0 +1,264 @@
+"""
+Local registry of trained GPs.
+
+The trained model, its likelihood and the scalers used to live only in the
+browser session, so every new session or server restart retrained from
+scratch, which takes minutes. Every model trained on the Predict page now
+goes into one SQLite file: the model and likelihood state dicts (a blob), the
+scaler parameters, the input/output columns, the digest of the training data
+and the training settings (mode, rank, split, patience, ...).
+
+A model is found again by key(), a hash of the dataset digest, the columns
+and the settings, so opening the same dataset with the same settings loads
+the stored model instead of training. An exact GP is rebuilt on the training
+rows it was stored for (its state dict holds only the hyperparameters, a
+KISS-GP also its grid); a sparse variational GP carries its inducing points
+in the state dict.
+
+Stored models also seed new training runs: warm_state() hands a model's
+state to gp_model.train(init_state=...), and latest() finds the most recent
+model of a lake that fits the columns and mode, e.g. last week's survey.
+"""
+import hashlib
+import io
+import json
+import os
+import sqlite3
+import time
+
+import gpytorch
+import numpy as np
+import sklearn.preprocessing as skp
+import torch
+
+import gp_model
+import profiling
+
+DEFAULT_PATH = os.environ.get(
+    "LAKE_MODELS", os.path.join(os.path.dirname(os.path.abspath(__file__)), "lake_models.db")
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS models (
+    model_id INTEGER PRIMARY KEY,
+    key TEXT NOT NULL UNIQUE,
+    digest TEXT NOT NULL,
+    lake TEXT,
+    kind TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    n_rows INTEGER NOT NULL,
+    input_cols TEXT NOT NULL,
+    output_cols TEXT NOT NULL,
+    settings TEXT NOT NULL,
+    scalers TEXT NOT NULL,
+    val_rmse REAL,
+    state BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS models_digest ON models (digest);
+CREATE INDEX IF NOT EXISTS models_lake_time ON models (lake, created_at);
+"""
+
+
+class StoredModel:
+    """One registry row: what a model was trained on and with, without its state."""
+
+    def __init__(self, row):
+        (self.model_id, self.key, self.digest, self.lake, self.kind, self.created_at, self.n_rows,
+         input_cols, output_cols, settings, scalers, self.val_rmse) = row
+        self.input_cols = json.loads(input_cols)
+        self.output_cols = json.loads(output_cols)
+        self.settings = json.loads(settings)
+        self._scalers = json.loads(scalers)
+
+    @property
+    def scaler_x(self):
+        return _scaler(self._scalers["x"])
+
+    @property
+    def scaler_y(self):
+        return _scaler(self._scalers["y"])
+
+    def label(self):
+        """Short description for a model picker."""
+        when = time.strftime("%Y-%m-%d %H:%M", time.localtime(self.created_at))
+        rmse = "" if self.val_rmse is None else f", val. RMSE {self.val_rmse:.3g}"
+        return f"{self.lake or 'no lake'} - {when} ({self.kind}, {self.n_rows:,} rows{rmse})"
+
+    def fits(self, input_cols, output_cols, kind):
+        """True if the model was trained on these columns in this mode (see gp_model.model_kind)."""
+        return self.kind == kind and self.input_cols == list(input_cols) and self.output_cols == list(output_cols)
+
+
+_COLUMNS = ("model_id, key, digest, lake, kind, created_at, n_rows, input_cols, output_cols, settings,"
+            " scalers, val_rmse")
+
+
+def connect(path=DEFAULT_PATH):
+    """Open (and if needed create) the registry database."""
+    con = sqlite3.connect(path)
+    con.executescript(SCHEMA)
+    return con
+
+
+def key(digest, input_cols, output_cols, settings):
+    """Registry key of a model trained on dataset digest with these columns and settings."""
+    text = json.dumps([digest, list(input_cols), list(output_cols), settings], sort_keys=True)
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+def _scaler_params(scaler):
+    return {"mean": scaler.mean_.tolist(), "scale": scaler.scale_.tolist(), "n": int(scaler.n_samples_seen_)}
+
+
+def _scaler(params):
+    """A fitted StandardScaler from stored parameters."""
+    scaler = skp.StandardScaler()
+    scaler.mean_ = np.asarray(params["mean"], dtype=np.float64)
+    scaler.scale_ = np.asarray(params["scale"], dtype=np.float64)
+    scaler.var_ = scaler.scale_ ** 2
+    scaler.n_features_in_ = len(scaler.mean_)
+    scaler.n_samples_seen_ = params["n"]
+    return scaler
+
+
+def _structure(model):
+    """What it takes to rebuild model before loading its state dict."""
+    if gp_model.is_variational(model):
+        return {"num_tasks": model.num_tasks, "num_latents": model.num_latents,
+                "num_inducing": model.num_inducing,
+                "dims": int(model.variational_strategy.base_variational_strategy.inducing_points.size(-1))}
+    if gp_model.is_ski(model):
+        return {"num_tasks": model.num_tasks, "grid_size": model.grid_size,
+                "grid_bounds": [list(b) for b in model.grid_bounds]}
+    return {"num_tasks": model.num_tasks, "rank": model.rank}
+
+
+def save(model, likelihood, scaler_x, scaler_y, digest, input_cols, output_cols, settings, n_rows,
+         lake=None, val_rmse=None, path=DEFAULT_PATH):
+    """
+    Store a trained model (as returned by gp_model.condition) under
+    key(digest, input_cols, output_cols, settings), replacing a model stored
+    under the same key. settings must be JSON-serialisable. Returns the key.
+    """
+    model_key = key(digest, input_cols, output_cols, settings)
+    buffer = io.BytesIO()
+    torch.save({"model": model.state_dict(), "likelihood": likelihood.state_dict(),
+                "structure": _structure(model)}, buffer)
+    kind = gp_model.model_kind(model)
+    scalers = {"x": _scaler_params(scaler_x), "y": _scaler_params(scaler_y)}
+    con = connect(path)
+    try:
+        con.execute(
+            "INSERT OR REPLACE INTO models (key, digest, lake, kind, created_at, n_rows, input_cols, output_cols,"
+            " settings, scalers, val_rmse, state) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                model_key, digest, lake, kind, time.time(), int(n_rows), json.dumps(list(input_cols)),
+                json.dumps(list(output_cols)), json.dumps(settings, sort_keys=True), json.dumps(scalers),
+                None if val_rmse is None else float(val_rmse), buffer.getvalue(),
+            ),
+        )
+        con.commit()
+    finally:
+        con.close()
+    return model_key
+
+
+def find(digest, input_cols, output_cols, settings, path=DEFAULT_PATH):
+    """The StoredModel for this dataset, columns and settings, or None."""
+    if not os.path.exists(path):
+        return None
+    con = connect(path)
+    try:
+        row = con.execute(f"SELECT {_COLUMNS} FROM models WHERE key = ?",
+                          (key(digest, input_cols, output_cols, settings),)).fetchone()
+    finally:
+        con.close()
+    return None if row is None else StoredModel(row)
+
+
+def list_models(digest=None, lake=None, path=DEFAULT_PATH):
+    """Stored models, newest first, optionally of one dataset digest and/or lake."""
+    if not os.path.exists(path):
+        return []
+    where, params = [], []
+    if digest is not None:
+        where.append("digest = ?")
+        params.append(digest)
+    if lake is not None:
+        where.append("lake = ?")
+        params.append(lake)
+    sql = f"SELECT {_COLUMNS} FROM models"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    con = connect(path)
+    try:
+        rows = con.execute(sql + " ORDER BY created_at DESC", params).fetchall()
+    finally:
+        con.close()
+    return [StoredModel(row) for row in rows]
+
+
+def _state(model_id, path):
+    con = connect(path)
+    try:
+        row = con.execute("SELECT state FROM models WHERE model_id = ?", (model_id,)).fetchone()
+    finally:
+        con.close()
+    if row is None:
+        raise KeyError(f"no stored model {model_id}")
+    return torch.load(io.BytesIO(row[0]), weights_only=True)
+
+
+def latest(lake, input_cols, output_cols, kind, path=DEFAULT_PATH):
+    """The most recent StoredModel of lake that fits the columns and kind, or None."""
+    if lake is None:
+        return None
+    return next((m for m in list_models(lake=lake, path=path) if m.fits(input_cols, output_cols, kind)), None)
+
+
+def warm_state(stored, path=DEFAULT_PATH):
+    """(model state dict, likelihood state dict) of a StoredModel, for gp_model.train(init_state=...)."""
+    state = _state(stored.model_id, path)
+    return state["model"], state["likelihood"]
+
+
+def load(stored, X=None, Y=None, path=DEFAULT_PATH):
+    """
+    (model, likelihood) of a StoredModel, in eval mode and ready for
+    gp_model.predict. An exact GP or KISS-GP needs the (scaled) training
+    rows X, Y it was stored for; a sparse variational GP ignores them.
+    """
+    with profiling.stage("model load", kind=stored.kind) as rec:
+        state = _state(stored.model_id, path)
+        structure = state["structure"]
+        if stored.kind == "ski":
+            likelihood = gp_model.ski_likelihood(structure["num_tasks"])
+        else:
+            likelihood = gpytorch.likelihoods.MultitaskGaussianLikelihood(num_tasks=structure["num_tasks"])
+        if stored.kind != "variational" and (X is None or Y is None):
+            raise ValueError(f"a stored {stored.kind} GP needs its training rows X, Y")
+        if stored.kind == "variational":
+            inducing = torch.zeros(structure["num_latents"], structure["num_inducing"], structure["dims"])
+            model = gp_model.MultitaskSVGP(inducing, structure["num_tasks"], structure["num_latents"])
+        elif stored.kind == "ski":
+            model = gp_model.MultitaskSKIGP(X, Y, likelihood, num_tasks=structure["num_tasks"],
+                                            grid_size=structure["grid_size"], grid_bounds=structure["grid_bounds"])
+        else:
+            model = gp_model.MultitaskExactGP(X, Y, likelihood, num_tasks=structure["num_tasks"],
+                                              rank=structure["rank"])
+        model.load_state_dict(state["model"])
+        likelihood.load_state_dict(state["likelihood"])
+        model.eval()
+        likelihood.eval()
+        rec["rows"] = stored.n_rows
+    return model, likelihood
+
+
+def delete(model_id, path=DEFAULT_PATH):
+    """Remove a stored model."""
+    con = connect(path)
+    try:
+        con.execute("DELETE FROM models WHERE model_id = ?", (model_id,))
+        con.commit()
+    finally:
+        con.close()
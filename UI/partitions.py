@@ -0,0 +1,96 @@
+"""
+A dataset kept in time order, so that period and date filters are slices.
+
+The V2 temporal filter did data[data["month_year"] == period].copy(), a scan
+and a copy of the whole survey on every rerun. PeriodPartition holds the
+rows sorted by timestamp (logger files usually already are, then it is the
+dataset itself, not a copy), the month_year code of each row and the offset
+where each period starts. One period, a run of consecutive periods or a date
+range is then found with a binary search and returned as an iloc slice, a
+view of the sorted frame. Only a set of periods that are not next to each
+other is copied (just the selected rows).
+"""
+import numpy as np
+import pandas as pd
+
+
+class PeriodPartition:
+    """Rows of a dataset in time order with per-period offsets."""
+
+    def __init__(self, data, period="month_year", time="timestamp"):
+        column = data[period]
+        if not isinstance(column.dtype, pd.CategoricalDtype):
+            column = column.astype("category")
+        categories = np.asarray(column.cat.categories, dtype=str)
+        # periods in time order ('YYYY-MM' sorts as text), whatever the category order
+        by_time = np.argsort(categories, kind="stable")
+        rank = np.empty(len(categories), dtype=np.int64)
+        rank[by_time] = np.arange(len(categories))
+        codes = column.cat.codes.to_numpy().astype(np.int64)
+        codes = np.where(codes >= 0, rank[np.maximum(codes, 0)], -1)
+
+        if time in data.columns:
+            # NaT is the smallest int64, so rows without a time come first (like code -1)
+            key = pd.DatetimeIndex(data[time]).asi8
+        else:
+            key = codes
+        if len(key) and not np.all(key[1:] >= key[:-1]):
+            order = np.argsort(key, kind="stable")
+            data, key, codes = data.take(order), key[order], codes[order]
+        if time not in data.columns or not np.all(codes[1:] >= codes[:-1]):
+            # timestamps that disagree with month_year: fall back to period order
+            order = np.argsort(codes, kind="stable")
+            data, codes = data.take(order), codes[order]
+            key = None
+
+        self.frame = data
+        self.time = time
+        self.periods = [str(c) for c in categories[by_time]]
+        self.times = key
+        # rows of period k are offsets[k]:offsets[k + 1]
+        self.offsets = np.searchsorted(codes, np.arange(len(self.periods) + 1))
+
+    def __len__(self):
+        return len(self.frame)
+
+    def _slice(self, start, stop):
+        return self.frame.iloc[start:stop]
+
+    def period_range(self, first, last):
+        """Rows of periods first..last (inclusive, 'YYYY-MM'), a view."""
+        i, j = self.periods.index(first), self.periods.index(last)
+        return self._slice(self.offsets[i], self.offsets[j + 1])
+
+    def select(self, periods):
+        """
+        Rows of the given periods in time order: a view when they are
+        consecutive, otherwise the runs of consecutive periods concatenated.
+        """
+        picked = sorted(self.periods.index(p) for p in periods)
+        if not picked:
+            return self.frame.iloc[:0]
+        # runs of consecutive periods are one slice each
+        breaks = np.flatnonzero(np.diff(picked) > 1)
+        starts = [picked[0]] + [picked[b + 1] for b in breaks]
+        ends = [picked[b] for b in breaks] + [picked[-1]]
+        runs = [self._slice(self.offsets[s], self.offsets[e + 1]) for s, e in zip(starts, ends)]
+        return runs[0] if len(runs) == 1 else pd.concat(runs)
+
+    def between(self, start, end):
+        """
+        Rows with start <= timestamp < end (anything pd.Timestamp accepts), a
+        view. Without usable timestamps whole periods are used instead.
+        """
+        start, end = pd.Timestamp(start), pd.Timestamp(end)
+        if self.times is None:
+            first = np.searchsorted(self.periods, start.strftime("%Y-%m"))
+            last = np.searchsorted(self.periods, (end - pd.Timedelta(1, "ns")).strftime("%Y-%m"), side="right")
+            return self._slice(self.offsets[first], self.offsets[last])
+        tz = self.frame[self.time].dt.tz
+        if tz is not None:
+            start = start.tz_localize(tz) if start.tzinfo is None else start
+            end = end.tz_localize(tz) if end.tzinfo is None else end
+        lo, hi = np.searchsorted(self.times, [start.value, end.value])
+        # rows without a time sort first, never inside a range
+        lo = max(lo, self.offsets[0])
+        return self._slice(lo, max(hi, lo))
@@ -0,0 +1,172 @@
+"""
+Depth x period statistics for the temporal views of the V2 app.
+
+The By Month and Depth x Month tabs and the Temporal Trends tab grouped the
+rows by month_year (and depth bin) on every rerun, scanned the whole frame
+once per period and formatted period labels with one pd.to_datetime call
+per element. DepthPeriodStats goes over the rows once per dataset and keeps
+a cube of base depth bin (0.1 m, see depth_stats) x period x feature with
+count, mean, M2, min and max, plus a value histogram per period for the
+median. Every view is then a merge of the cube along one axis: the per-period
+tables merge the depths (optionally a depth range), the heatmap merges base
+bins into the displayed bin width and a depth profile is one period's column.
+
+Periods are the categorical codes of month_year (ingest.month_year), and
+their labels are formatted once, vectorised.
+"""
+import numpy as np
+import pandas as pd
+
+from depth_stats import (
+    BASE_BIN, SKETCH_BUCKETS, base_bin_index, bin_labels, bins_per_width, finite_depth, merge_moments,
+    sketch_exponent, sketch_quantile,
+)
+
+
+def period_labels(periods):
+    """'YYYY-MM' periods as 'Mon YYYY' labels."""
+    if len(periods) == 0:
+        return []
+    return list(pd.to_datetime(pd.Index(periods, dtype=str) + "-01").strftime("%b %Y"))
+
+
+class DepthPeriodStats:
+    """Statistics of some measurement columns per base depth bin and period."""
+
+    def __init__(self, data, features, period="month_year"):
+        self.features = list(features)
+        periods = data[period]
+        if not isinstance(periods.dtype, pd.CategoricalDtype):
+            periods = periods.astype("category")
+        self.periods = list(periods.cat.categories)
+        self.labels = period_labels(self.periods)
+        n_per, n_feat = len(self.periods), len(self.features)
+
+        codes = periods.cat.codes.to_numpy().astype(np.int64)
+        depth, finite = finite_depth(data["depth"].to_numpy())
+        used = (codes >= 0) & finite
+        base = np.zeros(len(depth), dtype=np.int64)
+        base[finite] = base_bin_index(depth[finite])
+        # bins start at the shallowest point, like depth_stats.cut_depth
+        self.first = int(base[finite].min()) if finite.any() else 0
+        pos = base[used] - self.first
+        n_bins = int(pos.max()) + 1 if len(pos) else 0
+        cell = pos * n_per + codes[used]
+        size = n_bins * n_per
+
+        self.rows = np.bincount(cell, minlength=size).reshape(n_bins, n_per)
+        shape = (n_bins, n_per, n_feat)
+        self.count = np.zeros(shape, dtype=np.int64)
+        self.mean = np.zeros(shape)
+        self.m2 = np.zeros(shape)
+        self.min = np.full(shape, np.inf)
+        self.max = np.full(shape, -np.inf)
+        # per feature: (periods, SKETCH_BUCKETS) counts, first bucket, width exponent
+        self.hist, self.hist_first, self.hist_exponent = [], [], []
+
+        for j, feature in enumerate(self.features):
+            v = data[feature].to_numpy(dtype=np.float64)[used]
+            ok = ~np.isnan(v)
+            v, c = v[ok], cell[ok]
+            n = np.bincount(c, minlength=size)
+            hit = n > 0
+            mean = np.zeros(size)
+            mean[hit] = np.bincount(c, weights=v, minlength=size)[hit] / n[hit]
+            self.count[:, :, j] = n.reshape(n_bins, n_per)
+            self.mean[:, :, j] = mean.reshape(n_bins, n_per)
+            self.m2[:, :, j] = np.bincount(c, weights=(v - mean[c]) ** 2, minlength=size).reshape(n_bins, n_per)
+            lo, hi = np.full(size, np.inf), np.full(size, -np.inf)
+            np.minimum.at(lo, c, v)
+            np.maximum.at(hi, c, v)
+            self.min[:, :, j] = lo.reshape(n_bins, n_per)
+            self.max[:, :, j] = hi.reshape(n_bins, n_per)
+
+            if len(v) == 0:
+                self.hist.append(None)
+                self.hist_first.append(0)
+                self.hist_exponent.append(None)
+                continue
+            exponent = sketch_exponent(v.min(), v.max())
+            first = int(np.floor(v.min() / 2.0 ** exponent))
+            bucket = np.floor(v / 2.0 ** exponent).astype(np.int64) - first
+            self.hist.append(np.bincount(
+                (c % n_per) * SKETCH_BUCKETS + bucket, minlength=n_per * SKETCH_BUCKETS
+            ).reshape(n_per, SKETCH_BUCKETS))
+            self.hist_first.append(first)
+            self.hist_exponent.append(exponent)
+
+    def _depth_slice(self, depth_range):
+        """Base-bin rows overlapping depth_range = (lo, hi) metres (all rows for None)."""
+        if depth_range is None:
+            return slice(None)
+        lo, hi = depth_range
+        first = max(int(base_bin_index([lo])[0]) - self.first, 0)
+        last = int(base_bin_index([hi])[0]) - self.first
+        return slice(first, max(last + 1, first))
+
+    def period_table(self, features=None, depth_range=None):
+        """
+        Per-period statistics like
+        data.groupby("month_year")[features].agg(["mean", "std", "min", "median", "max", "count"]),
+        indexed by period label. With a depth_range (lo, hi) only the base
+        bins overlapping it are merged (edges to 0.1 m) and there is no median.
+        """
+        features = self.features if features is None else list(features)
+        span = self._depth_slice(depth_range)
+        n, mean, std = merge_moments(self.count[span], self.mean[span], self.m2[span], axis=0)
+        with np.errstate(invalid="ignore"):
+            mins = np.where(n > 0, self.min[span].min(axis=0, initial=np.inf), np.nan)
+            maxs = np.where(n > 0, self.max[span].max(axis=0, initial=-np.inf), np.nan)
+
+        columns = {}
+        for feature in features:
+            j = self.features.index(feature)
+            columns[(feature, "mean")] = mean[:, j]
+            columns[(feature, "std")] = std[:, j]
+            columns[(feature, "min")] = mins[:, j]
+            if depth_range is None:
+                if self.hist[j] is None:
+                    columns[(feature, "median")] = np.full(len(self.periods), np.nan)
+                else:
+                    columns[(feature, "median")] = sketch_quantile(
+                        self.hist[j], self.hist_first[j], self.hist_exponent[j], 0.5, mins[:, j], maxs[:, j]
+                    )
+            columns[(feature, "max")] = maxs[:, j]
+            columns[(feature, "count")] = n[:, j]
+        return pd.DataFrame(columns, index=pd.Index(self.labels, name="Period"))
+
+    def samples(self, depth_range=None):
+        """Rows per period (measured or not), as a Series indexed by period label."""
+        return pd.Series(self.rows[self._depth_slice(depth_range)].sum(axis=0),
+                         index=pd.Index(self.labels, name="Period"))
+
+    def heatmap(self, feature, bin_width):
+        """
+        Mean of feature per depth bin (rows, labelled like DepthBinStats.table)
+        and period (columns, labelled), NaN where there are no measurements.
+        """
+        j = self.features.index(feature)
+        m = bins_per_width(bin_width)
+        n_bins = -(-len(self.rows) // m)
+        short = n_bins * m - len(self.rows)
+
+        def blocks(arr):
+            arr = np.pad(arr[:, :, j], ((0, short), (0, 0)))
+            return arr.reshape(n_bins, m, -1)
+
+        _, mean, _ = merge_moments(blocks(self.count), blocks(self.mean), blocks(self.m2), axis=1)
+        return pd.DataFrame(
+            mean,
+            index=pd.Index(bin_labels(self.first, n_bins, bin_width), name="depth_bin"),
+            columns=pd.Index(self.labels, name="Period"),
+        )
+
+    def profile(self, feature, period):
+        """Mean of feature per 0.1 m depth bin in one period: DataFrame of depth (bin centre) and feature."""
+        j = self.features.index(feature)
+        k = self.periods.index(period)
+        filled = np.flatnonzero(self.count[:, k, j])
+        return pd.DataFrame({
+            "depth": (self.first + filled + 0.5) * BASE_BIN,
+            feature: self.mean[filled, k, j],
+        })
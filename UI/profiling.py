@@ -0,0 +1,270 @@
+"""
+Optional timing and memory probes for the dashboard's pipeline stages.
+
+"Predict is slow" says nothing about which part is. Code that does real work
+(ingest, projection, statistics, filtering, figures, GP training, grid,
+prediction, the advanced analyses) is wrapped in
+
+    with profiling.stage("grid") as rec:
+        ...
+        rec["points"] = len(grid)      # optional details
+
+which is a no-op unless a Profiler is active for the current thread (the
+Streamlit session's script thread, see app_cache.profiling_panel). When one
+is, every stage records its wall time, the peak Python allocation above what
+was allocated when it started (tracemalloc, includes numpy arrays but not
+torch tensors) and the process RSS after it, with the change over the stage.
+Stages can nest; a stage that hits a cache records almost nothing, which is
+the point. Long page sections that would otherwise have to be re-indented
+use the begin()/end() pair instead:
+
+    timed = profiling.begin("hypoxia analysis")
+    ...
+    profiling.end(timed)
+
+A section left open by an exception (e.g. st.stop or a rerun) is dropped
+when the session's next run starts.
+
+tracemalloc and the RSS are process-wide, so with several busy sessions the
+memory numbers of one include the others. tracemalloc slows every Python
+allocation a little, so it only runs while some session has a memory-tracing
+profiler switched on: it is started by the first activate() and stopped once
+the last one is deactivated or gone (unless something else started it, e.g.
+python -X tracemalloc).
+"""
+import datetime
+import json
+import os
+import platform
+import sys
+import threading
+import time
+import tracemalloc
+import weakref
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # windows
+    resource = None
+
+# runs of a session that are kept
+MAX_RUNS = 50
+MB = 1024 * 1024
+
+_local = threading.local()
+
+# memory-tracing profilers that are switched on in some session (sessions
+# that end drop out by themselves), and whether tracemalloc was started for them
+_tracing = weakref.WeakSet()
+_tracing_lock = threading.Lock()
+_started_tracing = False
+
+
+def rss_bytes():
+    """Resident set size of this process now (Linux), else its peak so far, else None."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        pass
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _mb(n):
+    return None if n is None else round(n / MB, 2)
+
+
+class Profiler:
+    """Stage records of one session, grouped by script run."""
+
+    def __init__(self, trace_memory=True):
+        self.trace_memory = trace_memory
+        self.runs = []
+        self.started = datetime.datetime.now().isoformat(timespec="seconds")
+        # called with the record after every outermost stage, e.g. to refresh a
+        # panel; never while a stage is open, so what it costs isn't timed
+        self.on_record = None
+        self._count = 0
+        self._stack = []
+
+    def start_run(self, page):
+        """Open a new run (one script rerun) on page."""
+        self._count += 1
+        self._stack = []
+        self.runs.append({
+            "run": self._count,
+            "page": page,
+            "started": datetime.datetime.now().isoformat(timespec="seconds"),
+            "stages": [],
+        })
+        del self.runs[:-MAX_RUNS]
+
+    @property
+    def last_run(self):
+        """Latest run with stages in it (None if there is none)."""
+        return next((run for run in reversed(self.runs) if run["stages"]), None)
+
+    def begin(self, name, **detail):
+        """Open stage name (nested in the open ones) and return its record."""
+        if not self.runs:
+            self.start_run(None)
+        rec = {"stage": name, "depth": len(self._stack), **detail}
+        # listed when it starts, so nested stages come after their parent
+        self.runs[-1]["stages"].append(rec)
+        tracing = self.trace_memory and tracemalloc.is_tracing()
+        frame = {"rec": rec, "tracing": tracing, "base": 0, "peak": 0}
+        if tracing:
+            current, peak = tracemalloc.get_traced_memory()
+            if self._stack:
+                # the parent's peak so far survives the reset below
+                self._stack[-1]["peak"] = max(self._stack[-1]["peak"], peak)
+            tracemalloc.reset_peak()
+            frame.update(base=current, peak=current)
+        self._stack.append(frame)
+        frame["rss_before"] = rss_bytes()
+        frame["start"] = time.perf_counter()
+        return rec
+
+    def end(self, rec):
+        """Close the stage begin() returned rec for (and any stage left open inside it)."""
+        now = time.perf_counter()
+        if not any(frame["rec"] is rec for frame in self._stack):
+            # opened in an earlier run, which start_run already dropped
+            return
+        while True:
+            frame = self._stack.pop()
+            if frame["rec"] is rec:
+                break
+        rec["seconds"] = now - frame["start"]
+        # tracing may have been switched off by now (see deactivate)
+        if frame["tracing"] and tracemalloc.is_tracing():
+            peak = max(frame["peak"], tracemalloc.get_traced_memory()[1])
+            rec["py_peak_mb"] = _mb(peak - frame["base"])
+            if self._stack:
+                self._stack[-1]["peak"] = max(self._stack[-1]["peak"], peak)
+        rss = rss_bytes()
+        rec["rss_mb"] = _mb(rss)
+        if rss is not None and frame["rss_before"] is not None:
+            rec["rss_delta_mb"] = _mb(rss - frame["rss_before"])
+        if self.on_record is not None and not self._stack:
+            self.on_record(rec)
+
+    @contextmanager
+    def stage(self, name, **detail):
+        rec = self.begin(name, **detail)
+        try:
+            yield rec
+        finally:
+            self.end(rec)
+
+    def table(self, run=None):
+        """Stages of run (the last one by default) as display rows, nested stages indented."""
+        run = self.last_run if run is None else run
+        if run is None:
+            return []
+        rows = []
+        for rec in run["stages"]:
+            details = ", ".join(
+                f"{k}={v:.3g}" if isinstance(v, float) else f"{k}={v}"
+                for k, v in rec.items()
+                if k not in ("stage", "depth", "seconds", "py_peak_mb", "rss_mb", "rss_delta_mb")
+                and not isinstance(v, (list, tuple, dict))
+            )
+            rows.append({
+                "Stage": "  " * rec["depth"] + rec["stage"],
+                "Time (s)": round(rec["seconds"], 3) if "seconds" in rec else None,
+                "Py peak (MB)": rec.get("py_peak_mb"),
+                "RSS (MB)": rec.get("rss_mb"),
+                "ΔRSS (MB)": rec.get("rss_delta_mb"),
+                "Details": details,
+            })
+        return rows
+
+    def to_dict(self):
+        return {
+            "session_started": self.started,
+            "exported": datetime.datetime.now().isoformat(timespec="seconds"),
+            "pid": os.getpid(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "memory_traced": self.trace_memory,
+            "runs": self.runs,
+        }
+
+    def to_json(self):
+        return json.dumps(self.to_dict(), indent=2, default=str)
+
+
+def _update_tracing(profiler=None, on=False):
+    """Add profiler to / drop it from the tracing ones, then start or stop tracemalloc to match."""
+    global _started_tracing
+    with _tracing_lock:
+        if profiler is not None:
+            if on:
+                _tracing.add(profiler)
+            else:
+                _tracing.discard(profiler)
+        if len(_tracing) and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            _started_tracing = True
+        elif not len(_tracing) and _started_tracing:
+            tracemalloc.stop()
+            _started_tracing = False
+
+
+def activate(profiler):
+    """Make profiler the one stage() records to in this thread (None switches recording off)."""
+    _local.profiler = profiler
+    _update_tracing(profiler, on=profiler is not None and profiler.trace_memory)
+
+
+def deactivate(profiler=None):
+    """
+    Switch recording off in this thread and stop tracing memory for
+    profiler (the session's own, if it had one); tracemalloc stops when no
+    session traces memory any more.
+    """
+    _local.profiler = None
+    _update_tracing(profiler, on=False)
+
+
+def current():
+    return getattr(_local, "profiler", None)
+
+
+@contextmanager
+def stage(name, **detail):
+    """
+    Time the block as stage name on the active profiler. Yields the record
+    dict for extra details; with no profiler active it's a throwaway dict.
+    """
+    profiler = current()
+    if profiler is None:
+        yield dict(detail)
+        return
+    with profiler.stage(name, **detail) as rec:
+        yield rec
+
+
+def begin(name, **detail):
+    """
+    Open stage name on the active profiler without a with block; pass the
+    returned record to end(). With no profiler active it's a throwaway dict.
+    """
+    profiler = current()
+    if profiler is None:
+        return dict(detail)
+    return profiler.begin(name, **detail)
+
+
+def end(rec):
+    """Close the stage begin() returned rec for."""
+    profiler = current()
+    if profiler is not None:
+        profiler.end(rec)
@@ -0,0 +1,249 @@
+"""
+Turn serial captures of `Sensor code/combined_sensor_code.ino` into rows in
+the dashboard's CSV schema.
+
+The sketch prints one block per pressure reading (every second):
+
+    Pressure voltage: 0.512 V
+    Pressure: 8.4 kPa
+
+    Temperature (C): 12.50
+    TDS (ppm): 123
+    pH (temp compensated): 7.12
+    Dissolved Oxygen (corrected): 8.123 mg/L
+
+The measurement lines only appear once the pressure is stable (sensor under
+water). Lines may carry the serial monitor's "HH:MM:SS.mmm -> " prefix.
+
+The capture is read in blocks of a few MB and each block is parsed with numpy
+on the raw bytes (no per-line python), so memory stays bounded by the block
+size whatever the size of the capture.
+
+    python serial_log.py capture.txt --lat 60.645 --lon 17.845 \\
+        --start "2024-06-01 09:30" -o cast.csv
+"""
+import argparse
+
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+# fresh water: 1 m of depth per 9.80665 kPa of gauge pressure
+KPA_PER_M = 9.80665
+
+BLOCK_BYTES = 8 << 20
+
+# printed label -> dashboard column (pressure becomes depth)
+FIELDS = {
+    b"Pressure": "pressure",
+    b"Temperature (C)": "temperature",
+    b"TDS (ppm)": "TDS",
+    b"pH (temp compensated)": "pH",
+    b"Dissolved Oxygen (corrected)": "dissolved_oxygen",
+}
+MEASUREMENTS = ["temperature", "TDS", "pH", "dissolved_oxygen"]
+
+# every field line is "<label>: <value>", "Pressure: " starts a record
+_LABELS = [k + b": " for k in FIELDS]
+_LABEL_WIDTH = max(len(k) for k in _LABELS)
+# optional serial monitor prefix "HH:MM:SS.mmm -> "
+_PREFIX_LEN = 16
+_VALUE_WIDTH = 16
+
+
+def _parse_block(block):
+    """
+    Fields of one block of whole lines as arrays:
+    (ms since midnight or -1, field code, value).
+
+    Done with numpy on the raw bytes: lines are found from the newlines,
+    labels compared as fixed-width byte windows and the values converted in
+    one astype, so there is no per-line python work.
+    """
+    pad = _PREFIX_LEN + _LABEL_WIDTH + _VALUE_WIDTH
+    buf = np.frombuffer(block + b"\0" * pad, dtype=np.uint8)
+    ends = np.flatnonzero(buf[:len(block)] == ord("\n"))
+    if block and not block.endswith(b"\n"):
+        ends = np.append(ends, len(block))
+    starts = np.concatenate([[0], ends[:-1] + 1]).astype(np.intp)
+    if len(ends) == 0:
+        starts = starts[:0]
+
+    # zero-copy (len, width) views; indexing one with the line starts
+    # gathers a small byte window per line
+    head = sliding_window_view(buf, _PREFIX_LEN)[starts]
+    has_time = (head[:, 12:16] == np.frombuffer(b" -> ", np.uint8)).all(axis=1) & (head[:, 2] == ord(":"))
+    content = starts + np.where(has_time, _PREFIX_LEN, 0)
+
+    # cheap first pass on 4 bytes, full label check on the candidates only
+    first4 = sliding_window_view(buf, 4)[content].view(np.uint32).ravel()
+    code = np.full(len(content), -1, dtype=np.int8)
+    labels = sliding_window_view(buf, _LABEL_WIDTH)
+    for i, label in enumerate(_LABELS):
+        cand = np.flatnonzero(first4 == np.frombuffer(label[:4], np.uint32)[0])
+        ok = (labels[content[cand], :len(label)] == np.frombuffer(label, np.uint8)).all(axis=1)
+        code[cand[ok]] = i
+    hit = code >= 0
+    code, content, has_time, head = code[hit], content[hit], has_time[hit], head[hit]
+
+    # value: bytes after the label up to the first space / CR / newline
+    label_len = np.array([len(k) for k in _LABELS])[code]
+    value = sliding_window_view(buf, _VALUE_WIDTH)[content + label_len]
+    stop = (value == ord(" ")) | (value == ord("\r")) | (value == ord("\n"))
+    end = np.where(stop.any(axis=1), stop.argmax(axis=1), _VALUE_WIDTH)
+    value[np.arange(_VALUE_WIDTH) >= end[:, None]] = 0
+    text = value.view(f"S{_VALUE_WIDTH}").ravel()
+    try:
+        number = text.astype(np.float64)
+    except ValueError:
+        # e.g. "ovf" from Serial.print on overflow
+        number = np.array([_to_float(t) for t in text])
+
+    ms = np.full(len(code), -1, dtype=np.int64)
+    if has_time.any():
+        d = head[has_time].astype(np.int64) - ord("0")
+        hh, mm, ss = d[:, 0] * 10 + d[:, 1], d[:, 3] * 10 + d[:, 4], d[:, 6] * 10 + d[:, 7]
+        milli = d[:, 9] * 100 + d[:, 10] * 10 + d[:, 11]
+        ms[has_time] = ((hh * 60 + mm) * 60 + ss) * 1000 + milli
+    return ms, code, number
+
+
+def _to_float(text):
+    try:
+        return float(text)
+    except ValueError:
+        return np.nan
+
+
+def iter_serial_log(source, lat, lon, start=None, interval=1.0, block_bytes=BLOCK_BYTES,
+                    keep_empty=False):
+    """
+    Parse a serial capture (path or binary file-like) block by block.
+
+    lat/lon are the position of the cast (the sketch has no GPS). Timestamps
+    come from the serial monitor prefix when present (date taken from start,
+    midnight roll-overs handled), otherwise start + interval seconds per
+    pressure reading. Without start no timestamp column is written.
+
+    Records without any measurement (sensor not yet stable / above water)
+    are dropped unless keep_empty. Yields DataFrames with latitude,
+    longitude, depth, the measurements and (if known) timestamp.
+    """
+    f = open(source, "rb") if isinstance(source, str) else source
+    start = pd.Timestamp(start) if start is not None else None
+    day0 = start.normalize() if start is not None else None
+
+    n_fields = len(FIELDS)
+    # the last record of a block may continue in the next one
+    pending = np.full(n_fields, np.nan)
+    pending_ms = -1
+    have_pending = False
+    n_records = 0
+    last_ms, day_offset = -1, 0
+    rest = b""
+    try:
+        while True:
+            chunk = f.read(block_bytes)
+            block = rest + chunk
+            if chunk:
+                cut = block.rfind(b"\n") + 1
+                block, rest = block[:cut], block[cut:]
+            else:
+                rest = b""
+            ms, code, value = _parse_block(block)
+
+            # record number of every field, -1 for fields of the pending record
+            rec = np.cumsum(code == 0) - 1
+            n_new = int(rec[-1]) + 1 if len(rec) else 0
+            vals = np.full((n_new + 1, n_fields), np.nan)
+            vals[0] = pending
+            # later lines win if a field repeats within a record
+            vals[rec + 1, code] = value
+            rec_ms = np.full(n_new + 1, -1, dtype=np.int64)
+            rec_ms[0] = pending_ms
+            starts = code == 0
+            rec_ms[rec[starts] + 1] = ms[starts]
+
+            # everything but the last record is complete (unless this is the end)
+            if chunk:
+                done, pending, pending_ms = vals[:-1], vals[-1], rec_ms[-1]
+                done_ms = rec_ms[:-1]
+            else:
+                done, done_ms = vals, rec_ms
+            if not have_pending:
+                done, done_ms = done[1:], done_ms[1:]
+            have_pending = have_pending or n_new > 0
+
+            if len(done):
+                index = n_records + np.arange(len(done))
+                n_records += len(done)
+                frame, (last_ms, day_offset) = _to_frame(
+                    done, done_ms, index, lat, lon, start, day0, interval, (last_ms, day_offset))
+                if not keep_empty:
+                    present = [c for c in MEASUREMENTS if c in frame.columns]
+                    frame = frame[frame[present].notna().any(axis=1)].reset_index(drop=True)
+                if len(frame):
+                    yield frame
+            if not chunk:
+                break
+    finally:
+        if f is not source:
+            f.close()
+
+
+def _to_frame(vals, rec_ms, index, lat, lon, start, day0, interval, clock):
+    """Rows for complete records; clock carries (last ms, day offset) across blocks."""
+    names = list(FIELDS.values())
+    frame = pd.DataFrame({
+        "latitude": np.full(len(vals), lat),
+        "longitude": np.full(len(vals), lon),
+        "depth": np.maximum(vals[:, 0] / KPA_PER_M, 0).astype(np.float32),
+    })
+    for j, name in enumerate(names[1:], start=1):
+        frame[name] = vals[:, j].astype(np.float32)
+
+    last_ms, day_offset = clock
+    if (rec_ms >= 0).any() and day0 is not None:
+        # serial monitor clock: add a day every time it wraps past midnight
+        ms = np.where(rec_ms >= 0, rec_ms, np.nan)
+        ms = pd.Series(ms).ffill().fillna(last_ms if last_ms >= 0 else 0).to_numpy()
+        wraps = np.diff(np.concatenate([[last_ms if last_ms >= 0 else ms[0]], ms])) < 0
+        days = day_offset + np.cumsum(wraps)
+        frame["timestamp"] = day0 + pd.to_timedelta(days, unit="D") + pd.to_timedelta(ms, unit="ms")
+        last_ms, day_offset = int(ms[-1]), int(days[-1])
+    elif start is not None:
+        frame["timestamp"] = start + pd.to_timedelta(index * interval, unit="s")
+    return frame, (last_ms, day_offset)
+
+
+def read_serial_log(source, lat, lon, start=None, interval=1.0, keep_empty=False):
+    """Whole capture as one DataFrame (see iter_serial_log)."""
+    frames = list(iter_serial_log(source, lat, lon, start, interval, keep_empty=keep_empty))
+    if not frames:
+        return pd.DataFrame(columns=["latitude", "longitude", "depth"] + MEASUREMENTS)
+    return pd.concat(frames, ignore_index=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Convert a combined_sensor_code.ino serial capture to the dashboard CSV.")
+    parser.add_argument("capture", help="serial log (text)")
+    parser.add_argument("--lat", type=float, required=True, help="latitude of the cast")
+    parser.add_argument("--lon", type=float, required=True, help="longitude of the cast")
+    parser.add_argument("--start", help="date/time of the first reading, e.g. '2024-06-01 09:30'")
+    parser.add_argument("--interval", type=float, default=1.0, help="seconds between readings (default 1)")
+    parser.add_argument("--keep-empty", action="store_true", help="keep readings without measurements")
+    parser.add_argument("-o", "--output", required=True, help="CSV to write (.gz/.zst compress it)")
+    args = parser.parse_args(argv)
+
+    n = 0
+    header = True
+    for frame in iter_serial_log(args.capture, args.lat, args.lon, args.start, args.interval,
+                                 keep_empty=args.keep_empty):
+        frame.to_csv(args.output, mode="w" if header else "a", header=header, index=False)
+        header = False
+        n += len(frame)
+    print(f"wrote {n} rows to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
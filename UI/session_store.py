@@ -0,0 +1,92 @@
+"""
+Compact per-dataset arrays for the Predict page.
+
+A training session used to keep the scaled X/Y as float64 arrays rebuilt on
+every rerun, float32 torch copies of them, a float64 prediction frame and,
+for the 3D plot, full copies of the data and of the predictions. Here:
+
+- TrainingArrays holds the scaled inputs/outputs once per dataset, as
+  float32; the torch tensors are views of the same memory (torch.from_numpy).
+  app_cache.training_arrays_for keeps one per dataset digest.
+- prediction_frame builds the prediction table straight from the arrays,
+  as float32.
+- plot_frame gathers only the columns the 3D plot draws, with a categorical
+  source column, instead of copying the data and predictions first.
+"""
+import numpy as np
+import pandas as pd
+import sklearn.preprocessing as skp
+import torch
+
+
+class TrainingArrays:
+    """Standardised float32 model inputs and outputs of one dataset, with their scalers."""
+
+    def __init__(self, data, input_cols, output_cols):
+        self.input_cols = list(input_cols)
+        self.output_cols = list(output_cols)
+        self.scaler_x = skp.StandardScaler()
+        self.scaler_y = skp.StandardScaler()
+        # scaled in float64, then kept as float32 (what the model trains on)
+        self.X = self.scaler_x.fit_transform(data[self.input_cols].to_numpy(np.float64)).astype(np.float32)
+        self.Y = self.scaler_y.fit_transform(data[self.output_cols].to_numpy(np.float64)).astype(np.float32)
+
+    def __len__(self):
+        return len(self.X)
+
+    @property
+    def nbytes(self):
+        return self.X.nbytes + self.Y.nbytes
+
+    def tensors(self):
+        """(X, Y) as torch tensors sharing memory with the arrays."""
+        return torch.from_numpy(self.X), torch.from_numpy(self.Y)
+
+
+def scale_points(scaler_x, points):
+    """Prediction points in the model's input space, as a float32 tensor."""
+    scaled = scaler_x.transform(np.asarray(points, dtype=np.float64))
+    return torch.from_numpy(scaled.astype(np.float32))
+
+
+def prediction_frame(grid, output_cols, mean, std, month=None, year=None):
+    """
+    Prediction table: x, y, depth of the grid points (month and year when
+    predicting one period), then <col>_pred / <col>_std per output.
+    x/y are local metres (see ingest.project_xy), float32 keeps them to ~1 mm.
+    mean and std are (n, len(output_cols)) in original units.
+    """
+    columns = {
+        "x": grid[:, 0].astype(np.float32),
+        "y": grid[:, 1].astype(np.float32),
+        "depth": grid[:, 2].astype(np.float32),
+    }
+    if month is not None:
+        columns["month"] = np.full(len(grid), month, dtype=np.int16)
+        columns["year"] = np.full(len(grid), year, dtype=np.int16)
+    for j, col in enumerate(output_cols):
+        columns[f"{col}_pred"] = mean[:, j].astype(np.float32)
+        columns[f"{col}_std"] = std[:, j].astype(np.float32)
+    return pd.DataFrame(columns)
+
+
+def plot_frame(data, pred_df, measurement):
+    """
+    Training points and predictions of one measurement for the 3D plot:
+    x, y, depth, <measurement>_pred, source ('Training Data' / 'Prediction')
+    and depth_inverted.
+    """
+    value = f"{measurement}_pred"
+    n_train, n_pred = len(data), len(pred_df)
+    depth = np.concatenate([data["depth"].to_numpy(np.float32), pred_df["depth"].to_numpy(np.float32)])
+    source = pd.Categorical.from_codes(
+        np.repeat(np.array([0, 1], dtype=np.int8), [n_train, n_pred]), ["Training Data", "Prediction"]
+    )
+    return pd.DataFrame({
+        "x": np.concatenate([data["x"].to_numpy(), pred_df["x"].to_numpy()]),
+        "y": np.concatenate([data["y"].to_numpy(), pred_df["y"].to_numpy()]),
+        "depth": depth,
+        value: np.concatenate([data[measurement].to_numpy(np.float32), pred_df[value].to_numpy(np.float32)]),
+        "source": source,
+        "depth_inverted": -depth,
+    })
@@ -0,0 +1,171 @@
+"""
+Spatial lookups over one survey: a 2D KD-tree over x/y, a 3D KD-tree over
+x/y/depth and the Delaunay triangulation of the x/y points (the lake outline).
+
+The Predict page used to rebuild the tree and triangulation on every training
+click and again for every "Generate for period". A SpatialIndex is built once
+per dataset (see app_cache.spatial_index_for) and the prediction grid, depth
+ceilings and nearest-point / region queries all go through it.
+
+Rows appended later (append mode on the Upload page) go into a small delta
+buffer with its own trees; queries look at both and the buffer is folded into
+the main trees once it gets large, so an append costs time in the size of the
+new rows rather than the survey.
+"""
+from functools import cached_property
+
+import numpy as np
+from scipy.spatial import Delaunay, KDTree
+
+# neighbours used for the depth ceiling under a grid point
+K_NEIGHBORS = 5
+# grid points stop at this fraction of the local max depth (stay conservative)
+DEPTH_FRACTION = 0.95
+# fold the delta buffer into the main trees once it is this big
+# (relative to the main trees, but never for fewer than MIN_REBUILD rows)
+REBUILD_FRACTION = 0.1
+MIN_REBUILD = 1000
+
+
+class SpatialIndex:
+    """2D/3D lookups over the x, y (and depth) of a survey's measurements."""
+
+    def __init__(self, x, y, depth):
+        self.xy = np.column_stack([x, y]).astype(np.float64)
+        self.depth = np.asarray(depth, dtype=np.float64)
+        self.tree2d = KDTree(self.xy)
+        self.delta_xy = np.empty((0, 2))
+        self.delta_depth = np.empty(0)
+        self.delta_tree2d = None
+
+    def __len__(self):
+        return len(self.xy) + len(self.delta_xy)
+
+    # the triangulation and the 3D trees are only built if something asks
+    @cached_property
+    def triangulation(self):
+        return Delaunay(np.concatenate([self.xy, self.delta_xy]))
+
+    @cached_property
+    def tree3d(self):
+        return KDTree(np.column_stack([self.xy, self.depth]))
+
+    @cached_property
+    def delta_tree3d(self):
+        return KDTree(np.column_stack([self.delta_xy, self.delta_depth]))
+
+    def append(self, x, y, depth):
+        """Add new measurements (they get the indices after the current ones)."""
+        xy = np.column_stack([x, y]).astype(np.float64)
+        if len(xy) == 0:
+            return
+        # casts inside the current outline don't change it
+        if "triangulation" in self.__dict__ and not self.inside(xy).all():
+            del self.triangulation
+        self.delta_xy = np.concatenate([self.delta_xy, xy])
+        self.delta_depth = np.concatenate([self.delta_depth, np.asarray(depth, dtype=np.float64)])
+        self.__dict__.pop("delta_tree3d", None)
+
+        if len(self.delta_xy) > max(MIN_REBUILD, REBUILD_FRACTION * len(self.xy)):
+            self.xy = np.concatenate([self.xy, self.delta_xy])
+            self.depth = np.concatenate([self.depth, self.delta_depth])
+            self.tree2d = KDTree(self.xy)
+            self.__dict__.pop("tree3d", None)
+            self.delta_xy = np.empty((0, 2))
+            self.delta_depth = np.empty(0)
+            self.delta_tree2d = None
+        else:
+            self.delta_tree2d = KDTree(self.delta_xy)
+
+    @property
+    def bounds(self):
+        """(x_min, x_max, y_min, y_max) of the measurements."""
+        xy = np.concatenate([self.xy, self.delta_xy])
+        (x_min, y_min), (x_max, y_max) = xy.min(axis=0), xy.max(axis=0)
+        return x_min, x_max, y_min, y_max
+
+    def inside(self, xy):
+        """Mask of the xy points that fall inside the triangulated lake outline."""
+        return self.triangulation.find_simplex(xy) >= 0
+
+    def _query(self, points, k):
+        """
+        k nearest measurements to each point over the main trees and the delta
+        buffer, (distances, indices) both shaped (n, k).
+        """
+        points = np.asarray(points, dtype=np.float64)
+        three_d = points.shape[-1] == 3
+        k_main = min(k, len(self.xy))
+        # a list for k keeps the result 2D even when k is 1
+        dist, idx = (self.tree3d if three_d else self.tree2d).query(points, k=list(range(1, k_main + 1)))
+        if len(self.delta_xy) == 0:
+            return dist, idx
+
+        k_delta = min(k, len(self.delta_xy))
+        delta_tree = self.delta_tree3d if three_d else self.delta_tree2d
+        d_dist, d_idx = delta_tree.query(points, k=list(range(1, k_delta + 1)))
+        dist = np.concatenate([dist, d_dist], axis=1)
+        idx = np.concatenate([idx, d_idx + len(self.xy)], axis=1)
+        # stable, so ties keep preferring the main trees
+        best = np.argsort(dist, axis=1, kind="stable")[:, :k]
+        return np.take_along_axis(dist, best, axis=1), np.take_along_axis(idx, best, axis=1)
+
+    def nearest(self, points, k=1):
+        """
+        k nearest measurements to each point, (distances, indices).
+        2-column points query the x/y trees, 3-column ones the x/y/depth trees.
+        """
+        dist, idx = self._query(points, k)
+        if k == 1:
+            return dist[:, 0], idx[:, 0]
+        return dist, idx
+
+    def within(self, point, radius):
+        """Indices of the measurements within radius (m) of one x/y or x/y/depth point."""
+        point = np.asarray(point, dtype=np.float64)
+        three_d = point.shape[-1] == 3
+        idx = list((self.tree3d if three_d else self.tree2d).query_ball_point(point, radius))
+        if len(self.delta_xy):
+            delta_tree = self.delta_tree3d if three_d else self.delta_tree2d
+            idx += [i + len(self.xy) for i in delta_tree.query_ball_point(point, radius)]
+        return np.asarray(idx, dtype=np.intp)
+
+    def depths_at(self, idx):
+        """Depth of the measurements at idx (indices as returned by nearest)."""
+        idx = np.asarray(idx)
+        n_main = len(self.xy)
+        if len(self.delta_depth) == 0:
+            return self.depth[idx]
+        return np.where(
+            idx < n_main,
+            self.depth[np.minimum(idx, n_main - 1)],
+            self.delta_depth[np.clip(idx - n_main, 0, len(self.delta_depth) - 1)],
+        )
+
+    def depth_ceiling(self, xy, k=K_NEIGHBORS):
+        """Deepest measurement among the k nearest (in x/y) to each point."""
+        _, idx = self._query(xy, min(k, len(self)))
+        return self.depths_at(idx).max(axis=1)
+
+    def grid(self, n_x=60, n_y=60):
+        """
+        Regular n_x by n_y grid over the survey's bounding box, keeping only the
+        nodes inside the lake. Returns (xy_inside, depth_ceiling).
+        """
+        x_min, x_max, y_min, y_max = self.bounds
+        x_grid = np.linspace(x_min, x_max, n_x)
+        y_grid = np.linspace(y_min, y_max, n_y)
+        X_mesh_2d, Y_mesh_2d = np.meshgrid(x_grid, y_grid, indexing="ij")
+        xy_points = np.column_stack([X_mesh_2d.ravel(), Y_mesh_2d.ravel()])
+        xy_inside = xy_points[self.inside(xy_points)]
+        return xy_inside, self.depth_ceiling(xy_inside)
+
+    def grid_points(self, n_x=60, n_y=60, n_depth=25, depth_fraction=DEPTH_FRACTION):
+        """
+        3D prediction grid: n_depth depths from the surface down to
+        depth_fraction of the local depth ceiling under every grid node.
+        Returns an (n, 3) array of x, y, depth, depths varying fastest.
+        """
+        xy_inside, ceiling = self.grid(n_x, n_y)
+        depths = np.linspace(0, ceiling * depth_fraction, n_depth, axis=1)
+        return np.column_stack([np.repeat(xy_inside, n_depth, axis=0), depths.ravel()])
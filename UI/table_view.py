@@ -0,0 +1,102 @@
+"""
+Paging, sorting and filtering for the Raw Data explorer, and the table styles.
+
+st.dataframe(data.style...) renders HTML for every cell of the frame, which
+takes minutes on a large survey (and fails past pandas'
+styler.render.max_elements). The explorer sorts and filters row positions of
+the cached dataset instead and styles only the page that is shown. The
+statistics tables are styled only while they are small.
+"""
+import numpy as np
+
+PAGE_SIZES = (50, 100, 250, 500)
+# bigger tables are shown without a Styler
+MAX_STYLED_CELLS = 50_000
+
+HEADER_STYLE = [('background-color', '#4dabf7'),
+                ('color', 'white'),
+                ('font-weight', 'bold'),
+                ('text-align', 'center')]
+
+
+def sort_order(data, column, ascending=True):
+    """Row positions of data sorted by column (stable, missing values last)."""
+    values = data[column].to_numpy(dtype=np.float64)
+    return np.argsort(values if ascending else -values, kind="stable")
+
+
+def range_mask(data, column, lo, hi):
+    """Rows of data with lo <= column <= hi."""
+    values = data[column].to_numpy()
+    return (values >= lo) & (values <= hi)
+
+
+def view_rows(n, order=None, mask=None):
+    """Positions of the rows to show: order (or file order) restricted to mask."""
+    rows = np.arange(n) if order is None else order
+    if mask is not None:
+        rows = rows[mask[rows]]
+    return rows
+
+
+def page_count(n_rows, page_size):
+    return max(1, -(-n_rows // page_size))
+
+
+def page(data, rows, columns, number, page_size):
+    """data[columns] at rows[...] of page number (1-based), without copying the rest."""
+    start = (number - 1) * page_size
+    return data.iloc[rows[start:start + page_size], data.columns.get_indexer(columns)]
+
+
+def style_page(frame):
+    """Styled raw data page (blue header, zebra stripes)."""
+    return (
+        frame.style
+        .format(precision=2, na_rep="-")
+        .set_properties(**{
+            'text-align': 'center',
+            'font-size': '10pt',
+            'border': '1px solid #e0e0e0'
+        })
+        .set_table_styles([
+            {'selector': 'th',
+             'props': HEADER_STYLE + [('padding', '12px'), ('font-size', '11pt')]},
+            {'selector': 'td',
+             'props': [('padding', '10px')]},
+            {'selector': 'tr:nth-child(even)',
+             'props': [('background-color', '#f8f9fa')]},
+            {'selector': 'tr:hover',
+             'props': [('background-color', '#e3f2fd')]},
+        ])
+    )
+
+
+def style_stats(frame):
+    """
+    Statistics table with Mean / Std Dev shaded in blue (only blue tones so
+    it's readable), or frame itself when it is too big to style.
+    """
+    if frame.size > MAX_STYLED_CELLS:
+        return frame
+    return (
+        frame.style
+        .background_gradient(cmap="Blues", subset=["Mean"], low=0.1, high=0.8)
+        .background_gradient(cmap="Blues", subset=["Std Dev"], low=0.1, high=0.6)
+        .format(precision=2, na_rep="-")
+        .set_properties(**{
+            'text-align': 'center',
+            'font-size': '10pt',
+            'border': '1px solid #ddd',
+            'color': '#000000'
+        })
+        .set_table_styles([
+            {'selector': 'th',
+             'props': HEADER_STYLE + [('padding', '10px'), ('font-size', '11pt')]},
+            {'selector': 'td',
+             'props': [('padding', '8px 12px'),
+                       ('color', '#000000')]},
+            {'selector': 'tr:hover',
+             'props': [('background-color', '#e3f2fd')]},
+        ])
+    )
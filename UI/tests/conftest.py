@@ -0,0 +1,5 @@
+import os
+import sys
+
+# the dashboard modules import each other as top-level modules (streamlit runs from UI/)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,40 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+pd = pytest.importorskip("pandas")
+
+import catalog  # noqa: E402
+
+
+def _survey(n, seed, num_sats=True):
+    rng = np.random.default_rng(seed)
+    data = pd.DataFrame({
+        "latitude": 60.645 + rng.uniform(0, 1e-3, n),
+        "longitude": 17.845 + rng.uniform(0, 1e-3, n),
+        "depth": rng.uniform(0, 10, n).astype("float32"),
+        "temperature": rng.uniform(4, 20, n).astype("float32"),
+    })
+    if num_sats:
+        data["num_sats"] = rng.integers(4, 12, n).astype("uint8")
+    return data
+
+
+def test_load_slice_mixed_num_sats(tmp_path):
+    path = str(tmp_path / "catalog.db")
+    catalog.add_survey(_survey(20, 0), "Lake", "with-sats", path=path)
+    catalog.add_survey(_survey(10, 1, num_sats=False), "Lake", "without-sats", path=path)
+
+    data, _ = catalog.load_slice("Lake", path=path)
+
+    assert len(data) == 30
+    assert data["num_sats"].isna().sum() == 10
+    assert data["num_sats"].dtype == np.float32
+
+
+def test_load_slice_keeps_uint8_num_sats(tmp_path):
+    path = str(tmp_path / "catalog.db")
+    catalog.add_survey(_survey(20, 0), "Lake", "with-sats", path=path)
+
+    data, _ = catalog.load_slice("Lake", path=path)
+
+    assert data["num_sats"].dtype == np.uint8
@@ -0,0 +1,49 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+pd = pytest.importorskip("pandas")
+
+import depth_stats  # noqa: E402
+import period_stats  # noqa: E402
+
+
+def _survey():
+    return pd.DataFrame({
+        "depth": np.array([0.3, 1.25, np.nan, 2.0, 3.1], dtype=np.float32),
+        "temperature": np.array([18.0, 16.5, 15.0, 12.0, 8.5], dtype=np.float32),
+        "month_year": pd.Categorical(["2024-06", "2024-06", "2024-06", "2024-07", "2024-07"]),
+    })
+
+
+def test_nan_depth_is_left_out_of_the_bins():
+    data = _survey()
+    stats = depth_stats.DepthBinStats.from_frame(data, ["temperature"])
+    expected = depth_stats.DepthBinStats.from_frame(data.dropna(subset=["depth"]), ["temperature"])
+
+    pd.testing.assert_frame_equal(stats.table(1.0), expected.table(1.0))
+    assert stats.overall()["count"].iloc[0] == 4
+
+
+def test_nan_depth_appended():
+    data = _survey()
+    stats = depth_stats.DepthBinStats.from_frame(data.iloc[:2], ["temperature"])
+    stats.update(data.iloc[2:])
+
+    assert stats.table(1.0)[("temperature", "count")].sum() == 4
+
+
+def test_cut_depth_nan():
+    bins = depth_stats.cut_depth(_survey()["depth"], 1.0)
+
+    assert pd.isna(bins[2])
+    assert bins.notna().sum() == 4
+    assert list(bins.categories) == list(
+        depth_stats.DepthBinStats.from_frame(_survey(), ["temperature"]).table(1.0).index
+    )
+
+
+def test_period_stats_nan_depth():
+    stats = period_stats.DepthPeriodStats(_survey(), ["temperature"])
+
+    assert list(stats.period_table()[("temperature", "count")]) == [2, 2]
+    assert list(stats.samples()) == [2, 2]
@@ -0,0 +1,43 @@
+import pytest
+
+torch = pytest.importorskip("torch")
+pytest.importorskip("gpytorch")
+
+import gp_model  # noqa: E402
+
+
+def _ski(bounds, seed=0):
+    gen = torch.Generator().manual_seed(seed)
+    low = torch.tensor([lo for lo, _ in bounds])
+    high = torch.tensor([hi for _, hi in bounds])
+    X = low + (high - low) * torch.rand(200, 3, generator=gen)
+    Y = torch.stack([torch.sin(X.sum(dim=1)), torch.cos(X[:, 2])], dim=1)
+    likelihood = gp_model.ski_likelihood(2)
+    model = gp_model.MultitaskSKIGP(X, Y, likelihood, num_tasks=2, grid_size=8, grid_bounds=bounds)
+    return X, Y, model, likelihood
+
+
+def test_warm_start_keeps_the_grid_of_shifted_bounds():
+    _, _, old, old_likelihood = _ski([(-1.0, 1.0)] * 3)
+    old.covar_module.base_kernel.base_kernel.lengthscale = torch.full((2, 1, 3), 0.7)
+    X, Y, new, likelihood = _ski([(4.0, 6.0)] * 3, seed=1)
+    grid = [g.clone() for g in new.covar_module.base_kernel.grid]
+
+    gp_model.warm_start(new, likelihood, (old.state_dict(), old_likelihood.state_dict()))
+
+    for own, kept in zip(new.covar_module.base_kernel.grid, grid):
+        assert torch.equal(own, kept)
+    assert torch.allclose(new.covar_module.base_kernel.base_kernel.lengthscale, torch.tensor(0.7))
+
+
+def test_train_warm_started_on_shifted_bounds():
+    _, _, old, old_likelihood = _ski([(-1.0, 1.0)] * 3)
+    X, Y, _, _ = _ski([(4.0, 6.0)] * 3, seed=1)
+
+    model, _, history = gp_model.train(
+        X[:150], Y[:150], X[150:], Y[150:], torch.ones(2).numpy(), iters=2, grid_size=8,
+        init_state=(old.state_dict(), old_likelihood.state_dict()),
+    )
+
+    assert history["warm_started"] > 0
+    assert model.grid_bounds == gp_model.ski_bounds(X[:150], X[150:])
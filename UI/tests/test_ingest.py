@@ -0,0 +1,29 @@
+import pytest
+
+pytest.importorskip("numpy")
+pytest.importorskip("pandas")
+
+import ingest  # noqa: E402
+
+HEADER = b"latitude,longitude,depth,temperature\n"
+
+
+def _rows(start, n):
+    return b"".join(b"60.645,17.845,%d.5,12.0\n" % i for i in range(start, start + n))
+
+
+def test_csv_tail_reads_only_the_new_rows():
+    old = HEADER + _rows(0, 5000)
+    grown = memoryview(old + _rows(5000, 50))
+
+    tail = ingest.csv_tail(grown, len(old), ingest.end_check(old, len(old)))
+
+    assert tail == HEADER + _rows(5000, 50)
+    assert ingest.csv_tail(memoryview(old), len(old), ingest.end_check(old, len(old))) == b""
+
+
+def test_csv_tail_rejects_another_file():
+    old = HEADER + _rows(0, 5000)
+    other = HEADER + _rows(1, 5000) + _rows(5000, 50)
+
+    assert ingest.csv_tail(other, len(old), ingest.end_check(old, len(old))) is None
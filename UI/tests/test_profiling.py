@@ -0,0 +1,61 @@
+import tracemalloc
+
+import profiling
+
+
+def test_tracemalloc_stops_with_the_last_profiler():
+    first, second = profiling.Profiler(), profiling.Profiler()
+    profiling.activate(first)
+    profiling.activate(second)
+    assert tracemalloc.is_tracing()
+
+    profiling.deactivate(first)
+    assert tracemalloc.is_tracing()
+    profiling.deactivate(second)
+    assert not tracemalloc.is_tracing()
+
+
+def test_tracing_started_elsewhere_is_left_on():
+    tracemalloc.start()
+    try:
+        profiler = profiling.Profiler()
+        profiling.activate(profiler)
+        profiling.deactivate(profiler)
+        assert tracemalloc.is_tracing()
+    finally:
+        tracemalloc.stop()
+
+
+def test_begin_end_nests_like_stage():
+    profiler = profiling.Profiler()
+    seen = []
+    profiler.on_record = lambda rec: seen.append(rec["stage"])
+    profiling.activate(profiler)
+    try:
+        outer = profiling.begin("outer")
+        with profiling.stage("inner"):
+            data = bytearray(4 * profiling.MB)
+        assert seen == []
+        profiling.end(outer)
+    finally:
+        profiling.deactivate(profiler)
+    assert seen == ["outer"]
+    stages = profiler.last_run["stages"]
+    assert [(rec["stage"], rec["depth"]) for rec in stages] == [("outer", 0), ("inner", 1)]
+    assert stages[0]["py_peak_mb"] >= 4 and len(data) == 4 * profiling.MB
+
+
+def test_section_left_open_is_dropped_by_the_next_run():
+    profiler = profiling.Profiler()
+    profiling.activate(profiler)
+    try:
+        profiler.start_run("Predict")
+        left_open = profiling.begin("hypoxia analysis")
+        profiler.start_run("Predict")
+        with profiling.stage("grid"):
+            pass
+        profiling.end(left_open)
+    finally:
+        profiling.deactivate(profiler)
+    assert profiler.last_run["stages"][0]["depth"] == 0
+    assert "seconds" not in left_open